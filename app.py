@@ -4,5 +4,5 @@ from app import create_app
 app = create_app()
 
 if __name__ == '__main__':
-    # Run the Flask app
+    # Run the Flask development server; use `python -m app.serve` in production
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -1,11 +1,24 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_cors import CORS
-from flasgger import Swagger  # Import Swagger
 
-db = SQLAlchemy()
-migrate = Migrate()
+from .replicas import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Settings applied by LEAN_STARTUP unless configured explicitly: no
+# migration wiring, and API docs that cost nothing until visited.
+LEAN_STARTUP_DEFAULTS = {
+    'MIGRATIONS_ENABLED': False,
+    'APIDOCS': 'lazy',
+}
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, PUT, PATCH, DELETE, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type, X-Requested-With, If-None-Match, If-Match, X-Profile, Idempotency-Key",
+    "Access-Control-Expose-Headers": "X-Next-Cursor, Link, ETag, Server-Timing, X-Profile-Id, Content-Encoding, Retry-After, Idempotent-Replayed",
+}
 
 def create_app(config=None):
     app = Flask(__name__)
@@ -13,6 +26,58 @@ def create_app(config=None):
     # Default configuration
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///app.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['DATABASE_PROFILE'] = 'default'  # or 'production', see app/database.py
+    app.config['SQLITE_PRAGMAS'] = None
+    app.config['SQLALCHEMY_REPLICAS'] = []  # read replica URIs; GET requests read from them
+    app.config['REPLICA_CHECK_INTERVAL'] = 5  # seconds between health checks of a replica
+    app.config['REPLICA_READ_YOUR_WRITES'] = None  # seconds a writing client keeps reading the primary
+    app.config['TODOS_DEFAULT_PAGE_SIZE'] = 100
+    app.config['TODOS_MAX_PAGE_SIZE'] = 1000
+    app.config['TODOS_EXPORT_BATCH_SIZE'] = 1000
+    app.config['TODOS_MAX_BATCH_SIZE'] = 1000
+    app.config['TODOS_REQUIRE_IF_MATCH'] = False  # reject PUT/PATCH/DELETE of an item without If-Match (428)
+    app.config['JSON_PROVIDER'] = 'auto'  # 'orjson', 'stdlib' or a JSONProvider class
+    app.config['CACHE_ENABLED'] = True
+    app.config['CACHE_BACKEND'] = None  # a CacheBackend; defaults to an in-process LRUCache
+    app.config['CACHE_MAX_ENTRIES'] = 1024
+    app.config['CACHE_TTL'] = 30
+    app.config['EVENTS_BROKER'] = None  # a Broker; defaults to an in-process broker
+    app.config['EVENTS_QUEUE_SIZE'] = 100
+    app.config['EVENTS_HEARTBEAT'] = 15
+    app.config['EVENTS_MAX_STREAMS'] = None  # open event streams per process; more are refused with 503
+    app.config['WRITE_GROUP_COMMIT'] = False  # commit writes in groups from one writer thread
+    app.config['WRITE_BATCH_SIZE'] = 64  # most writes per group commit
+    app.config['WRITE_BATCH_DELAY'] = 0.002  # seconds the writer waits to fill a group
+    app.config['WRITE_TIMEOUT'] = 30  # seconds a request waits for its write to commit
+    app.config['IDEMPOTENCY_STORE'] = 'memory'  # or 'sqlite' (shared by workers), an IdempotencyStore, or None
+    app.config['IDEMPOTENCY_TTL'] = 86400  # seconds a response is replayed for its Idempotency-Key
+    app.config['IDEMPOTENCY_MAX_ENTRIES'] = 10000  # keys kept by the in-memory store
+    app.config['IDEMPOTENCY_LOCK_TIMEOUT'] = 60  # seconds after which an unfinished request's key is retaken
+    app.config['RATELIMIT_ENABLED'] = False
+    app.config['RATELIMIT_DEFAULT'] = None  # (tokens per second, burst) per route and client
+    app.config['RATELIMIT_ROUTES'] = {}  # endpoint name -> (tokens per second, burst), or None for no limit
+    app.config['RATELIMIT_KEY_FUNC'] = None  # request -> client key; defaults to the remote address
+    app.config['RATELIMIT_BACKEND'] = None  # a RateLimitBackend; defaults to in-process buckets
+    app.config['RATELIMIT_CLIENT_CONCURRENCY'] = None  # most in-flight requests per client
+    app.config['RATELIMIT_MAX_IN_FLIGHT'] = None  # requests in flight beyond which more are shed with 503
+    app.config['RATELIMIT_SHED_RETRY_AFTER'] = 1  # seconds, sent in Retry-After when shedding
+    app.config['RATELIMIT_EXEMPT'] = ('todo_events', 'metrics', 'static')
+    app.config['COMPRESSION_ENABLED'] = True
+    app.config['COMPRESSION_MIN_SIZE'] = 1024  # bytes; smaller bodies are sent as they are
+    app.config['COMPRESSION_LEVEL'] = 6
+    app.config['COMPRESSION_MIMETYPES'] = ('application/json', 'application/x-ndjson')
+    app.config['COMPRESSION_CACHE_ENTRIES'] = 256  # compressed bodies kept by ETag; 0 disables
+    app.config['INSTRUMENTATION_ENABLED'] = True
+    app.config['SLOW_QUERY_THRESHOLD'] = 0.1  # seconds; None disables slow query logging
+    app.config['PROFILING_ENABLED'] = False
+    app.config['PROFILING_DIR'] = None  # defaults to <instance path>/profiles
+    app.config['PROFILING_SAMPLE_RATE'] = 0.0  # fraction of all requests profiled without opting in
+    app.config['PROFILING_INTERVAL'] = 0.005  # seconds between stack samples
+    app.config['PROFILING_SECRET'] = None  # if set, X-Profile / ?profile= must equal it
+    app.config['LEAN_STARTUP'] = False  # fast cold starts for serving processes, see LEAN_STARTUP_DEFAULTS
+    app.config['MIGRATIONS_ENABLED'] = True  # wire Flask-Migrate (`flask db`)
+    app.config['APIDOCS'] = 'flasgger'  # or 'lazy' (spec built on first visit), or None
+    app.config['APIDOCS_SPEC_FILE'] = None  # prebuilt spec (`flask apispec`) served by 'lazy', relative to the instance path
     app.config['SWAGGER'] = {
         'title': 'TODO API Server',
         'uiversion': 3
@@ -20,11 +85,39 @@ def create_app(config=None):
 
     if config:
         app.config.update(config)
+    if app.config['LEAN_STARTUP']:
+        for key, value in LEAN_STARTUP_DEFAULTS.items():
+            if key not in (config or {}):
+                app.config[key] = value
 
-    # Initialize SQLAlchemy, Migrate, and Swagger
+    from .database import configure_database_profile, init_database
+    from .json_provider import init_json
+    from .replicas import init_replicas
+    configure_database_profile(app)
+    init_json(app)
+
+    # Initialize SQLAlchemy, Migrate, and the API docs
     db.init_app(app)
-    migrate.init_app(app, db)
-    Swagger(app)  # Initialize Swagger
+    init_database(app, db)
+    init_replicas(app)
+    if app.config['MIGRATIONS_ENABLED']:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    from .apidocs import init_apidocs
+    init_apidocs(app)
+
+    from .cache import init_cache
+    from .compression import init_compression
+    from .events import init_events
+    from .idempotency import init_idempotency
+    from .instrumentation import init_instrumentation
+    from .ratelimit import init_ratelimit
+    init_cache(app)
+    init_events(app)
+    init_idempotency(app)
+    init_instrumentation(app, db)
+    init_ratelimit(app)
+    init_compression(app)
 
     # Enable CORS
     CORS(app, resources={r'/*': {'origins': '*'}})
@@ -33,11 +126,14 @@ def create_app(config=None):
     from .routes import setup_routes
     setup_routes(app)
 
+    from .profiling import init_profiling
+    from .writer import init_writer
+    init_profiling(app)
+    init_writer(app)
+
     @app.after_request
     def handle_options(response):
-        response.headers["Access-Control-Allow-Origin"] = "*"
-        response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
-        response.headers["Access-Control-Allow-Headers"] = "Content-Type, X-Requested-With"
+        response.headers.update(CORS_HEADERS)
         return response
 
     return app
@@ -0,0 +1,91 @@
+import importlib.util
+import json
+import os
+
+import click
+from flask import Blueprint, current_app, jsonify, render_template, send_file
+
+SPEC_ROUTE = '/apispec_1.json'
+DOCS_ROUTE = '/apidocs/'
+
+
+def build_spec(app):
+    """The OpenAPI spec of `app`, built by flasgger from the route docstrings."""
+    from flasgger import Swagger
+    swagger = Swagger(config=dict(app.config['SWAGGER']), merge=True)
+    swagger.app = app
+    with app.test_request_context():
+        return swagger.get_apispecs()
+
+
+def swagger_ui_static_folder():
+    """Swagger UI assets bundled with flasgger, located without importing it."""
+    spec = importlib.util.find_spec('flasgger')
+    return os.path.join(spec.submodule_search_locations[0], 'ui3', 'static')
+
+
+class LazyApiDocs:
+    """
+    Swagger UI and spec routes that cost nothing until they are visited.
+
+    The spec is read from `spec_file` when it exists (see `flask apispec`),
+    else built on the first request for it and kept in memory; flasgger and
+    the docstring YAML are only loaded then.
+    """
+
+    def __init__(self, app, spec_file=None):
+        self.app = app
+        self.spec_file = spec_file
+        self.spec = None
+
+    def serve_spec(self):
+        if self.spec_file and os.path.exists(self.spec_file):
+            return send_file(self.spec_file, mimetype='application/json')
+        if self.spec is None:
+            self.spec = build_spec(current_app._get_current_object())
+        return jsonify(self.spec)
+
+
+def init_apidocs(app):
+    """
+    Serve the API documentation as configured by `APIDOCS`: 'flasgger'
+    registers flasgger as usual, 'lazy' the routes of `LazyApiDocs`, and
+    None nothing. `flask apispec PATH` writes the spec to a file in any mode.
+    """
+    @app.cli.command('apispec')
+    @click.argument('path', required=False)
+    def write_spec(path):
+        """Write the OpenAPI spec to PATH (default: APIDOCS_SPEC_FILE)."""
+        path = path or spec_path(app)
+        if not path:
+            raise click.UsageError('Give a PATH or set APIDOCS_SPEC_FILE')
+        with open(path, 'w') as f:
+            json.dump(build_spec(app), f)
+        click.echo(f'Wrote {path}')
+
+    mode = app.config['APIDOCS']
+    if mode is None:
+        return
+    if mode == 'flasgger':
+        from flasgger import Swagger
+        Swagger(app)
+        return
+    if mode != 'lazy':
+        raise ValueError(f'Unknown APIDOCS {mode!r}')
+    docs = LazyApiDocs(app, spec_path(app))
+    app.extensions['todo_apidocs'] = docs
+    blueprint = Blueprint(
+        'apidocs', __name__,
+        static_folder=swagger_ui_static_folder(), static_url_path='/flasgger_static',
+    )
+    blueprint.add_url_rule(SPEC_ROUTE, 'spec', docs.serve_spec)
+    blueprint.add_url_rule(
+        DOCS_ROUTE, 'ui',
+        lambda: render_template('apidocs.html', title=app.config['SWAGGER'].get('title'), spec_url=SPEC_ROUTE),
+    )
+    app.register_blueprint(blueprint)
+
+
+def spec_path(app):
+    path = app.config['APIDOCS_SPEC_FILE']
+    return os.path.join(app.instance_path, path) if path else None
@@ -0,0 +1,377 @@
+"""
+Asynchronous (ASGI) serving mode.
+
+`create_asgi_app` serves the core `/todos` routes with async handlers on an
+`AsyncSession` (SQLite through aiosqlite), so waiting on the database does
+not hold a thread and one process can keep thousands of slow clients open.
+Every other route (batch, export, change feed, events, Swagger UI) is served
+by the regular Flask app mounted underneath, as are creates that carry an
+`Idempotency-Key`. Both modes share the same database, validation,
+pagination, admission control, idempotency keys and change bookkeeping.
+
+Run it with an ASGI server:
+
+    uvicorn --factory app.asgi:create_asgi_app
+"""
+import contextlib
+import functools
+from urllib.parse import urlencode
+
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+from starlette.applications import Starlette
+from starlette.datastructures import Headers
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+from werkzeug.http import parse_etags
+
+from app import CORS_HEADERS, create_app, db
+from app.compression import CodedETagMiddleware, held_etag
+from app.database import install_sqlite_pragmas
+from app.idempotency import IDEMPOTENCY_HEADER
+from app.json_provider import orjson
+from app.models import DEFAULT_LIST_ID, CollectionVersion, ToDo, record_changes
+from app.queries import BadRequest, page_result, page_statement, parse_fields, project
+from app.routes import (
+    collection_etag, delete_statement, if_match_versions, item_etag, publish_changes, update_statement,
+)
+from app.validation import UPDATE_FIELDS, new_todo_values, validate_todo
+
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite'}
+
+
+class OrjsonResponse(JSONResponse):
+    def render(self, content):
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+JSON_RESPONSE_CLASS = OrjsonResponse if orjson is not None else JSONResponse
+
+
+def async_url(url):
+    """Turn the Flask app's database URL into one for an async driver."""
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver configured for {backend!r}')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def create_async_session_factory(url, config):
+    """Async engine and session factory using the Flask app's database profile."""
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        # An in-memory database only exists on one connection.
+        options = {'poolclass': StaticPool, 'connect_args': {'check_same_thread': False}}
+    else:
+        options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        if 'pool_size' in options:
+            # aiosqlite defaults to NullPool, which takes no sizing options.
+            options.setdefault('poolclass', AsyncAdaptedQueuePool)
+    engine = create_async_engine(async_url(url), **options)
+    install_sqlite_pragmas(engine.sync_engine, config['SQLITE_PRAGMAS'])
+    return engine, async_sessionmaker(engine, expire_on_commit=False)
+
+
+class IdempotencyKeyMiddleware:
+    """
+    Hand requests that carry an `Idempotency-Key` to the Flask app, whose
+    `@idempotent` views store and replay their responses; the others go on
+    to the async handler.
+    """
+
+    def __init__(self, app, flask_app, wsgi_app):
+        self.app = app
+        self.flask_app = flask_app
+        self.wsgi_app = wsgi_app
+
+    async def __call__(self, scope, receive, send):
+        store = self.flask_app.extensions.get('todo_idempotency')
+        if store is not None and IDEMPOTENCY_HEADER in Headers(scope=scope):
+            await self.wsgi_app(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+
+def json_response(content, status_code=200, etag=None, headers=None):
+    """A JSON response with the same CORS headers as the Flask app."""
+    headers = dict(CORS_HEADERS, **(headers or {}))
+    if etag is not None:
+        headers['ETag'] = f'"{etag}"'
+    return JSON_RESPONSE_CLASS(content, status_code=status_code, headers=headers)
+
+
+def not_modified(request, etag):
+    held = held_etag(parse_etags(request.headers.get('if-none-match')), etag)
+    if held is None:
+        return None
+    return Response(status_code=304, headers=dict(CORS_HEADERS, ETag=f'"{held}"'))
+
+
+def error(message, status_code):
+    return json_response({'error': message}, status_code)
+
+
+async def read_json(request):
+    """The request's JSON body, or an empty dict when it has none."""
+    try:
+        return await request.json() or {}
+    except ValueError:
+        return {}
+
+
+def list_id_of(request):
+    """The TODO list addressed by the request; `/todos/...` is the default list."""
+    return request.path_params.get('list_id', DEFAULT_LIST_ID)
+
+
+async def get_todo(session, list_id, id):
+    """Async counterpart of `app.routes.get_todo`."""
+    todo = await session.get(ToDo, id)
+    if todo is None or todo.list_id != list_id:
+        return None
+    return todo
+
+
+async def commit_changes(request, session, created=(), updated=(), deleted=()):
+    """Async counterpart of `app.routes.commit_changes`."""
+    list_id = list_id_of(request)
+    changed = list(created) + list(updated)
+    seq = await session.run_sync(record_changes, changed, deleted, list_id)
+    await session.commit()
+    broker = request.app.state.flask_app.extensions['todo_events']
+    await session.run_sync(
+        lambda sync_session: publish_changes(
+            broker, sync_session, list_id, seq, created, updated, deleted
+        )
+    )
+
+
+def admitted(handler):
+    """
+    Run `handler` under the Flask app's admission control (`app.ratelimit`),
+    as the Flask endpoint of the same name would be.
+    """
+    @functools.wraps(handler)
+    async def admit(request):
+        flask_app = request.app.state.flask_app
+        controller = flask_app.extensions.get('todo_ratelimit')
+        if controller is None:
+            return await handler(request)
+        context = flask_app.test_request_context(
+            request.url.path, method=request.method, headers=list(request.headers.items()),
+            query_string=request.url.query,
+            environ_base={'REMOTE_ADDR': request.client.host if request.client else None},
+        )
+        with context:
+            rejected = controller.admit(handler.__name__)
+            if rejected is not None:
+                return json_response(
+                    rejected.get_json(), rejected.status_code,
+                    headers={'Retry-After': rejected.headers['Retry-After']},
+                )
+            try:
+                return await handler(request)
+            finally:
+                controller.release()
+    return admit
+
+
+@admitted
+async def get_todos(request):
+    config = request.app.state.flask_app.config
+    args = request.query_params
+    list_id = list_id_of(request)
+    async with request.app.state.sessionmaker() as session:
+        version = await session.run_sync(
+            CollectionVersion.current, CollectionVersion.list_collection(list_id)
+        )
+        etag = collection_etag(list_id, version, args.multi_items())
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        try:
+            columns = parse_fields(args)
+            stmt, keys, limit = page_statement(
+                select(*columns).where(ToDo.list_id == list_id), args,
+                config['TODOS_DEFAULT_PAGE_SIZE'],
+                config['TODOS_MAX_PAGE_SIZE'],
+            )
+        except BadRequest as e:
+            return error(str(e), 400)
+        rows = (await session.execute(stmt)).all()
+        rows, next_cursor = page_result(rows, keys, limit)
+        headers = {}
+        if next_cursor is not None:
+            params = dict(args)
+            params['after'] = next_cursor
+            headers['X-Next-Cursor'] = next_cursor
+            headers['Link'] = f'<{request.url.path}?{urlencode(params)}>; rel="next"'
+        return json_response(project(rows, columns), etag=etag, headers=headers)
+
+
+@admitted
+async def create_todo(request):
+    data = await read_json(request)
+    message = validate_todo(data)
+    if message:
+        return error(message, 400)
+    todo = ToDo(list_id=list_id_of(request), **new_todo_values(data))
+    async with request.app.state.sessionmaker() as session:
+        session.add(todo)
+        await session.flush()
+        await commit_changes(request, session, created=[todo.id])
+        await session.refresh(todo)
+        return json_response(todo.to_dict(), 201)
+
+
+@admitted
+async def get_todo_by_id(request):
+    id = request.path_params['id']
+    list_id = list_id_of(request)
+    if 'fields' in request.query_params:
+        return await get_todo_fields(request, list_id, id)
+    async with request.app.state.sessionmaker() as session:
+        version = await session.scalar(
+            select(ToDo.version).where(ToDo.id == id, ToDo.list_id == list_id)
+        )
+        if version is None:
+            return error('ToDo item not found', 404)
+        response = not_modified(request, item_etag(id, version))
+        if response is not None:
+            return response
+        todo = await get_todo(session, list_id, id)
+        if todo is None:
+            return error('ToDo item not found', 404)
+        return json_response(todo.to_dict(), etag=item_etag(todo.id, todo.version))
+
+
+async def get_todo_fields(request, list_id, id):
+    """Async counterpart of the sparse fieldset case of `GET /todos/<id>`."""
+    try:
+        columns = parse_fields(request.query_params)
+    except BadRequest as e:
+        return error(str(e), 400)
+    async with request.app.state.sessionmaker() as session:
+        row = (await session.execute(
+            select(*columns, ToDo.version).where(ToDo.id == id, ToDo.list_id == list_id)
+        )).one_or_none()
+    if row is None:
+        return error('ToDo item not found', 404)
+    etag = item_etag(id, row.version, columns)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    return json_response(project([row], columns)[0], etag=etag)
+
+
+async def precondition_failed(session, list_id, id):
+    """Async counterpart of `app.routes.precondition_failed`."""
+    version = await session.scalar(
+        select(ToDo.version).where(ToDo.id == id, ToDo.list_id == list_id)
+    )
+    if version is None:
+        return error('ToDo item not found', 404)
+    return json_response(
+        {'error': 'ToDo item was modified; fetch it again and retry'}, 412, etag=item_etag(id, version)
+    )
+
+
+def precondition_required(request):
+    """Counterpart of `app.routes.precondition_required`."""
+    if not request.app.state.flask_app.config['TODOS_REQUIRE_IF_MATCH'] or 'if-match' in request.headers:
+        return None
+    return error('If-Match is required', 428)
+
+
+@admitted
+async def update_todo(request):
+    id = request.path_params['id']
+    list_id = list_id_of(request)
+    response = precondition_required(request)
+    if response is not None:
+        return response
+    data = await read_json(request)
+    message = validate_todo(data, partial=True)
+    if message:
+        return error(message, 400)
+    try:
+        columns = parse_fields(request.query_params)
+    except BadRequest as e:
+        return error(str(e), 400)
+    values = {field: data[field] for field in UPDATE_FIELDS if field in data}
+    versions = if_match_versions(request.headers.get('if-match'), id)
+    stmt = update_statement(list_id, id, values, versions, columns)
+    async with request.app.state.sessionmaker() as session:
+        row = (await session.execute(stmt, execution_options={'synchronize_session': False})).one_or_none()
+        if row is None:
+            return await precondition_failed(session, list_id, id)
+        if values:
+            await commit_changes(request, session, updated=[id])
+    item = row._asdict()
+    version = item.pop('version')
+    fields = columns if 'fields' in request.query_params else None
+    return json_response(item, etag=item_etag(id, version, fields))
+
+
+@admitted
+async def delete_todo(request):
+    id = request.path_params['id']
+    list_id = list_id_of(request)
+    response = precondition_required(request)
+    if response is not None:
+        return response
+    versions = if_match_versions(request.headers.get('if-match'), id)
+    async with request.app.state.sessionmaker() as session:
+        stmt = delete_statement(list_id, id, versions)
+        deleted = (await session.execute(stmt, execution_options={'synchronize_session': False})).one_or_none()
+        if deleted is None:
+            return await precondition_failed(session, list_id, id)
+        await commit_changes(request, session, deleted=[id])
+        return json_response({'message': 'ToDo item deleted'})
+
+
+def create_asgi_app(config=None):
+    """Create the ASGI app; `config` is applied as in `create_app`."""
+    flask_app = create_app(config)
+    with flask_app.app_context():
+        url = db.engine.url
+    engine, sessionmaker = create_async_session_factory(url, flask_app.config)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        yield
+        await engine.dispose()
+
+    wsgi_app = WSGIMiddleware(flask_app)
+    # The mounted Flask app compresses its own responses; only the async
+    # handlers' go through GZipMiddleware, then get the ETag of their coding.
+    compression = []
+    if flask_app.config['COMPRESSION_ENABLED']:
+        compression = [
+            Middleware(CodedETagMiddleware),
+            Middleware(
+                GZipMiddleware,
+                minimum_size=flask_app.config['COMPRESSION_MIN_SIZE'],
+                compresslevel=flask_app.config['COMPRESSION_LEVEL'],
+            ),
+        ]
+    # Outermost, so creates handed to the Flask app skip GZipMiddleware too.
+    idempotency = [Middleware(IdempotencyKeyMiddleware, flask_app=flask_app, wsgi_app=wsgi_app)]
+    routes = []
+    for prefix in ('', '/lists/{list_id:int}'):
+        routes += [
+            Route(f'{prefix}/todos', get_todos, methods=['GET'], middleware=compression),
+            Route(f'{prefix}/todos', create_todo, methods=['POST'], middleware=idempotency + compression),
+            Route(f'{prefix}/todos/{{id:int}}', get_todo_by_id, methods=['GET'], middleware=compression),
+            Route(f'{prefix}/todos/{{id:int}}', update_todo, methods=['PUT'], middleware=compression),
+            Route(f'{prefix}/todos/{{id:int}}', delete_todo, methods=['DELETE'], middleware=compression),
+        ]
+    routes.append(Mount('/', app=wsgi_app))
+    app = Starlette(routes=routes, lifespan=lifespan)
+    app.state.flask_app = flask_app
+    app.state.engine = engine
+    app.state.sessionmaker = sessionmaker
+    return app
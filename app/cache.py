@@ -0,0 +1,183 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+
+class CacheBackend:
+    """
+    Storage used by `ResponseCache`.
+
+    Values are JSON-serializable dicts or strings. Implement these four
+    methods to plug in another store.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """Thread-safe, in-process LRU cache bounded by entry count, with a TTL."""
+
+    def __init__(self, max_entries=1024, ttl=30, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = self.clock() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Backend for a Redis-compatible client (anything with `get`, `set(ex=)`
+    and `delete`), shared by every worker process.
+    """
+
+    def __init__(self, client, prefix='todo-cache:', ttl=30):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.client.set(self.prefix + key, json.dumps(value), ex=ttl or None)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+
+class ResponseCache:
+    """
+    Read-through cache of serialized GET responses.
+
+    Responses are keyed by the versions their handlers read for the ETag:
+    items by (id, version), lists by (list, collection version, query). A
+    write moves those versions forward, so the next read misses whichever
+    process made the write, and entries of older versions are left to age
+    out of the backend; nothing is ever invalidated. The version is read
+    before the body, so a cached body is never older than its key.
+    """
+
+    def __init__(self, backend, enabled=True):
+        self.backend = backend
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def item_key(id, version):
+        return f'todo:{id}:v{version}'
+
+    @staticmethod
+    def list_key(list_id, version, args):
+        query = '&'.join(f'{k}={v}' for k, v in sorted(args.items(multi=True)))
+        return f'todos:{list_id}:v{version}:{query}'
+
+    def lookup(self, key):
+        """Return the cached response for `key`, or None on a miss."""
+        if not self.enabled:
+            return None
+        entry = self.backend.get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        response = current_app.response_class(
+            entry['body'], status=entry['status'], mimetype='application/json'
+        )
+        response.headers.update(entry['headers'])
+        response.headers['X-Cache'] = 'HIT'
+        return response
+
+    def store(self, key, response, headers=()):
+        """Cache a successful response under `key`."""
+        if not self.enabled or response.status_code != 200:
+            return response
+        self.backend.set(key, {
+            'body': response.get_data(as_text=True),
+            'status': response.status_code,
+            'headers': {name: response.headers[name] for name in headers if name in response.headers},
+        })
+        response.headers['X-Cache'] = 'MISS'
+        return response
+
+    def stats(self):
+        total = self.hits + self.misses
+        stats = {
+            'enabled': self.enabled,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+        if isinstance(self.backend, LRUCache):
+            stats['size'] = len(self.backend)
+            stats['max_entries'] = self.backend.max_entries
+            stats['evictions'] = self.backend.evictions
+        return stats
+
+
+def init_cache(app):
+    """Create the response cache configured by the `CACHE_*` settings."""
+    backend = app.config['CACHE_BACKEND']
+    if backend is None:
+        backend = LRUCache(app.config['CACHE_MAX_ENTRIES'], app.config['CACHE_TTL'])
+    app.extensions['todo_cache'] = ResponseCache(backend, app.config['CACHE_ENABLED'])
+
+
+def get_cache():
+    return current_app.extensions['todo_cache']
@@ -0,0 +1,205 @@
+import gzip
+import zlib
+
+from flask import current_app, request
+from werkzeug.http import quote_etag, unquote_etag
+
+from .cache import LRUCache
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson')
+CODINGS = ('br', 'zstd', 'gzip')
+
+
+def coded_etag(etag, encoding):
+    """
+    ETag of the `encoding` coded body of the representation tagged `etag`.
+    A strong ETag names exact bytes, so each coding gets its own.
+    """
+    return f'{etag}+{encoding}'
+
+
+def identity_etag(etag):
+    """The ETag `etag` names before any content coding."""
+    base, _, coding = etag.rpartition('+')
+    return base if base and coding in CODINGS else etag
+
+
+def held_etag(etags, etag):
+    """
+    The tag among `etags` (of `If-None-Match`) naming `etag` in any coding,
+    so a 304 can repeat it, or None if the client holds no copy.
+    """
+    if etags.star_tag:
+        return etag
+    for held in etags.as_set():
+        if identity_etag(held) == etag:
+            return held
+    return None
+
+
+def available_encoders(level):
+    """Content codings this process can produce, in order of preference."""
+    encoders = {}
+    if brotli is not None:
+        encoders['br'] = lambda data: brotli.compress(data, quality=min(level, 11))
+    if zstandard is not None:
+        compressor = zstandard.ZstdCompressor(level=level)
+        encoders['zstd'] = compressor.compress
+    encoders['gzip'] = lambda data: gzip.compress(data, compresslevel=level, mtime=0)
+    return encoders
+
+
+def iter_gzip(chunks, level):
+    """
+    Gzip a streamed body chunk by chunk.
+
+    Each chunk is flushed, so a client can decode rows as they arrive.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+class Compressor:
+    """
+    Negotiate and apply a content coding to JSON and NDJSON responses.
+
+    Bodies below `min_size` are sent as they are, and a compressed body's
+    ETag names its coding (`coded_etag`). Compressed bodies of
+    responses with an ETag are kept in an LRU keyed by (path, ETag, coding),
+    so a popular list page is compressed once per version rather than per
+    request. The path is part of the key since an ETag only identifies a
+    representation of one resource.
+    """
+
+    def __init__(self, min_size=1024, level=6, mimetypes=COMPRESSIBLE_MIMETYPES, cache_entries=256):
+        self.min_size = min_size
+        self.level = level
+        self.mimetypes = mimetypes
+        self.encoders = available_encoders(level)
+        self.cache = LRUCache(cache_entries, ttl=None) if cache_entries else None
+        self.cache_hits = 0
+
+    def negotiate(self, accept_encodings, streamed=False):
+        if streamed:
+            # Only gzip is streamed: the optional codecs are used one-shot.
+            return accept_encodings.best_match(['gzip'])
+        return accept_encodings.best_match(list(self.encoders))
+
+    def compress(self, response, accept_encodings, path=None):
+        """Compress `response` in place; bodies are only cached with a request `path`."""
+        if response.mimetype not in self.mimetypes:
+            return response
+        response.vary.add('Accept-Encoding')
+        if (
+            response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.direct_passthrough
+        ):
+            return response
+
+        if response.is_streamed:
+            encoding = self.negotiate(accept_encodings, streamed=True)
+            if encoding is None:
+                return response
+            response.response = iter_gzip(response.response, self.level)
+            response.headers.pop('Content-Length', None)
+        else:
+            if response.calculate_content_length() < self.min_size:
+                return response
+            encoding = self.negotiate(accept_encodings)
+            if encoding is None:
+                return response
+            response.set_data(self.encoded_body(response, encoding, path))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(coded_etag(etag, encoding), weak)
+        return response
+
+    def encoded_body(self, response, encoding, path=None):
+        etag, _ = response.get_etag()
+        key = (path, etag, encoding) if etag and path and self.cache is not None else None
+        if key is not None:
+            body = self.cache.get(key)
+            if body is not None:
+                self.cache_hits += 1
+                return body
+        body = self.encoders[encoding](response.get_data())
+        if key is not None:
+            self.cache.set(key, body)
+        return body
+
+
+class CodedETagMiddleware:
+    """
+    ASGI middleware giving responses that an inner middleware (Starlette's
+    `GZipMiddleware`) compressed the ETag of their coding.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        async def send_coded(message):
+            if message['type'] == 'http.response.start':
+                headers = dict(message['headers'])
+                encoding = headers.get(b'content-encoding', b'').decode('latin-1')
+                quoted = headers.get(b'etag', b'').decode('latin-1')
+                etag, weak = unquote_etag(quoted) if quoted else (None, False)
+                if encoding in CODINGS and etag and identity_etag(etag) == etag:
+                    tagged = quote_etag(coded_etag(etag, encoding), weak).encode('latin-1')
+                    message['headers'] = [
+                        (name, tagged if name == b'etag' else value) for name, value in message['headers']
+                    ]
+            await send(message)
+
+        await self.app(scope, receive, send_coded)
+
+
+def init_compression(app):
+    """
+    Compress responses per `Accept-Encoding` when `COMPRESSION_ENABLED`.
+
+    Flask runs `after_request` hooks in reverse order, so hooks registered
+    before this one (instrumentation) see the compressed body.
+    """
+    compressor = Compressor(
+        min_size=app.config['COMPRESSION_MIN_SIZE'],
+        level=app.config['COMPRESSION_LEVEL'],
+        mimetypes=app.config['COMPRESSION_MIMETYPES'],
+        cache_entries=app.config['COMPRESSION_CACHE_ENTRIES'],
+    )
+    app.extensions['todo_compression'] = compressor
+    if not app.config['COMPRESSION_ENABLED']:
+        return
+
+    @app.after_request
+    def compress_response(response):
+        return compressor.compress(response, request.accept_encodings, request.path)
+
+
+def get_compressor():
+    return current_app.extensions['todo_compression']
@@ -0,0 +1,68 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# PRAGMAs applied to every new SQLite connection by the "production" profile.
+SQLITE_PRODUCTION_PRAGMAS = {
+    'journal_mode': 'WAL',  # readers no longer block on the writer (and vice versa)
+    'synchronous': 'NORMAL',  # in WAL mode, fsync on checkpoint instead of every commit
+    'busy_timeout': 5000,  # wait up to 5s for the write lock instead of failing at once
+    'mmap_size': 268435456,  # read the first 256 MiB of the file through mmap
+    'cache_size': -65536,  # 64 MiB page cache per connection
+    'temp_store': 'MEMORY',
+}
+
+# Connection pool of the "production" profile; SQLite connections are cheap
+# but not free, and reusing them keeps each one's page cache warm.
+PRODUCTION_ENGINE_OPTIONS = {
+    'pool_size': 10,
+    'max_overflow': 20,
+    'pool_timeout': 30,
+    'pool_pre_ping': True,
+    'pool_recycle': 3600,
+}
+
+
+def is_file_sqlite(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def configure_database_profile(app):
+    """
+    Apply the database profile named by `DATABASE_PROFILE` to the config.
+
+    Must run before `db.init_app`. Explicit `SQLALCHEMY_ENGINE_OPTIONS` and
+    `SQLITE_PRAGMAS` settings take precedence over the profile's defaults.
+    """
+    profile = app.config['DATABASE_PROFILE']
+    if profile == 'default':
+        return
+    if profile != 'production':
+        raise ValueError(f'Unknown DATABASE_PROFILE {profile!r}')
+    if not is_file_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+        # An in-memory database lives on a single, static connection.
+        return
+    options = dict(PRODUCTION_ENGINE_OPTIONS, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    if app.config['SQLITE_PRAGMAS'] is None:
+        app.config['SQLITE_PRAGMAS'] = dict(SQLITE_PRODUCTION_PRAGMAS)
+
+
+def install_sqlite_pragmas(engine, pragmas):
+    """Run `PRAGMA name=value` for `pragmas` on each new connection of `engine`."""
+    if not pragmas or engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+def init_database(app, db):
+    """Install the configured PRAGMAs on the app's engines."""
+    with app.app_context():
+        for engine in db.engines.values():
+            install_sqlite_pragmas(engine, app.config['SQLITE_PRAGMAS'])
@@ -0,0 +1,194 @@
+import json
+import queue
+import threading
+
+from flask import current_app
+
+# Put on a subscription's queue when the broker drops it.
+CLOSED = object()
+
+
+class Subscription:
+    """One SSE client: a bounded queue of events waiting to be sent."""
+
+    def __init__(self, max_queue_size):
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.dropped = False
+
+    def put(self, event):
+        """Queue `event`, returning False if the subscriber has fallen behind."""
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+    def close(self):
+        """Wake the subscriber up and tell it to disconnect."""
+        self.dropped = True
+        while True:
+            try:
+                self.queue.put_nowait(CLOSED)
+                return
+            except queue.Full:
+                # Make room: the subscriber is being dropped, its backlog is moot.
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout):
+        """Next event, `CLOSED`, or None if nothing arrived within `timeout`."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Broker:
+    """Fans TODO mutation events out to SSE subscribers."""
+
+    def publish(self, event):
+        raise NotImplementedError
+
+    def subscribe(self):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+    def active(self):
+        """Whether published events can reach anyone."""
+        return True
+
+    def after_fork(self):
+        """Called in each worker process forked after the broker was made."""
+
+
+class InProcessBroker(Broker):
+    """
+    Broker for a single process.
+
+    Each subscriber gets a bounded queue; a subscriber whose queue is full
+    when an event is published is dropped (and told so) rather than letting
+    one slow client hold events in memory or slow down publishers.
+    """
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self.dropped = 0
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def publish(self, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if not subscription.put(event):
+                self.unsubscribe(subscription)
+                subscription.close()
+                self.dropped += 1
+
+    def subscribe(self):
+        subscription = Subscription(self.max_queue_size)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def active(self):
+        return bool(self._subscriptions)
+
+
+class RedisBroker(Broker):
+    """
+    Broker for several worker processes, over Redis pub/sub.
+
+    Events are published to a Redis channel; every process runs one listener
+    thread that relays the channel to its own in-process subscribers.
+    `client` is a redis-py compatible client.
+    """
+
+    def __init__(self, client, channel='todo-events', max_queue_size=100):
+        self.client = client
+        self.channel = channel
+        self.local = InProcessBroker(max_queue_size)
+        self._start_listener()
+
+    def _start_listener(self):
+        self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(self.channel)
+        self._listener = threading.Thread(target=self._listen, daemon=True)
+        self._listener.start()
+
+    def _listen(self):
+        for message in self._pubsub.listen():
+            if message['type'] == 'message':
+                self.local.publish(json.loads(message['data']))
+
+    def publish(self, event):
+        self.client.publish(self.channel, json.dumps(event))
+
+    def subscribe(self):
+        return self.local.subscribe()
+
+    def unsubscribe(self, subscription):
+        self.local.unsubscribe(subscription)
+
+    def after_fork(self):
+        # Threads do not survive a fork, and the parent's pub/sub connection
+        # must not be shared with the child.
+        self.local = InProcessBroker(self.local.max_queue_size)
+        self._start_listener()
+
+
+def format_event(event):
+    """Serialize an event in the text/event-stream format."""
+    return f"id: {event['seq']}\nevent: {event['op']}\ndata: {json.dumps(event)}\n\n"
+
+
+def event_stream(broker, subscription, heartbeat, list_id=None):
+    """
+    Yield SSE messages for `subscription` until the client goes away.
+
+    A comment line is sent after `heartbeat` idle seconds so proxies keep the
+    connection open and dead clients are noticed on the next write. With
+    `list_id`, only the events of that TODO list are sent.
+    """
+    try:
+        yield f'retry: {int(heartbeat * 1000)}\n\n'
+        while True:
+            event = subscription.get(timeout=heartbeat)
+            if event is None:
+                yield ': keep-alive\n\n'
+            elif event is CLOSED:
+                yield 'event: dropped\ndata: {}\n\n'
+                return
+            elif list_id is None or event.get('list_id') == list_id:
+                yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def init_events(app):
+    """
+    Create the event broker configured by the `EVENTS_*` settings, and the
+    limit on open streams: each one holds a server thread while it is open.
+    """
+    broker = app.config['EVENTS_BROKER']
+    if broker is None:
+        broker = InProcessBroker(app.config['EVENTS_QUEUE_SIZE'])
+    app.extensions['todo_events'] = broker
+    if app.config['EVENTS_MAX_STREAMS'] is not None:
+        from .ratelimit import ConcurrencyLimiter
+        app.extensions['todo_event_streams'] = ConcurrencyLimiter(app.config['EVENTS_MAX_STREAMS'])
+
+
+def get_broker():
+    return current_app.extensions['todo_events']
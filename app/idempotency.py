@@ -0,0 +1,208 @@
+import functools
+import hashlib
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app, jsonify, request
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from app import db
+from app.cache import LRUCache
+from app.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+# What a store knows about a key; `status` is None while the first request
+# made with it is still being handled.
+IdempotencyRecord = namedtuple('IdempotencyRecord', 'fingerprint status body created_at')
+
+
+class IdempotencyStore:
+    """
+    Storage of the responses to requests made with an `Idempotency-Key`.
+
+    Implement these three methods to plug in another store. A key is claimed
+    by `reserve`, then either `complete`d with the response or `release`d so
+    that a retry runs the request again. A claim older than `lock_timeout`
+    seconds is treated as abandoned (its process died) and can be retaken.
+    """
+
+    def reserve(self, key, fingerprint):
+        """Claim `key`; return None if claimed, else its `IdempotencyRecord`."""
+        raise NotImplementedError
+
+    def complete(self, key, status, body):
+        raise NotImplementedError
+
+    def release(self, key):
+        raise NotImplementedError
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    """Keys of this process in an `LRUCache`, expiring after `ttl` seconds."""
+
+    def __init__(self, max_entries=10000, ttl=86400, lock_timeout=60, clock=time.time):
+        self.lock_timeout = lock_timeout
+        self.clock = clock
+        self.records = LRUCache(max_entries, ttl, clock)
+        self._lock = threading.Lock()
+
+    def reserve(self, key, fingerprint):
+        now = self.clock()
+        with self._lock:
+            record = self.records.get(key)
+            if record is not None and not abandoned(record, now, self.lock_timeout):
+                return record
+            self.records.set(key, IdempotencyRecord(fingerprint, None, None, now))
+        return None
+
+    def complete(self, key, status, body):
+        with self._lock:
+            record = self.records.get(key)
+            if record is not None:
+                self.records.set(key, record._replace(status=status, body=body))
+
+    def release(self, key):
+        self.records.delete(key)
+
+
+class SQLiteIdempotencyStore(IdempotencyStore):
+    """
+    Keys in the `idempotency_key` table of the app's database, shared by
+    every worker process. Claims are taken with an atomic upsert, and expired
+    rows are purged at most every `purge_interval` seconds.
+    """
+
+    def __init__(self, ttl=86400, lock_timeout=60, purge_interval=60, clock=time.time):
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.purge_interval = purge_interval
+        self.clock = clock
+        self._purged_at = None
+
+    def reserve(self, key, fingerprint):
+        now = self.clock()
+        claim = {
+            'fingerprint': fingerprint, 'status': None, 'body': None,
+            'created_at': now, 'expires_at': now + self.ttl,
+        }
+        table = IdempotencyKey
+        stmt = (
+            insert(table).values(key=key, **claim)
+            .on_conflict_do_update(
+                index_elements=[table.key],
+                set_=claim,
+                where=or_(
+                    table.expires_at <= now,
+                    and_(table.status.is_(None), table.created_at <= now - self.lock_timeout),
+                ),
+            )
+            .returning(table.key)
+        )
+        with Session(db.engine) as session, session.begin():
+            if self._purged_at is None or now - self._purged_at >= self.purge_interval:
+                self._purged_at = now
+                session.execute(delete(table).where(table.expires_at <= now))
+            if session.scalar(stmt) is not None:
+                return None
+            row = session.execute(
+                select(table.fingerprint, table.status, table.body, table.created_at)
+                .where(table.key == key)
+            ).one()
+        return IdempotencyRecord(*row)
+
+    def complete(self, key, status, body):
+        with Session(db.engine) as session, session.begin():
+            session.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.key == key)
+                .values(status=status, body=body, expires_at=self.clock() + self.ttl)
+            )
+
+    def release(self, key):
+        with Session(db.engine) as session, session.begin():
+            session.execute(
+                delete(IdempotencyKey)
+                .where(IdempotencyKey.key == key, IdempotencyKey.status.is_(None))
+            )
+
+
+def abandoned(record, now, lock_timeout):
+    return record.status is None and now - record.created_at >= lock_timeout
+
+
+def request_fingerprint():
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.path.encode(), request.get_data()):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def idempotent(view):
+    """
+    Make a view replay its response to requests that repeat an
+    `Idempotency-Key`, instead of running again.
+
+    The first request with a key runs normally and its response is stored,
+    unless it is a server error (5xx) or the view raised, in which case a
+    retry runs again. A repeat of a request still in progress gets 409, and
+    reusing a key for a different request (method, path or body) gets 422.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        store = current_app.extensions.get('todo_idempotency')
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if store is None or key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters'}), 400
+        fingerprint = request_fingerprint()
+        record = store.reserve(key, fingerprint)
+        if record is not None:
+            if record.fingerprint != fingerprint:
+                return jsonify({'error': f'{IDEMPOTENCY_HEADER} was already used for a different request'}), 422
+            if record.status is None:
+                response = jsonify({'error': f'A request with this {IDEMPOTENCY_HEADER} is in progress'})
+                response.status_code = 409
+                response.headers['Retry-After'] = '1'
+                return response
+            response = current_app.response_class(record.body, status=record.status, mimetype='application/json')
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except BaseException:
+            store.release(key)
+            raise
+        if response.status_code >= 500 or response.is_streamed:
+            store.release(key)
+        else:
+            store.complete(key, response.status_code, response.get_data(as_text=True))
+        return response
+    return wrapper
+
+
+def init_idempotency(app):
+    """Create the store configured by `IDEMPOTENCY_STORE`."""
+    store = app.config['IDEMPOTENCY_STORE']
+    if store is None:
+        return
+    if store == 'memory':
+        store = MemoryIdempotencyStore(
+            app.config['IDEMPOTENCY_MAX_ENTRIES'], app.config['IDEMPOTENCY_TTL'],
+            app.config['IDEMPOTENCY_LOCK_TIMEOUT'],
+        )
+    elif store == 'sqlite':
+        store = SQLiteIdempotencyStore(app.config['IDEMPOTENCY_TTL'], app.config['IDEMPOTENCY_LOCK_TIMEOUT'])
+    elif not isinstance(store, IdempotencyStore):
+        raise ValueError(f'Unknown IDEMPOTENCY_STORE {store!r}')
+    app.extensions['todo_idempotency'] = store
+
+
+def get_idempotency_store():
+    return current_app.extensions.get('todo_idempotency')
@@ -0,0 +1,169 @@
+import bisect
+import logging
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """(le, cumulative count) pairs, ending with +Inf."""
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+class Metrics:
+    """Per-route request metrics of one process, rendered for Prometheus."""
+
+    HISTOGRAMS = {
+        'todo_http_request_duration_seconds': ('Wall time spent handling requests.', DURATION_BUCKETS),
+        'todo_db_duration_seconds': ('Time spent in SQL queries per request.', DURATION_BUCKETS),
+        'todo_db_queries_per_request': ('SQL queries executed per request.', QUERY_COUNT_BUCKETS),
+        'todo_http_response_size_bytes': ('Size of response bodies.', SIZE_BUCKETS),
+    }
+
+    def __init__(self):
+        self.requests = {}
+        self.histograms = {name: {} for name in self.HISTOGRAMS}
+        self.slow_queries = 0
+        self._lock = threading.Lock()
+
+    def record(self, route, method, status, duration, db_duration, queries, size):
+        labels = (route, method)
+        with self._lock:
+            key = (route, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            values = {
+                'todo_http_request_duration_seconds': duration,
+                'todo_db_duration_seconds': db_duration,
+                'todo_db_queries_per_request': queries,
+                'todo_http_response_size_bytes': size,
+            }
+            for name, value in values.items():
+                if value is None:
+                    continue
+                histograms = self.histograms[name]
+                if labels not in histograms:
+                    histograms[labels] = Histogram(self.HISTOGRAMS[name][1])
+                histograms[labels].observe(value)
+
+    def record_slow_query(self):
+        with self._lock:
+            self.slow_queries += 1
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+        lines = [
+            '# HELP todo_http_requests_total Requests handled, by route, method and status.',
+            '# TYPE todo_http_requests_total counter',
+        ]
+        with self._lock:
+            for (route, method, status), count in sorted(self.requests.items()):
+                lines.append(
+                    f'todo_http_requests_total{{route="{route}",method="{method}",status="{status}"}} {count}'
+                )
+            for name, (help, _) in self.HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} histogram')
+                for (route, method), histogram in sorted(self.histograms[name].items()):
+                    labels = f'route="{route}",method="{method}"'
+                    for bound, count in histogram.samples():
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+            lines.append('# HELP todo_db_slow_queries_total SQL queries slower than SLOW_QUERY_THRESHOLD.')
+            lines.append('# TYPE todo_db_slow_queries_total counter')
+            lines.append(f'todo_db_slow_queries_total {self.slow_queries}')
+        return '\n'.join(lines) + '\n'
+
+
+def install_query_hooks(engine, metrics, threshold):
+    """Time every SQL statement run on `engine` and log the slow ones."""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        if has_request_context() and 'request_start' in g:
+            g.db_time += elapsed
+            g.db_queries += 1
+        if threshold is not None and elapsed >= threshold:
+            metrics.record_slow_query()
+            logger.warning('Slow query (%.1f ms): %s', elapsed * 1000, statement)
+
+
+def init_instrumentation(app, db):
+    """
+    Record per-route wall time, DB time, query count and response size.
+
+    Each response gets a `Server-Timing` header; aggregated histograms are
+    served by the `/metrics` route.
+    """
+    metrics = Metrics()
+    app.extensions['todo_metrics'] = metrics
+    if not app.config['INSTRUMENTATION_ENABLED']:
+        return
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    replicas = app.extensions.get('todo_replicas')
+    if replicas is not None:
+        engines += [replica.engine for replica in replicas.replicas]
+    for engine in engines:
+        install_query_hooks(engine, metrics, app.config['SLOW_QUERY_THRESHOLD'])
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+        g.db_time = 0.0
+        g.db_queries = 0
+
+    @app.after_request
+    def record_request(response):
+        if 'request_start' not in g:
+            return response
+        duration = time.perf_counter() - g.request_start
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        # Streamed bodies have no length yet; they are left out of the size histogram.
+        size = None if response.is_streamed else response.calculate_content_length()
+        metrics.record(
+            route, request.method, response.status_code,
+            duration, g.db_time, g.db_queries, size,
+        )
+        response.headers.add(
+            'Server-Timing',
+            f'app;dur={duration * 1000:.2f}, '
+            f'db;dur={g.db_time * 1000:.2f};desc="{g.db_queries} queries"',
+        )
+        response.headers['Timing-Allow-Origin'] = '*'
+        return response
+
+
+def get_metrics():
+    return current_app.extensions['todo_metrics']
@@ -0,0 +1,66 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised when orjson is not installed
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    JSON provider that serializes with orjson.
+
+    orjson encodes lists of dicts several times faster than the standard
+    library and writes bytes directly, so responses skip the str round trip.
+    Calls with options orjson does not support (e.g. `indent` for debug
+    output) fall back to the standard library.
+    """
+
+    def _options(self):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def dumpb(self, obj):
+        """Serialize `obj` to UTF-8 JSON bytes."""
+        return orjson.dumps(obj, default=self.default, option=self._options())
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumpb(obj) + b'\n', mimetype=self.mimetype)
+
+
+JSON_PROVIDERS = {
+    'stdlib': DefaultJSONProvider,
+    'orjson': OrjsonProvider,
+}
+
+
+def init_json(app):
+    """
+    Install the JSON provider named by `JSON_PROVIDER`.
+
+    'auto' picks orjson when it is installed and the standard library
+    otherwise; a `JSONProvider` subclass may also be given.
+    """
+    provider = app.config['JSON_PROVIDER']
+    if provider == 'auto':
+        provider = 'orjson' if orjson is not None else 'stdlib'
+    if isinstance(provider, str):
+        if provider == 'orjson' and orjson is None:
+            raise RuntimeError('JSON_PROVIDER is orjson but orjson is not installed')
+        provider = JSON_PROVIDERS[provider]
+    app.json = provider(app)
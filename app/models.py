@@ -1,16 +1,41 @@
 from app import db
-from sqlalchemy import CheckConstraint
+from sqlalchemy import DDL, CheckConstraint, delete, event, insert, select, update
+from sqlalchemy.sql import column, table
+
+# The list served by the routes without a `/lists/<list_id>` prefix.
+DEFAULT_LIST_ID = 1
+
 
 class ToDo(db.Model):
     __tablename__ = 'to_do'
     __table_args__ = (
         CheckConstraint('priority IN (1, 2, 3)', name='chk_priority'),
+        # Every query is scoped to one list, so the indexes lead with list_id
+        # and a list's queries only touch that list's part of each index.
+        db.Index('ix_to_do_list_id_id', 'list_id', 'id'),
+        # Serve filtered and sorted list views, e.g. open items by priority.
+        db.Index('ix_to_do_list_id_completed_priority_id', 'list_id', 'completed', 'priority', 'id'),
+        db.Index('ix_to_do_list_id_priority_id', 'list_id', 'priority', 'id'),
+        db.Index('ix_to_do_list_id_change_seq_id', 'list_id', 'change_seq', 'id'),
+        # Never reuse the ID of a deleted item: ETags are built from the ID and
+        # the version, and a new item starts at version 1 again.
+        {'sqlite_autoincrement': True},
     )
     id = db.Column(db.Integer, primary_key=True)
+    list_id = db.Column(db.Integer, nullable=False, default=DEFAULT_LIST_ID, server_default='1')
     title = db.Column(db.String(128), nullable=False)
     completed = db.Column(db.Boolean, default=False)
     description = db.Column(db.String(1024), default='')
     priority = db.Column(db.Integer, default=1)
+    # Incremented on every write; used to build the item's ETag.
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Version of the list at the last write to the row; drives the change feed.
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    @classmethod
+    def serialized_columns(cls):
+        """Columns selected when rows are serialized without loading ORM objects."""
+        return [cls.id, cls.title, cls.completed, cls.description, cls.priority]
 
     def to_dict(self):
         return {
@@ -20,3 +45,128 @@ class ToDo(db.Model):
             'description': self.description,
             'priority': self.priority
         }
+
+
+# Full-text index over title and description (SQLite FTS5). It stores no
+# copy of the text (content='to_do') and is kept in sync by triggers. The
+# migration creates the same objects in existing databases.
+TODO_FTS_DDL = (
+    "CREATE VIRTUAL TABLE to_do_fts USING fts5(title, description, content='to_do', "
+    "content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER to_do_fts_insert AFTER INSERT ON to_do BEGIN "
+    "INSERT INTO to_do_fts(rowid, title, description) VALUES (new.id, new.title, new.description); "
+    "END",
+    "CREATE TRIGGER to_do_fts_delete AFTER DELETE ON to_do BEGIN "
+    "INSERT INTO to_do_fts(to_do_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "END",
+    "CREATE TRIGGER to_do_fts_update AFTER UPDATE OF title, description ON to_do BEGIN "
+    "INSERT INTO to_do_fts(to_do_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO to_do_fts(rowid, title, description) VALUES (new.id, new.title, new.description); "
+    "END",
+)
+
+for statement in TODO_FTS_DDL:
+    event.listen(ToDo.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(
+    ToDo.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS to_do_fts').execute_if(dialect='sqlite')
+)
+
+to_do_fts = table('to_do_fts', column('rowid'))
+
+
+class ToDoTombstone(db.Model):
+    """Marks a deleted TODO item so the change feed can report the deletion."""
+    __tablename__ = 'to_do_tombstone'
+    __table_args__ = (
+        db.Index('ix_to_do_tombstone_list_id_change_seq_id', 'list_id', 'change_seq', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    list_id = db.Column(db.Integer, nullable=False, default=DEFAULT_LIST_ID, server_default='1')
+    change_seq = db.Column(db.Integer, nullable=False)
+
+    @classmethod
+    def record(cls, session, ids, change_seq, list_id=DEFAULT_LIST_ID):
+        ids = list(ids)
+        if not ids:
+            return
+        session.execute(delete(cls).where(cls.id.in_(ids)))
+        session.execute(
+            insert(cls), [{'id': id, 'list_id': list_id, 'change_seq': change_seq} for id in ids]
+        )
+
+
+class CollectionVersion(db.Model):
+    """
+    Version counter of a whole collection, incremented by every write to it.
+
+    Lets list responses be validated (ETag / If-None-Match) with a single
+    primary key lookup instead of scanning the collection. Each TODO list is
+    its own collection (see `list_collection`), so writes to one list leave
+    the ETags and change feed of the others alone.
+    """
+    __tablename__ = 'collection_version'
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def list_collection(list_id=DEFAULT_LIST_ID):
+        return f'{ToDo.__tablename__}:{list_id}'
+
+    @classmethod
+    def current(cls, session, name=None):
+        name = name or cls.list_collection()
+        version = session.scalar(select(cls.version).where(cls.name == name))
+        return version or 0
+
+    @classmethod
+    def bump(cls, session, name=None):
+        """Increment the version within the session's transaction and return it."""
+        name = name or cls.list_collection()
+        stmt = (
+            update(cls)
+            .where(cls.name == name)
+            .values(version=cls.version + 1)
+            .returning(cls.version)
+        )
+        version = session.scalar(stmt)
+        if version is None:
+            session.execute(insert(cls).values(name=name, version=1))
+            version = 1
+        return version
+
+
+def record_changes(session, changed, deleted, list_id=DEFAULT_LIST_ID):
+    """
+    Record a write to list `list_id` in the session's transaction and return
+    its sequence.
+
+    Bumps the list's version, stamps the `changed` rows with it for the
+    change feed and leaves a tombstone for each `deleted` ID.
+    """
+    changed = list(changed)
+    seq = CollectionVersion.bump(session, CollectionVersion.list_collection(list_id))
+    if changed:
+        session.execute(
+            update(ToDo).where(ToDo.id.in_(changed)).values(change_seq=seq),
+            execution_options={'synchronize_session': False},
+        )
+    ToDoTombstone.record(session, deleted, seq, list_id)
+    return seq
+
+
+class IdempotencyKey(db.Model):
+    """
+    A request made with an `Idempotency-Key` header and, once it has been
+    handled, its response (see `app.idempotency.SQLiteIdempotencyStore`).
+    """
+    __tablename__ = 'idempotency_key'
+    key = db.Column(db.String(255), primary_key=True)
+    # SHA-256 of the request's method, path and body.
+    fingerprint = db.Column(db.String(64), nullable=False)
+    # NULL while the request is being handled.
+    status = db.Column(db.Integer)
+    body = db.Column(db.Text)
+    created_at = db.Column(db.Float, nullable=False)
+    expires_at = db.Column(db.Float, nullable=False, index=True)
@@ -0,0 +1,114 @@
+import cProfile
+import functools
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import current_app, g, request
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_PARAM = 'profile'
+
+
+class StackSampler:
+    """
+    Sample the stack of one thread at a fixed interval.
+
+    The result is in the "collapsed" format read by flamegraph.pl and
+    speedscope: one `frame;frame;frame count` line per distinct stack.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.counts.most_common())
+
+
+def should_profile(config):
+    """Whether the current request opted in (or was sampled) for profiling."""
+    requested = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_PARAM)
+    if requested:
+        secret = config['PROFILING_SECRET']
+        return secret is None or requested == secret
+    return random.random() < config['PROFILING_SAMPLE_RATE']
+
+
+def write_profile(directory, endpoint, profiler, sampler):
+    """Write `<id>.pstats` and `<id>.collapsed` under `directory/endpoint`."""
+    path = os.path.join(directory, endpoint)
+    os.makedirs(path, exist_ok=True)
+    profile_id = f'{int(time.time() * 1000)}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+    profiler.dump_stats(os.path.join(path, f'{profile_id}.pstats'))
+    with open(os.path.join(path, f'{profile_id}.collapsed'), 'w') as f:
+        f.write(sampler.collapsed())
+    return f'{endpoint}/{profile_id}'
+
+
+def profiled(endpoint, view):
+    """Wrap `view` so opted-in requests are run under cProfile and a stack sampler."""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        config = current_app.config
+        if not should_profile(config):
+            return view(*args, **kwargs)
+        profiler = cProfile.Profile()
+        sampler = StackSampler(threading.get_ident(), config['PROFILING_INTERVAL'])
+        sampler.start()
+        try:
+            return profiler.runcall(view, *args, **kwargs)
+        finally:
+            sampler.stop()
+            g.profile_id = write_profile(config['PROFILING_DIR'], endpoint, profiler, sampler)
+
+    return wrapper
+
+
+def init_profiling(app):
+    """
+    Wrap the registered view functions in the profiler when
+    `PROFILING_ENABLED` is set. Call after the routes are set up.
+
+    Only the view function is profiled: the body of a streamed response is
+    produced after it returns.
+    """
+    if not app.config['PROFILING_ENABLED']:
+        return
+    if app.config['PROFILING_DIR'] is None:
+        app.config['PROFILING_DIR'] = os.path.join(app.instance_path, 'profiles')
+    for endpoint, view in list(app.view_functions.items()):
+        if endpoint != 'static':
+            app.view_functions[endpoint] = profiled(endpoint, view)
+
+    @app.after_request
+    def add_profile_header(response):
+        if 'profile_id' in g:
+            response.headers['X-Profile-Id'] = g.profile_id
+        return response
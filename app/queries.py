@@ -0,0 +1,323 @@
+import base64
+import binascii
+import json
+import re
+
+from sqlalchemy import Float, and_, func, literal, literal_column, or_, select
+
+from app.models import DEFAULT_LIST_ID, CollectionVersion, ToDo, ToDoTombstone, to_do_fts
+
+# Columns clients may sort by; every sort is made unique by ending on `id`.
+SORTABLE_COLUMNS = {
+    'id': ToDo.id,
+    'title': ToDo.title,
+    'completed': ToDo.completed,
+    'priority': ToDo.priority,
+}
+
+# Columns clients may ask for with `fields=`, in response order.
+SELECTABLE_COLUMNS = {column.key: column for column in ToDo.serialized_columns()}
+
+# Matches in the title weigh more than matches in the description.
+SEARCH_RANK = func.bm25(literal_column('to_do_fts'), 10.0, 1.0, type_=Float).label('rank')
+SEARCH_TERM = re.compile(r'\w+')
+
+TRUE_VALUES = ('true', '1', 'yes')
+FALSE_VALUES = ('false', '0', 'no')
+
+
+class BadRequest(ValueError):
+    """Raised by request parsing helpers; the message is returned as a 400."""
+
+
+def encode_cursor(values):
+    """Encode the sort key of the last row of a page as an opaque cursor."""
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by `encode_cursor`."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise BadRequest('Invalid cursor')
+    if not isinstance(values, list):
+        raise BadRequest('Invalid cursor')
+    return values
+
+
+def parse_bool(value, name):
+    """Parse a boolean query parameter such as `completed=true`."""
+    if value.lower() in TRUE_VALUES:
+        return True
+    if value.lower() in FALSE_VALUES:
+        return False
+    raise BadRequest(f'{name} must be true or false')
+
+
+def parse_limit(args, default, maximum):
+    """Read `limit` from the query string, clamped to `maximum`."""
+    limit = args.get('limit', default)
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise BadRequest('Limit must be an integer')
+    if limit < 1:
+        raise BadRequest('Limit must be a positive integer')
+    return min(limit, maximum)
+
+
+def parse_fields(args):
+    """
+    Read `fields=id,title` into the columns to return, in their usual order;
+    every serialized column when the parameter is absent.
+    """
+    if 'fields' not in args:
+        return ToDo.serialized_columns()
+    names = {name.strip() for name in args['fields'].split(',')} - {''}
+    if not names:
+        raise BadRequest('Fields must name at least one field')
+    for name in names:
+        if name not in SELECTABLE_COLUMNS:
+            raise BadRequest(f'Unknown field {name!r}')
+    return [column for key, column in SELECTABLE_COLUMNS.items() if key in names]
+
+
+def project(rows, columns):
+    """Rows whose first values are `columns` as dicts of just those columns."""
+    names = [column.key for column in columns]
+    return [dict(zip(names, row)) for row in rows]
+
+
+def with_columns(stmt, columns):
+    """Add the `columns` that `stmt` does not select yet, after its own."""
+    selected = {column.key for column in stmt.selected_columns}
+    return stmt.add_columns(*(column for column in columns if column.key not in selected))
+
+
+def parse_filters(args):
+    """
+    Build the WHERE clauses for the `completed` and `priority` parameters.
+
+    `priority` accepts a single value or a comma separated list (`priority=1,2`).
+    """
+    filters = []
+    if 'completed' in args:
+        filters.append(ToDo.completed == parse_bool(args['completed'], 'Completed'))
+    if 'priority' in args:
+        try:
+            priorities = {int(p) for p in args['priority'].split(',')}
+        except ValueError:
+            raise BadRequest('Priority must be 1, 2, or 3')
+        if not priorities <= {1, 2, 3}:
+            raise BadRequest('Priority must be 1, 2, or 3')
+        if len(priorities) == 1:
+            filters.append(ToDo.priority == priorities.pop())
+        else:
+            filters.append(ToDo.priority.in_(sorted(priorities)))
+    return filters
+
+
+def parse_sort(args):
+    """
+    Parse `sort=priority,-id` into a list of (column, descending) pairs.
+
+    `id` is appended as a final ascending key when it is not listed, so that
+    the order is total and can be used for keyset pagination.
+    """
+    keys = []
+    names = set()
+    for field in args.get('sort', 'id').split(','):
+        field = field.strip()
+        descending = field.startswith('-')
+        name = field.lstrip('-')
+        if name not in SORTABLE_COLUMNS:
+            raise BadRequest(f'Cannot sort by {name!r}')
+        if name in names:
+            raise BadRequest(f'Duplicate sort field {name!r}')
+        names.add(name)
+        keys.append((SORTABLE_COLUMNS[name], descending))
+    if 'id' not in names:
+        keys.append((ToDo.id, False))
+    return keys
+
+
+def keyset_predicate(keys, values):
+    """
+    Build the WHERE clause selecting rows that sort after `values`.
+
+    For keys (a, b, c) this is `a > va OR (a = va AND b > vb) OR
+    (a = va AND b = vb AND c > vc)`, with `<` for descending keys.
+    """
+    # Bind values explicitly: SQLAlchemy refuses `<`/`>` against bare booleans.
+    bound = [literal(value, column.type) for (column, _), value in zip(keys, values)]
+    clauses = []
+    for i, (column, descending) in enumerate(keys):
+        equal = [keys[j][0] == bound[j] for j in range(i)]
+        after = column < bound[i] if descending else column > bound[i]
+        clauses.append(and_(*equal, after))
+    return or_(*clauses)
+
+
+def check_cursor_values(keys, values):
+    """Reject cursors that do not match the requested sort keys."""
+    if len(values) != len(keys):
+        raise BadRequest('Invalid cursor')
+    for (column, _), value in zip(keys, values):
+        expected = column.type.python_type
+        if expected is int and isinstance(value, bool):
+            raise BadRequest('Invalid cursor')
+        if not isinstance(value, expected):
+            raise BadRequest('Invalid cursor')
+
+
+def page_statement(stmt, args, default_limit, max_limit):
+    """
+    Filter, sort and apply keyset pagination to a statement selecting `ToDo`
+    (or its columns).
+
+    Returns the statement, the sort keys and the page size; the statement
+    fetches one extra row so `page_result` can tell whether another page
+    exists without a COUNT query. Sort columns the statement does not select
+    are added after its own, since the cursor is built from them.
+    """
+    limit = parse_limit(args, default_limit, max_limit)
+    keys = parse_sort(args)
+    stmt = with_columns(stmt, [column for column, _ in keys]).where(*parse_filters(args))
+    after = args.get('after')
+    if after:
+        values = decode_cursor(after)
+        check_cursor_values(keys, values)
+        stmt = stmt.where(keyset_predicate(keys, values))
+    order_by = [column.desc() if descending else column for column, descending in keys]
+    return stmt.order_by(*order_by).limit(limit + 1), keys, limit
+
+
+def page_result(rows, keys, limit):
+    """
+    Split the rows fetched by a `page_statement` into the page and the
+    cursor of the next page, which is None when this is the last page.
+    """
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column, _ in keys])
+    return rows, next_cursor
+
+
+def paginate(session, args, default_limit, max_limit, list_id=DEFAULT_LIST_ID):
+    """
+    Return a page of the `ToDo` items of a list and the cursor of the next page.
+
+    Items are returned as dicts of the columns named by `fields` (see
+    `parse_fields`), selected without loading ORM objects.
+    """
+    columns = parse_fields(args)
+    stmt, keys, limit = page_statement(
+        select(*columns).where(ToDo.list_id == list_id),
+        args, default_limit, max_limit,
+    )
+    rows, next_cursor = page_result(session.execute(stmt).all(), keys, limit)
+    return project(rows, columns), next_cursor
+
+
+def parse_search(args):
+    """
+    Turn the `q` parameter into an FTS5 query matching every word as a prefix.
+
+    Only word characters are kept, so user input cannot inject FTS5 syntax
+    (operators, column filters or unbalanced quotes).
+    """
+    terms = SEARCH_TERM.findall(args.get('q', ''))
+    if not terms:
+        raise BadRequest('Search query q is required')
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search(session, args, default_limit, max_limit, list_id=DEFAULT_LIST_ID):
+    """
+    Return a page of the `ToDo` items of a list matching `q`, best match
+    first, and the cursor of the next page.
+
+    Results are ranked by bm25 and paged by (rank, id); `completed`,
+    `priority` and `fields` apply as in `paginate`.
+    """
+    query = parse_search(args)
+    limit = parse_limit(args, default_limit, max_limit)
+    columns = parse_fields(args)
+    keys = [(SEARCH_RANK, False), (ToDo.id, False)]
+    stmt = (
+        with_columns(select(*columns), [SEARCH_RANK, ToDo.id])
+        .join(to_do_fts, to_do_fts.c.rowid == ToDo.id)
+        .where(literal_column('to_do_fts').match(query), ToDo.list_id == list_id)
+        .where(*parse_filters(args))
+    )
+    after = args.get('after')
+    if after:
+        values = decode_cursor(after)
+        check_cursor_values(keys, values)
+        stmt = stmt.where(keyset_predicate(keys, values))
+    stmt = stmt.order_by(SEARCH_RANK, ToDo.id).limit(limit + 1)
+    rows, next_cursor = page_result(session.execute(stmt).all(), keys, limit)
+    return project(rows, columns), next_cursor
+
+
+def parse_since(args):
+    """Read the `since` change sequence of the change feed (defaults to 0)."""
+    try:
+        since = int(args.get('since', 0))
+    except ValueError:
+        raise BadRequest('Since must be an integer')
+    if since < 0:
+        raise BadRequest('Since must not be negative')
+    return since
+
+
+def _change_entries(session, list_id, condition, limit=None):
+    """Upserted rows and tombstones of a list matching `condition` on `change_seq`."""
+    rows = select(*ToDo.serialized_columns(), ToDo.change_seq).where(
+        ToDo.list_id == list_id, condition(ToDo.change_seq)
+    ).order_by(ToDo.change_seq, ToDo.id)
+    tombstones = select(ToDoTombstone.id, ToDoTombstone.change_seq).where(
+        ToDoTombstone.list_id == list_id, condition(ToDoTombstone.change_seq)
+    ).order_by(ToDoTombstone.change_seq, ToDoTombstone.id)
+    if limit is not None:
+        rows = rows.limit(limit)
+        tombstones = tombstones.limit(limit)
+    entries = []
+    for row in session.execute(rows):
+        item = row._asdict()
+        seq = item.pop('change_seq')
+        entries.append({'seq': seq, 'op': 'upsert', 'id': row.id, 'item': item})
+    for row in session.execute(tombstones):
+        entries.append({'seq': row.change_seq, 'op': 'delete', 'id': row.id})
+    entries.sort(key=lambda entry: (entry['seq'], entry['id']))
+    return entries
+
+
+def changes_since(session, since, limit, list_id=DEFAULT_LIST_ID):
+    """
+    Return up to `limit` changes to a list with a sequence above `since`, in
+    order.
+
+    Rows written by one transaction share a sequence, so a page never ends in
+    the middle of a sequence: it may exceed `limit` by the remainder of the
+    last transaction (bounded by the batch size). The returned `since` is the
+    value to pass on the next call; when there is nothing left it is the
+    list's version read before the changes, so the next sync starts
+    where this one ended.
+    """
+    current = CollectionVersion.current(session, CollectionVersion.list_collection(list_id))
+    entries = _change_entries(session, list_id, lambda seq: seq > since, limit + 1)
+    has_more = len(entries) > limit
+    if has_more:
+        last = entries[limit - 1]['seq']
+        entries = [entry for entry in entries[:limit] if entry['seq'] < last]
+        entries.extend(_change_entries(session, list_id, lambda seq: seq == last))
+        next_since = last
+    else:
+        next_since = max([since, current] + [entry['seq'] for entry in entries])
+    return entries, next_since, has_more
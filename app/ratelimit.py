@@ -0,0 +1,249 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, jsonify, request
+
+# Token bucket update run atomically on the Redis server. Returns the seconds
+# to wait before the request would be allowed, 0 if it is; as a string, since
+# Lua numbers are truncated to integers on the way out.
+REDIS_TOKEN_BUCKET = """
+local rate, burst, cost, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = tonumber(state[1]) or burst
+local at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - at) * rate)
+local wait = 0
+if tokens >= cost then tokens = tokens - cost else wait = (cost - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'at', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RateLimitBackend:
+    """
+    Token bucket storage used by `AdmissionController`.
+
+    Implement `consume` to plug in another store.
+    """
+
+    def consume(self, key, rate, burst, cost=1):
+        """
+        Take `cost` tokens from the bucket `key`, which holds up to `burst`
+        tokens and refills at `rate` tokens per second. Return 0 if they
+        were taken, else the seconds until they would be available.
+        """
+        raise NotImplementedError
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """
+    Thread-safe, in-process token buckets. The least recently used bucket is
+    dropped beyond `max_keys`, which at worst lets that client start over
+    with a full bucket.
+    """
+
+    def __init__(self, max_keys=10000, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def consume(self, key, rate, burst, cost=1):
+        now = self.clock()
+        with self._lock:
+            tokens, at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - at) * rate)
+            wait = 0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """
+    Backend for a Redis-compatible client (anything with `eval`), shared by
+    every worker process. Buckets expire once they would be full again.
+    """
+
+    def __init__(self, client, prefix='todo-ratelimit:', clock=time.time):
+        self.client = client
+        self.prefix = prefix
+        self.clock = clock
+
+    def consume(self, key, rate, burst, cost=1):
+        wait = self.client.eval(REDIS_TOKEN_BUCKET, 1, self.prefix + key, rate, burst, cost, self.clock())
+        return float(wait)
+
+
+class ConcurrencyLimiter:
+    """Counts in-flight requests per key and refuses those beyond `limit`."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key=None):
+        with self._lock:
+            count = self._in_flight.get(key, 0)
+            if count >= self.limit:
+                return False
+            self._in_flight[key] = count + 1
+            return True
+
+    def release(self, key=None):
+        with self._lock:
+            count = self._in_flight[key] - 1
+            if count:
+                self._in_flight[key] = count
+            else:
+                del self._in_flight[key]
+
+    def in_flight(self, key=None):
+        return self._in_flight.get(key, 0)
+
+
+def remote_address(request):
+    return request.remote_addr or 'unknown'
+
+
+NOT_ADMITTED = object()
+
+
+class AdmissionController:
+    """
+    Decides whether a request is handled, before its view function runs.
+
+    In order:
+    - once `max_in_flight` requests are being handled by this process, more
+      are shed with a 503, so latency stays bounded instead of requests
+      queueing behind each other;
+    - a client (as named by `key_func`) with `client_concurrency` requests in
+      flight gets a 429;
+    - each (route, client) pair has a token bucket, refilled at `rate` tokens
+      per second up to `burst`, and every request takes a token or gets a 429.
+
+    `limits` maps endpoint names to `(rate, burst)` pairs, or to None to leave
+    a route unlimited; other routes use `default_limit`. Endpoints in `exempt`
+    (long-lived streams, metrics) and CORS preflights are never limited.
+    """
+
+    def __init__(self, backend, limits=None, default_limit=None, key_func=remote_address,
+                 client_concurrency=None, max_in_flight=None, shed_retry_after=1, exempt=()):
+        self.backend = backend
+        self.limits = limits or {}
+        self.default_limit = default_limit
+        self.key_func = key_func
+        self.clients = ConcurrencyLimiter(client_concurrency) if client_concurrency else None
+        self.process = ConcurrencyLimiter(max_in_flight) if max_in_flight else None
+        self.shed_retry_after = shed_retry_after
+        self.exempt = frozenset(exempt)
+        self.rate_limited = 0
+        self.concurrency_limited = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def limit_for(self, endpoint):
+        return self.limits.get(endpoint, self.default_limit)
+
+    def admit(self, endpoint):
+        """
+        Return None if the current request may proceed, else the error
+        response. An admitted request must be passed to `release` when done.
+        """
+        if endpoint is None or endpoint in self.exempt or request.method == 'OPTIONS':
+            return None
+        if self.process is not None and not self.process.acquire():
+            self._count('shed')
+            return self.reject(503, 'Server overloaded', self.shed_retry_after)
+        client = self.key_func(request)
+        if self.clients is not None and not self.clients.acquire(client):
+            self._release_process()
+            self._count('concurrency_limited')
+            return self.reject(429, 'Too many concurrent requests', 1)
+        g.admitted_client = client
+        limit = self.limit_for(endpoint)
+        if limit is not None:
+            rate, burst = limit
+            wait = self.backend.consume(f'{endpoint}:{client}', rate, burst)
+            if wait:
+                self.release()
+                self._count('rate_limited')
+                return self.reject(429, 'Too many requests', wait)
+        return None
+
+    def release(self):
+        # A key function may name a client None, so absence has its own marker.
+        client = g.pop('admitted_client', NOT_ADMITTED)
+        if client is NOT_ADMITTED:
+            return
+        if self.clients is not None:
+            self.clients.release(client)
+        self._release_process()
+
+    def _release_process(self):
+        if self.process is not None:
+            self.process.release()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    @staticmethod
+    def reject(status, error, retry_after):
+        response = jsonify({'error': error})
+        response.status_code = status
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    def stats(self):
+        return {
+            'in_flight': self.process.in_flight() if self.process is not None else None,
+            'shed': self.shed,
+            'rate_limited': self.rate_limited,
+            'concurrency_limited': self.concurrency_limited,
+        }
+
+
+def init_ratelimit(app):
+    """Install the admission checks configured by the `RATELIMIT_*` settings."""
+    if not app.config['RATELIMIT_ENABLED']:
+        return
+    backend = app.config['RATELIMIT_BACKEND']
+    if backend is None:
+        backend = MemoryRateLimitBackend()
+    controller = AdmissionController(
+        backend,
+        limits=app.config['RATELIMIT_ROUTES'],
+        default_limit=app.config['RATELIMIT_DEFAULT'],
+        key_func=app.config['RATELIMIT_KEY_FUNC'] or remote_address,
+        client_concurrency=app.config['RATELIMIT_CLIENT_CONCURRENCY'],
+        max_in_flight=app.config['RATELIMIT_MAX_IN_FLIGHT'],
+        shed_retry_after=app.config['RATELIMIT_SHED_RETRY_AFTER'],
+        exempt=app.config['RATELIMIT_EXEMPT'],
+    )
+    app.extensions['todo_ratelimit'] = controller
+
+    @app.before_request
+    def admit_request():
+        return controller.admit(request.endpoint)
+
+    @app.teardown_request
+    def release_request(exc):
+        controller.release()
+
+
+def get_admission_controller():
+    return current_app.extensions.get('todo_ratelimit')
@@ -0,0 +1,164 @@
+import itertools
+import logging
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+
+from app.database import install_sqlite_pragmas
+
+logger = logging.getLogger(__name__)
+
+# Cheap query that also fails on a replica missing the schema.
+HEALTH_CHECK = text('SELECT 1 FROM collection_version LIMIT 1')
+READ_YOUR_WRITES_COOKIE = 'todo_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RoutingSession(Session):
+    """
+    Session that sends the SELECTs of GET requests to the read replica
+    picked for the request (see `init_replicas`).
+
+    Everything else (writes, flushes, raw SQL, work outside a request) goes
+    to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context():
+            replica = g.get('db_replica')
+            if replica is not None and getattr(clause, 'is_select', False):
+                return replica.engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class Replica:
+    def __init__(self, name, engine):
+        self.name = name
+        self.engine = engine
+        self.healthy = True
+        self.checked_at = None
+
+
+class ReplicaRouter:
+    """
+    Round-robin choice among the healthy read replicas.
+
+    A replica is checked with `HEALTH_CHECK` when it is picked and its last
+    check is older than `check_interval` seconds, and marked unhealthy as
+    soon as one of its queries fails with an `OperationalError`. Unhealthy
+    replicas are skipped until a later check succeeds; with none left,
+    reads fall back to the primary.
+    """
+
+    def __init__(self, replicas, check_interval=5, clock=time.monotonic):
+        self.replicas = replicas
+        self.check_interval = check_interval
+        self.clock = clock
+        self.fallbacks = 0
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        for replica in replicas:
+            event.listen(replica.engine, 'handle_error', self._failure_handler(replica))
+
+    def _failure_handler(self, replica):
+        def handle_error(context):
+            if isinstance(context.sqlalchemy_exception, OperationalError):
+                self.mark_unhealthy(replica)
+        return handle_error
+
+    def choose(self):
+        """The replica to read from, or None to use the primary."""
+        if not self.replicas:
+            return None
+        with self._lock:
+            start = next(self._next)
+        for i in range(len(self.replicas)):
+            replica = self.replicas[(start + i) % len(self.replicas)]
+            if replica.checked_at is None or self.clock() - replica.checked_at >= self.check_interval:
+                self.check(replica)
+            if replica.healthy:
+                return replica
+        self.fallbacks += 1
+        return None
+
+    def check(self, replica):
+        try:
+            with replica.engine.connect() as connection:
+                connection.execute(HEALTH_CHECK)
+        except SQLAlchemyError as e:
+            if replica.healthy:
+                logger.warning('Read replica %s failed its health check: %s', replica.name, e)
+            replica.healthy = False
+        else:
+            replica.healthy = True
+        replica.checked_at = self.clock()
+
+    def mark_unhealthy(self, replica):
+        if replica.healthy:
+            logger.warning('Read replica %s marked unhealthy', replica.name)
+        replica.healthy = False
+        replica.checked_at = self.clock()
+
+    def dispose(self, close=True):
+        for replica in self.replicas:
+            replica.engine.dispose(close=close)
+
+    def stats(self):
+        return {
+            'replicas': {replica.name: replica.healthy for replica in self.replicas},
+            'fallbacks': self.fallbacks,
+        }
+
+
+def init_replicas(app):
+    """
+    Route the reads of GET requests to the replicas in `SQLALCHEMY_REPLICAS`.
+
+    Replica engines take the primary's `SQLALCHEMY_ENGINE_OPTIONS` and
+    `SQLITE_PRAGMAS`. They are not SQLAlchemy binds: no model lives on them.
+
+    With `REPLICA_READ_YOUR_WRITES` set to a number of seconds, a client that
+    made a successful write is sent a cookie that keeps its reads on the
+    primary for that long, so it sees its own writes despite replication lag.
+    """
+    replicas = []
+    for i, uri in enumerate(app.config['SQLALCHEMY_REPLICAS']):
+        engine = create_engine(uri, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        install_sqlite_pragmas(engine, app.config['SQLITE_PRAGMAS'])
+        replicas.append(Replica(f'replica_{i}', engine))
+    router = ReplicaRouter(replicas, app.config['REPLICA_CHECK_INTERVAL'])
+    app.extensions['todo_replicas'] = router
+    if not replicas:
+        return
+    window = app.config['REPLICA_READ_YOUR_WRITES']
+
+    @app.before_request
+    def choose_replica():
+        if request.method not in SAFE_METHODS:
+            return
+        if window:
+            try:
+                primary_until = float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0))
+            except ValueError:
+                primary_until = 0
+            if primary_until > time.time():
+                return
+        g.db_replica = router.choose()
+
+    if window:
+        @app.after_request
+        def pin_to_primary(response):
+            if request.method not in SAFE_METHODS and response.status_code < 400:
+                response.set_cookie(
+                    READ_YOUR_WRITES_COOKIE, str(time.time() + window),
+                    max_age=window, httponly=True, samesite='Lax',
+                )
+            return response
+
+
+def get_replica_router():
+    return current_app.extensions['todo_replicas']
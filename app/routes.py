@@ -1,19 +1,356 @@
-from flask import jsonify, request, render_template, abort, redirect
+import hashlib
+import re
+from collections import namedtuple
+from concurrent.futures import TimeoutError
+from urllib.parse import urlencode
+
+from flask import jsonify, request, render_template, abort, redirect, current_app, Response, stream_with_context
+from sqlalchemy import bindparam, delete, insert, select, update
 from sqlalchemy.orm import Session
+from werkzeug.http import parse_etags
 from app import db
-from app.models import ToDo
+from app.cache import get_cache
+from app.compression import held_etag, identity_etag
+from app.events import event_stream, get_broker
+from app.idempotency import idempotent
+from app.instrumentation import get_metrics
+from app.ratelimit import AdmissionController
+from app.models import DEFAULT_LIST_ID, CollectionVersion, ToDo, record_changes
+from app.queries import BadRequest, changes_since, paginate, parse_fields, parse_limit, parse_since, search
+from app.validation import UPDATE_FIELDS, new_todo_values, validate_todo
+
+
+# IDs of the items of list `list_id` created, updated and deleted by a write.
+Changes = namedtuple('Changes', 'list_id created updated deleted', defaults=((), (), ()))
+
+
+# An `item_etag`, as sent back by clients in If-Match.
+ITEM_ETAG = re.compile(r'todo-(?P<id>\d+)-v(?P<version>\d+)(-[\w,]+)?')
+
+
+def item_etag(id, version, fields=None):
+    """ETag of an item response; `fields` are the columns of a sparse fieldset."""
+    etag = f'todo-{id}-v{version}'
+    if fields is not None:
+        etag += '-' + ','.join(column.key for column in fields)
+    return etag
+
+
+def collection_etag(list_id, version, params, kind='todos'):
+    """
+    ETag of a list response: the list, its collection version and the query
+    `params`. Versions count per list, so the list ID keeps lists apart, and
+    `kind` keeps apart the routes reading a list (`todos`, `search`).
+    """
+    query = '&'.join(f'{k}={v}' for k, v in sorted(params))
+    digest = hashlib.sha1(query.encode()).hexdigest()[:16]
+    return f'{kind}-{list_id}-v{version}-{digest}'
+
+
+def not_modified(etag):
+    """Return a 304 response if the client already holds `etag`, else None."""
+    held = held_etag(request.if_none_match, etag)
+    if held is None:
+        return None
+    response = current_app.response_class(status=304)
+    response.set_etag(held)
+    return response
+
+
+def if_match_versions(header, id):
+    """
+    Versions of item `id` that an `If-Match` header accepts, or None when
+    any version will do (no header, or `*`). An empty set means no listed
+    ETag names a version of this item, so the precondition fails.
+    """
+    if header is None:
+        return None
+    etags = parse_etags(header)
+    if etags.star_tag:
+        return None
+    versions = set()
+    for etag in etags.as_set():
+        match = ITEM_ETAG.fullmatch(identity_etag(etag))
+        if match and int(match['id']) == id:
+            versions.add(int(match['version']))
+    return versions
+
+
+def update_statement(list_id, id, values, versions, columns):
+    """
+    `UPDATE ... RETURNING` of item `id` that writes `values`, bumps the
+    version and returns `columns` plus the new version. With `versions` (see
+    `if_match_versions`) it only matches the item at one of those versions.
+    Without `values` there is nothing to write, and it is a `SELECT` of the
+    same row, so the version stays as it is.
+    """
+    condition = [ToDo.id == id, ToDo.list_id == list_id]
+    if versions is not None:
+        condition.append(ToDo.version.in_(versions))
+    if not values:
+        return select(*columns, ToDo.version).where(*condition)
+    return update(ToDo).where(*condition).values(**values, version=ToDo.version + 1).returning(*columns, ToDo.version)
+
+
+def delete_statement(list_id, id, versions):
+    """`DELETE ... RETURNING id` of item `id`, conditional like `update_statement`."""
+    stmt = delete(ToDo).where(ToDo.id == id, ToDo.list_id == list_id)
+    if versions is not None:
+        stmt = stmt.where(ToDo.version.in_(versions))
+    return stmt.returning(ToDo.id)
+
+
+def precondition_required():
+    """Return a 428 response if `If-Match` is required but missing, else None."""
+    if not current_app.config['TODOS_REQUIRE_IF_MATCH'] or 'If-Match' in request.headers:
+        return None
+    return jsonify({'error': 'If-Match is required'}), 428
+
+
+def precondition_failed(list_id, id):
+    """
+    Answer a conditional write that matched no row: 404 if the item does not
+    exist, else 412 with the ETag of its current version.
+    """
+    with db.session() as session:
+        version = session.scalar(
+            select(ToDo.version).where(ToDo.id == id, ToDo.list_id == list_id)
+        )
+    if version is None:
+        return jsonify({'error': 'ToDo item not found'}), 404
+    response = jsonify({'error': 'ToDo item was modified; fetch it again and retry'})
+    response.status_code = 412
+    response.set_etag(item_etag(id, version))
+    return response
+
+
+def get_todo(session, list_id, id):
+    """Load item `id` of list `list_id`; None if it does not exist or is in another list."""
+    todo = session.get(ToDo, id)
+    if todo is None or todo.list_id != list_id:
+        return None
+    return todo
+
+
+def commit_changes(session, list_id, created=(), updated=(), deleted=()):
+    """
+    Commit a write that created, updated and deleted the given TODO item IDs
+    of list `list_id`.
+
+    Every write path goes through here so that the change is recorded (see
+    `record_changes`) in the same transaction. Once committed, the changes
+    are published to subscribers.
+    """
+    seq = record_changes(session, list(created) + list(updated), deleted, list_id)
+    session.commit()
+    changes_committed(session, list_id, seq, created, updated, deleted)
+
+
+def changes_committed(session, list_id, seq, created=(), updated=(), deleted=()):
+    """Notify subscribers of a committed write."""
+    publish_changes(get_broker(), session, list_id, seq, created, updated, deleted)
+
+
+def run_write(write):
+    """
+    Run `write(session)` and commit it; return its result once committed.
+
+    `write` returns `(result, changes)`, with `changes` a `Changes` or None
+    when nothing was written. With `WRITE_GROUP_COMMIT` the write is handed
+    to the group-commit writer (see `app.writer`) and committed along with
+    other requests' writes; otherwise it gets a transaction of its own.
+    """
+    writer = current_app.extensions.get('todo_writer')
+    if writer is not None:
+        future = writer.submit(write)
+        try:
+            return future.result(current_app.config['WRITE_TIMEOUT'])
+        except TimeoutError:
+            # A write still queued is withdrawn, so a retry cannot apply it twice;
+            # one the writer has started decides the response.
+            if future.cancel():
+                abort(503)
+            return future.result()
+    with db.session() as session:
+        result, changes = write(session)
+        if changes is not None:
+            commit_changes(session, *changes)
+        return result
+
+
+def publish_changes(broker, session, list_id, seq, created, updated, deleted):
+    """Publish one event per changed item, if anyone is listening."""
+    if not broker.active():
+        return
+    items = {}
+    changed = list(created) + list(updated)
+    if changed:
+        stmt = select(*ToDo.serialized_columns()).where(ToDo.id.in_(changed))
+        items = {row.id: row._asdict() for row in session.execute(stmt)}
+    for op, ids in (('created', created), ('updated', updated)):
+        for id in ids:
+            broker.publish({'list_id': list_id, 'seq': seq, 'op': op, 'id': id, 'item': items.get(id)})
+    for id in deleted:
+        broker.publish({'list_id': list_id, 'seq': seq, 'op': 'deleted', 'id': id})
+
+
+def set_next_cursor(response, next_cursor):
+    """Advertise the next page through the `X-Next-Cursor` and `Link` headers."""
+    if next_cursor is None:
+        return response
+    args = request.args.to_dict()
+    args['after'] = next_cursor
+    response.headers['X-Next-Cursor'] = next_cursor
+    response.headers['Link'] = f'<{request.path}?{urlencode(args)}>; rel="next"'
+    return response
+
+
+def iter_export(list_id, batch_size, as_array, dumps, columns=None):
+    """
+    Yield every item of a TODO list as NDJSON lines (or as chunks of one JSON
+    array), with the given `columns` (by default every serialized one).
+
+    Rows are fetched `batch_size` at a time as plain column tuples, so neither
+    ORM objects nor the full payload are ever held in memory at once.
+    """
+    stmt = (
+        select(*(columns or ToDo.serialized_columns()))
+        .where(ToDo.list_id == list_id)
+        .order_by(ToDo.id)
+        .execution_options(yield_per=batch_size)
+    )
+    first = True
+    if as_array:
+        yield '['
+    with db.session() as session:
+        for rows in session.execute(stmt).partitions():
+            lines = [dumps(row._asdict()) for row in rows]
+            if as_array:
+                chunk = ','.join(lines)
+                yield chunk if first else ',' + chunk
+            else:
+                yield '\n'.join(lines) + '\n'
+            first = False
+    if as_array:
+        yield ']'
+
+
+def get_batch(data, max_size):
+    """Check that a batch request body is a list within the size limit."""
+    if not isinstance(data, list):
+        raise BadRequest('Request body must be a JSON array')
+    if len(data) > max_size:
+        raise BadRequest(f'Batch size must not exceed {max_size}')
+    return data
+
+
+def batch_errors(items, partial=False):
+    """Validate every item of a batch, returning per-item errors."""
+    errors = []
+    seen = set()
+    for index, item in enumerate(items):
+        error = validate_todo(item, partial=partial)
+        if error is None and partial:
+            if not isinstance(item.get('id'), int) or isinstance(item['id'], bool):
+                error = 'ID must be an integer'
+            elif item['id'] in seen:
+                error = 'Duplicate ID'
+            else:
+                seen.add(item['id'])
+        if error:
+            errors.append({'index': index, 'error': error})
+    return errors
+
+
+def batch_update_statements(list_id, items):
+    """
+    `(statement, parameters)` pairs writing a batch of validated partial
+    updates, one executemany per set of fields sent. Each item only sets the
+    fields it carries, and the version is incremented in SQL, so a write
+    committed by someone else meanwhile is neither overwritten nor counted
+    twice.
+    """
+    groups = {}
+    for item in items:
+        fields = tuple(field for field in UPDATE_FIELDS if field in item)
+        groups.setdefault(fields, []).append(item)
+    table = ToDo.__table__
+    for fields, group in groups.items():
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam('item_id'), table.c.list_id == list_id)
+            .values(version=table.c.version + 1, **{field: bindparam(f'new_{field}') for field in fields})
+        )
+        params = [
+            dict({'item_id': item['id']}, **{f'new_{field}': item[field] for field in fields})
+            for item in group
+        ]
+        yield stmt, params
+
 
 def setup_routes(app):
+    # `/todos/...` serves the default list; don't redirect `/lists/1/todos/...` there.
+    app.url_map.redirect_defaults = False
+
     @app.route('/', methods=['GET'])
     def home():
         """Redirect to Swagger UI"""
         return redirect('/apidocs')
 
-    @app.route('/todos', methods=['GET'])
-    def get_todos():
+    @app.route('/todos', methods=['GET'], defaults={'list_id': DEFAULT_LIST_ID})
+    @app.route('/lists/<int:list_id>/todos', methods=['GET'])
+    def get_todos(list_id):
         """
-        Retrieve a list of all TODO items.
+        Retrieve a page of TODO items, optionally filtered and sorted.
+        Items are ordered by ID unless `sort` is given. When more items exist, the cursor of the next page is returned in the
+        `X-Next-Cursor` header (and as a `Link` header with `rel="next"`).
         ---
+        parameters:
+          - name: limit
+            in: query
+            required: false
+            description: Maximum number of items to return (defaults to 100, capped at 1000)
+            schema:
+              type: integer
+          - name: after
+            in: query
+            required: false
+            description: Opaque cursor taken from the `X-Next-Cursor` header of the previous page
+            schema:
+              type: string
+          - name: completed
+            in: query
+            required: false
+            description: Only return items with this completion status
+            schema:
+              type: boolean
+          - name: priority
+            in: query
+            required: false
+            description: Only return items with this priority, or one of a comma separated list of priorities
+            schema:
+              type: string
+              example: "1,2"
+          - name: sort
+            in: query
+            required: false
+            description: Comma separated fields to sort by (id, title, completed, priority), prefixed with `-` for descending order
+            schema:
+              type: string
+              example: "priority,-id"
+          - name: fields
+            in: query
+            required: false
+            description: Comma separated fields to return (id, title, completed, description, priority); all by default
+            schema:
+              type: string
+              example: "id,title,completed"
+          - name: If-None-Match
+            in: header
+            required: false
+            description: ETag of a previously received response; answered with 304 if unchanged
+            schema:
+              type: string
         responses:
           200:
             description: A list of TODO items
@@ -39,16 +376,329 @@ def setup_routes(app):
                       priority:
                         type: integer
                         description: The priority of the TODO item
+          304:
+            description: Not modified, the client's copy (If-None-Match) is current
+          400:
+            description: Bad request, invalid limit, cursor, filter or sort
+            content:
+              application/json:
+                schema:
+                  type: object
+                  properties:
+                    error:
+                      type: string
+                      example: "Invalid cursor"
+        """
+        with db.session() as session:
+            # Read the version before the rows so the ETag is never newer than the body.
+            version = CollectionVersion.current(session, CollectionVersion.list_collection(list_id))
+        etag = collection_etag(list_id, version, request.args.items(multi=True))
+        response = not_modified(etag)
+        if response is not None:
+            return response
+        cache = get_cache()
+        key = cache.list_key(list_id, version, request.args)
+        cached = cache.lookup(key)
+        if cached is not None:
+            return cached
+        with db.session() as session:
+            try:
+                todos, next_cursor = paginate(
+                    session,
+                    request.args,
+                    current_app.config['TODOS_DEFAULT_PAGE_SIZE'],
+                    current_app.config['TODOS_MAX_PAGE_SIZE'],
+                    list_id,
+                )
+            except BadRequest as e:
+                return jsonify({'error': str(e)}), 400
+            response = jsonify(todos)
+            set_next_cursor(response, next_cursor)
+            response.set_etag(etag)
+            return cache.store(key, response, headers=('X-Next-Cursor', 'Link', 'ETag'))
+
+    @app.route('/todos/search', methods=['GET'], defaults={'list_id': DEFAULT_LIST_ID})
+    @app.route('/lists/<int:list_id>/todos/search', methods=['GET'])
+    def search_todos(list_id):
+        """
+        Full-text search over the title and description of TODO items.
+        Every word of `q` must match, as a prefix, in the title or the description. Results are ordered by relevance
+        (bm25, title matches weigh more) and paginated like `GET /todos`, with the cursor of the next page in the
+        `X-Next-Cursor` and `Link` headers.
+        ---
+        parameters:
+          - name: q
+            in: query
+            required: true
+            description: Words to search for
+            schema:
+              type: string
+              example: "groceries milk"
+          - name: limit
+            in: query
+            required: false
+            description: Maximum number of items to return (defaults to 100, capped at 1000)
+            schema:
+              type: integer
+          - name: after
+            in: query
+            required: false
+            description: Opaque cursor taken from the `X-Next-Cursor` header of the previous page
+            schema:
+              type: string
+          - name: completed
+            in: query
+            required: false
+            description: Only return items with this completion status
+            schema:
+              type: boolean
+          - name: priority
+            in: query
+            required: false
+            description: Only return items with this priority, or one of a comma separated list of priorities
+            schema:
+              type: string
+          - name: fields
+            in: query
+            required: false
+            description: Comma separated fields to return (id, title, completed, description, priority); all by default
+            schema:
+              type: string
+              example: "id,title,completed"
+          - name: If-None-Match
+            in: header
+            required: false
+            description: ETag of a previously received response; answered with 304 if unchanged
+            schema:
+              type: string
+        responses:
+          200:
+            description: The matching TODO items, best match first
+          304:
+            description: Not modified, the client's copy (If-None-Match) is current
+          400:
+            description: Bad request, missing query or invalid limit, cursor or filter
+            content:
+              application/json:
+                schema:
+                  type: object
+                  properties:
+                    error:
+                      type: string
+                      example: "Search query q is required"
+        """
+        with db.session() as session:
+            etag = collection_etag(
+                list_id,
+                CollectionVersion.current(session, CollectionVersion.list_collection(list_id)),
+                request.args.items(multi=True),
+                kind='search',
+            )
+        response = not_modified(etag)
+        if response is not None:
+            return response
+        with db.session() as session:
+            try:
+                todos, next_cursor = search(
+                    session,
+                    request.args,
+                    current_app.config['TODOS_DEFAULT_PAGE_SIZE'],
+                    current_app.config['TODOS_MAX_PAGE_SIZE'],
+                    list_id,
+                )
+            except BadRequest as e:
+                return jsonify({'error': str(e)}), 400
+        response = jsonify(todos)
+        set_next_cursor(response, next_cursor)
+        response.set_etag(etag)
+        return response
+
+    @app.route('/todos/export', methods=['GET'], defaults={'list_id': DEFAULT_LIST_ID})
+    @app.route('/lists/<int:list_id>/todos/export', methods=['GET'])
+    def export_todos(list_id):
+        """
+        Stream every TODO item.
+        Items are written as newline-delimited JSON (`application/x-ndjson`),
+        one object per line, unless the client only accepts `application/json`,
+        in which case a single JSON array is streamed in chunks.
+        ---
+        parameters:
+          - name: fields
+            in: query
+            required: false
+            description: Comma separated fields to return (id, title, completed, description, priority); all by default
+            schema:
+              type: string
+        responses:
+          200:
+            description: All TODO items, streamed
+            content:
+              application/x-ndjson:
+                schema:
+                  type: object
+                  properties:
+                    id:
+                      type: integer
+                      description: The TODO item's ID
+                    title:
+                      type: string
+                      description: The title of the TODO item
+                    completed:
+                      type: boolean
+                      description: Completion status of the TODO item
+                    description:
+                      type: string
+                      description: The description of the TODO item
+                    priority:
+                      type: integer
+                      description: The priority of the TODO item
+        """
+        mimetype = request.accept_mimetypes.best_match(
+            ['application/x-ndjson', 'application/json'],
+            default='application/x-ndjson',
+        )
+        as_array = mimetype == 'application/json'
+        batch_size = current_app.config['TODOS_EXPORT_BATCH_SIZE']
+        try:
+            columns = parse_fields(request.args)
+        except BadRequest as e:
+            return jsonify({'error': str(e)}), 400
+        return Response(
+            stream_with_context(iter_export(list_id, batch_size, as_array, current_app.json.dumps, columns)),
+            mimetype=mimetype,
+        )
+
+    @app.route('/todos/changes', methods=['GET'], defaults={'list_id': DEFAULT_LIST_ID})
+    @app.route('/lists/<int:list_id>/todos/changes', methods=['GET'])
+    def get_todo_changes(list_id):
+        """
+        Retrieve the TODO items created, updated or deleted since a sequence.
+        Every write is stamped with the next collection sequence. Start with
+        `since=0` and pass the returned `since` on the next call to receive
+        only what changed in between; repeat while `has_more` is true.
+        ---
+        parameters:
+          - name: since
+            in: query
+            required: false
+            description: Sequence returned by the previous call (0 for everything)
+            schema:
+              type: integer
+          - name: limit
+            in: query
+            required: false
+            description: Maximum number of changes to return (defaults to 100, capped at 1000)
+            schema:
+              type: integer
+        responses:
+          200:
+            description: The changes, oldest first
+            content:
+              application/json:
+                schema:
+                  type: object
+                  properties:
+                    changes:
+                      type: array
+                      items:
+                        type: object
+                        properties:
+                          seq:
+                            type: integer
+                            description: Sequence of the write
+                          op:
+                            type: string
+                            enum: [upsert, delete]
+                          id:
+                            type: integer
+                            description: The TODO item's ID
+                          item:
+                            type: object
+                            description: The TODO item, for upserts
+                    since:
+                      type: integer
+                      description: Value of `since` for the next call
+                    has_more:
+                      type: boolean
+                      description: Whether more changes are waiting
+          400:
+            description: Bad request, invalid since or limit
         """
+        try:
+            since = parse_since(request.args)
+            limit = parse_limit(
+                request.args,
+                app.config['TODOS_DEFAULT_PAGE_SIZE'],
+                app.config['TODOS_MAX_PAGE_SIZE'],
+            )
+        except BadRequest as e:
+            return jsonify({'error': str(e)}), 400
         with db.session() as session:
-            todos = session.query(ToDo).all()
-            return jsonify([todo.to_dict() for todo in todos])
+            changes, next_since, has_more = changes_since(session, since, limit, list_id)
+        return jsonify({'changes': changes, 'since': next_since, 'has_more': has_more})
+
+    @app.route('/todos/events', methods=['GET'], defaults={'list_id': DEFAULT_LIST_ID})
+    @app.route('/lists/<int:list_id>/todos/events', methods=['GET'])
+    def todo_events(list_id):
+        """
+        Subscribe to TODO item changes as Server-Sent Events.
+        Each create, update and delete is pushed as an event named `created`,
+        `updated` or `deleted` whose `id` is the change sequence, so a client
+        that reconnects can catch up with `GET /todos/changes?since=<id>`.
+        A comment is sent on idle connections as a heartbeat. Clients that
+        fall too far behind receive a `dropped` event and are disconnected.
+        ---
+        responses:
+          200:
+            description: An endless stream of change events
+            content:
+              text/event-stream:
+                schema:
+                  type: object
+                  properties:
+                    seq:
+                      type: integer
+                      description: Change sequence of the write
+                    op:
+                      type: string
+                      enum: [created, updated, deleted]
+                    id:
+                      type: integer
+                      description: The TODO item's ID
+                    item:
+                      type: object
+                      description: The TODO item, for created and updated events
+          503:
+            description: This process already serves `EVENTS_MAX_STREAMS` event streams
+        """
+        streams = app.extensions.get('todo_event_streams')
+        if streams is not None and not streams.acquire():
+            return AdmissionController.reject(503, 'Too many event streams', app.config['EVENTS_HEARTBEAT'])
+        broker = get_broker()
+        # Subscribe before responding so no event published from now on is missed.
+        subscription = broker.subscribe()
+        stream = event_stream(broker, subscription, app.config['EVENTS_HEARTBEAT'], list_id)
+        response = Response(stream, mimetype='text/event-stream')
+        if streams is not None:
+            response.call_on_close(streams.release)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
 
-    @app.route('/todos', methods=['POST'])
-    def create_todo():
+    @app.route('/todos', methods=['POST'], defaults={'list_id': DEFAULT_LIST_ID})
+    @app.route('/lists/<int:list_id>/todos', methods=['POST'])
+    @idempotent
+    def create_todo(list_id):
         """
         Create a new TODO item.
         ---
+        parameters:
+          - name: Idempotency-Key
+            in: header
+            required: false
+            description: Unique key of the request; a retry with the same key gets the original response
+            schema:
+              type: string
         requestBody:
           required: true
           content:
@@ -101,23 +751,28 @@ def setup_routes(app):
                     error:
                       type: string
                       example: "Title is required"
+          409:
+            description: A request with the same Idempotency-Key is still in progress
+          422:
+            description: The Idempotency-Key was already used for a different request
         """
         data = request.get_json() or {}
-        if 'title' not in data:
-            return jsonify({'error': 'Title is required'}), 400
-        if 'priority' in data and data['priority'] not in [1, 2, 3]:
-            return jsonify({'error': 'Priority must be 1, 2, or 3'}), 400
-        todo = ToDo(
-          title=data['title'], 
-          description=data.get('description', ''), 
-          priority=data.get('priority', 1))
-        with db.session() as session:
+        error = validate_todo(data)
+        if error:
+            return jsonify({'error': error}), 400
+        values = new_todo_values(data)
+
+        def write(session):
+            todo = ToDo(list_id=list_id, **values)
             session.add(todo)
-            session.commit()
-            return jsonify(todo.to_dict()), 201
+            session.flush()
+            return todo.to_dict(), Changes(list_id, created=[todo.id])
 
-    @app.route('/todos/<int:id>', methods=['GET'])
-    def get_todo_by_id(id):
+        return jsonify(run_write(write)), 201
+
+    @app.route('/todos/<int:id>', methods=['GET'], defaults={'list_id': DEFAULT_LIST_ID})
+    @app.route('/lists/<int:list_id>/todos/<int:id>', methods=['GET'])
+    def get_todo_by_id(list_id, id):
         """
         Retrieve a TODO item by ID.
         ---
@@ -128,6 +783,19 @@ def setup_routes(app):
             description: The TODO item's ID
             schema:
               type: integer
+          - name: fields
+            in: query
+            required: false
+            description: Comma separated fields to return (id, title, completed, description, priority); all by default
+            schema:
+              type: string
+              example: "id,title,completed"
+          - name: If-None-Match
+            in: header
+            required: false
+            description: ETag of a previously received response; answered with 304 if unchanged
+            schema:
+              type: string
         responses:
           200:
             description: The requested TODO item
@@ -151,6 +819,8 @@ def setup_routes(app):
                     priority:
                       type: integer
                       description: The priority of the TODO item
+          304:
+            description: Not modified, the client's copy (If-None-Match) is current
           404:
             description: TODO item not found
             content:
@@ -162,14 +832,54 @@ def setup_routes(app):
                       type: string
                       example: "ToDo item not found"
         """
+        if 'fields' in request.args:
+            return get_todo_fields(list_id, id)
+        with db.session() as session:
+            version = session.scalar(
+                select(ToDo.version).where(ToDo.id == id, ToDo.list_id == list_id)
+            )
+        if version is None:
+            abort(404)
+        response = not_modified(item_etag(id, version))
+        if response is not None:
+            return response
+        cache = get_cache()
+        cached = cache.lookup(cache.item_key(id, version))
+        if cached is not None:
+            return cached
         with db.session() as session:
-            todo = session.get(ToDo, id)
+            todo = get_todo(session, list_id, id)
             if todo is None:
                 abort(404)
-            return jsonify(todo.to_dict())
+            response = jsonify(todo.to_dict())
+            response.set_etag(item_etag(todo.id, todo.version))
+            return cache.store(cache.item_key(todo.id, todo.version), response, headers=('ETag',))
 
-    @app.route('/todos/<int:id>', methods=['PUT'])
-    def update_todo(id):
+    def get_todo_fields(list_id, id):
+        """`GET /todos/<id>?fields=...`: one query for the fields and version, uncached."""
+        try:
+            columns = parse_fields(request.args)
+        except BadRequest as e:
+            return jsonify({'error': str(e)}), 400
+        with db.session() as session:
+            row = session.execute(
+                select(*columns, ToDo.version).where(ToDo.id == id, ToDo.list_id == list_id)
+            ).one_or_none()
+        if row is None:
+            abort(404)
+        etag = item_etag(id, row.version, columns)
+        response = not_modified(etag)
+        if response is not None:
+            return response
+        item = row._asdict()
+        del item['version']
+        response = jsonify(item)
+        response.set_etag(etag)
+        return response
+
+    @app.route('/todos/<int:id>', methods=['PUT'], defaults={'list_id': DEFAULT_LIST_ID})
+    @app.route('/lists/<int:list_id>/todos/<int:id>', methods=['PUT'])
+    def update_todo(list_id, id):
         """
         Update a TODO item by ID.
         ---
@@ -180,6 +890,12 @@ def setup_routes(app):
             description: The TODO item's ID
             schema:
               type: integer
+          - name: If-Match
+            in: header
+            required: false
+            description: ETag of the item as last read; the request fails with 412 if the item has changed since
+            schema:
+              type: string
         requestBody:
           required: true
           content:
@@ -246,23 +962,119 @@ def setup_routes(app):
                     error:
                       type: string
                       example: "Priority must be 1, 2, or 3"
+          412:
+            description: Precondition failed, the item changed since the ETag given in If-Match
+          428:
+            description: If-Match is required (TODOS_REQUIRE_IF_MATCH) but was not sent
         """
-        with db.session() as session:
-            todo = session.get(ToDo, id)
-            if todo is None:
-                abort(404)
-            data = request.get_json() or {}
-            todo.title = data.get('title', todo.title)
-            todo.completed = data.get('completed', todo.completed)
-            todo.description = data.get('description', todo.description)
-            if 'priority' in data and data['priority'] not in [1, 2, 3]:
-              return jsonify({'error': 'Priority must be 1, 2, or 3'}), 400
-            todo.priority = data.get('priority', todo.priority)
-            session.commit()
-            return jsonify(todo.to_dict())
-
-    @app.route('/todos/<int:id>', methods=['DELETE'])
-    def delete_todo(id):
+        return update_item(list_id, id)
+
+    @app.route('/todos/<int:id>', methods=['PATCH'], defaults={'list_id': DEFAULT_LIST_ID})
+    @app.route('/lists/<int:list_id>/todos/<int:id>', methods=['PATCH'])
+    def patch_todo(list_id, id):
+        """
+        Partially update a TODO item by ID.
+        Only the fields present in the body are changed, with a single
+        `UPDATE ... RETURNING` statement that does not load the item first.
+        ---
+        parameters:
+          - name: id
+            in: path
+            required: true
+            description: The TODO item's ID
+            schema:
+              type: integer
+          - name: fields
+            in: query
+            required: false
+            description: Comma separated fields to return (id, title, completed, description, priority); all by default
+            schema:
+              type: string
+              example: "id,completed"
+          - name: If-Match
+            in: header
+            required: false
+            description: ETag of the item as last read; the request fails with 412 if the item has changed since
+            schema:
+              type: string
+        requestBody:
+          required: true
+          content:
+            application/json:
+              schema:
+                type: object
+                properties:
+                  title:
+                    type: string
+                    description: The updated title of the TODO item
+                    example: "Updated Task"
+                  completed:
+                    type: boolean
+                    description: The updated completion status
+                    example: true
+                  description:
+                    type: string
+                    description: The description of the TODO item
+                  priority:
+                    type: integer
+                    description: The priority of the TODO item
+        responses:
+          200:
+            description: The updated TODO item, limited to `fields` if given
+          404:
+            description: TODO item not found
+          400:
+            description: Bad request, invalid field value or unknown field in `fields`
+          412:
+            description: Precondition failed, the item changed since the ETag given in If-Match
+          428:
+            description: If-Match is required (TODOS_REQUIRE_IF_MATCH) but was not sent
+        """
+        return update_item(list_id, id)
+
+    def update_item(list_id, id):
+        """
+        Shared body of `PUT` and `PATCH /todos/<id>`: write the fields present
+        in the request body with one `UPDATE ... RETURNING`, conditional on
+        the version named by `If-Match` if any. A body without fields writes
+        nothing and returns the item as it is.
+        """
+        response = precondition_required()
+        if response is not None:
+            return response
+        data = request.get_json() or {}
+        error = validate_todo(data, partial=True)
+        if error:
+            return jsonify({'error': error}), 400
+        try:
+            columns = parse_fields(request.args)
+        except BadRequest as e:
+            return jsonify({'error': str(e)}), 400
+        values = {field: data[field] for field in UPDATE_FIELDS if field in data}
+        stmt = update_statement(list_id, id, values, if_match_versions(request.headers.get('If-Match'), id), columns)
+
+        def write(session):
+            row = session.execute(stmt, execution_options={'synchronize_session': False}).one_or_none()
+            if row is None:
+                return None, None
+            return row._asdict(), Changes(list_id, updated=[id])
+
+        if values:
+            item = run_write(write)
+        else:
+            with db.session() as session:
+                row = session.execute(stmt).one_or_none()
+            item = row._asdict() if row is not None else None
+        if item is None:
+            return precondition_failed(list_id, id)
+        version = item.pop('version')
+        response = jsonify(item)
+        response.set_etag(item_etag(id, version, columns if 'fields' in request.args else None))
+        return response
+
+    @app.route('/todos/<int:id>', methods=['DELETE'], defaults={'list_id': DEFAULT_LIST_ID})
+    @app.route('/lists/<int:list_id>/todos/<int:id>', methods=['DELETE'])
+    def delete_todo(list_id, id):
         """
         Delete a TODO item by ID.
         ---
@@ -273,6 +1085,12 @@ def setup_routes(app):
             description: The TODO item's ID
             schema:
               type: integer
+          - name: If-Match
+            in: header
+            required: false
+            description: ETag of the item as last read; the request fails with 412 if the item has changed since
+            schema:
+              type: string
         responses:
           200:
             description: Confirmation message
@@ -294,12 +1112,301 @@ def setup_routes(app):
                     error:
                       type: string
                       example: "ToDo item not found"
+          412:
+            description: Precondition failed, the item changed since the ETag given in If-Match
+          428:
+            description: If-Match is required (TODOS_REQUIRE_IF_MATCH) but was not sent
         """
-        with db.session() as session:
-            todo = session.get(ToDo, id)
-            if not todo:
+        response = precondition_required()
+        if response is not None:
+            return response
+        versions = if_match_versions(request.headers.get('If-Match'), id)
+        stmt = delete_statement(list_id, id, versions)
+
+        def write(session):
+            deleted = session.execute(stmt, execution_options={'synchronize_session': False}).one_or_none()
+            if deleted is None:
+                return False, None
+            return True, Changes(list_id, deleted=[id])
+
+        if not run_write(write):
+            if versions is None:
                 return jsonify({'error': 'ToDo item not found'}), 404
+            return precondition_failed(list_id, id)
+        return jsonify({'message': 'ToDo item deleted'}), 200
+
+    @app.route('/todos/batch', methods=['POST'], defaults={'list_id': DEFAULT_LIST_ID})
+    @app.route('/lists/<int:list_id>/todos/batch', methods=['POST'])
+    @idempotent
+    def create_todos_batch(list_id):
+        """
+        Create several TODO items in one transaction.
+        Every item is validated with the same rules as `POST /todos`; if any
+        item is invalid nothing is written and the errors are returned.
+        ---
+        parameters:
+          - name: Idempotency-Key
+            in: header
+            required: false
+            description: Unique key of the request; a retry with the same key gets the original response
+            schema:
+              type: string
+        requestBody:
+          required: true
+          content:
+            application/json:
+              schema:
+                type: array
+                items:
+                  type: object
+                  properties:
+                    title:
+                      type: string
+                      description: The title of the new TODO item
+                      example: "New Task"
+                    description:
+                      type: string
+                      description: The description of the new TODO item
+                      example: "This is a new task"
+                    priority:
+                      type: integer
+                      description: The priority of the new TODO item
+                      example: 1
+        responses:
+          201:
+            description: The result for each item, in request order
+            content:
+              application/json:
+                schema:
+                  type: array
+                  items:
+                    type: object
+                    properties:
+                      status:
+                        type: integer
+                        example: 201
+                      item:
+                        type: object
+                        description: The created TODO item
+          400:
+            description: Bad request, one or more items are invalid
+            content:
+              application/json:
+                schema:
+                  type: object
+                  properties:
+                    errors:
+                      type: array
+                      items:
+                        type: object
+                        properties:
+                          index:
+                            type: integer
+                            example: 0
+                          error:
+                            type: string
+                            example: "Title is required"
+          409:
+            description: A request with the same Idempotency-Key is still in progress
+          422:
+            description: The Idempotency-Key was already used for a different request
+        """
+        try:
+            items = get_batch(request.get_json(), app.config['TODOS_MAX_BATCH_SIZE'])
+        except BadRequest as e:
+            return jsonify({'error': str(e)}), 400
+        errors = batch_errors(items)
+        if errors:
+            return jsonify({'errors': errors}), 400
+        if not items:
+            return jsonify([]), 201
+        with db.session() as session:
+            stmt = insert(ToDo).returning(
+                *ToDo.serialized_columns(), sort_by_parameter_order=True
+            )
+            values = [dict(new_todo_values(item), list_id=list_id) for item in items]
+            rows = session.execute(stmt, values).all()
+            commit_changes(session, list_id, created=[row.id for row in rows])
+        return jsonify([{'status': 201, 'item': row._asdict()} for row in rows]), 201
 
-            session.delete(todo)
-            session.commit()
-            return jsonify({'message': 'ToDo item deleted'}), 200
+    @app.route('/todos/batch', methods=['PATCH'], defaults={'list_id': DEFAULT_LIST_ID})
+    @app.route('/lists/<int:list_id>/todos/batch', methods=['PATCH'])
+    def update_todos_batch(list_id):
+        """
+        Update several TODO items in one transaction.
+        Each item must carry the `id` of the item to update plus the fields to
+        change, validated with the same rules as `PUT /todos/{id}`. Unknown
+        IDs are reported per item with status 404; the other items are updated.
+        ---
+        requestBody:
+          required: true
+          content:
+            application/json:
+              schema:
+                type: array
+                items:
+                  type: object
+                  properties:
+                    id:
+                      type: integer
+                      description: The TODO item's ID
+                      example: 1
+                    title:
+                      type: string
+                      description: The updated title of the TODO item
+                      example: "Updated Task"
+                    completed:
+                      type: boolean
+                      description: The updated completion status
+                      example: true
+                    description:
+                      type: string
+                      description: The description of the TODO item
+                      example: "This is a new task"
+                    priority:
+                      type: integer
+                      description: The priority of the TODO item
+                      example: 1
+        responses:
+          200:
+            description: The result for each item, in request order
+            content:
+              application/json:
+                schema:
+                  type: array
+                  items:
+                    type: object
+                    properties:
+                      status:
+                        type: integer
+                        example: 200
+                      item:
+                        type: object
+                        description: The updated TODO item
+                      error:
+                        type: string
+                        example: "ToDo item not found"
+          400:
+            description: Bad request, one or more items are invalid
+        """
+        try:
+            items = get_batch(request.get_json(), app.config['TODOS_MAX_BATCH_SIZE'])
+        except BadRequest as e:
+            return jsonify({'error': str(e)}), 400
+        errors = batch_errors(items, partial=True)
+        if errors:
+            return jsonify({'errors': errors}), 400
+        with db.session() as session:
+            for stmt, params in batch_update_statements(list_id, items):
+                session.execute(stmt, params)
+            # Read back after writing: the rows are locked by the write, and
+            # missing IDs are the ones no UPDATE matched.
+            stmt = select(*ToDo.serialized_columns()).where(
+                ToDo.id.in_([item['id'] for item in items]), ToDo.list_id == list_id
+            )
+            current = {row.id: row._asdict() for row in session.execute(stmt)}
+            if current:
+                commit_changes(session, list_id, updated=list(current))
+        return jsonify([
+            {'status': 200, 'item': current[item['id']]} if item['id'] in current
+            else {'status': 404, 'error': 'ToDo item not found'}
+            for item in items
+        ])
+
+    @app.route('/todos/batch', methods=['DELETE'], defaults={'list_id': DEFAULT_LIST_ID})
+    @app.route('/lists/<int:list_id>/todos/batch', methods=['DELETE'])
+    def delete_todos_batch(list_id):
+        """
+        Delete several TODO items in one transaction.
+        Unknown IDs are reported per item with status 404.
+        ---
+        requestBody:
+          required: true
+          content:
+            application/json:
+              schema:
+                type: array
+                items:
+                  type: integer
+                  description: The TODO item's ID
+                example: [1, 2, 3]
+        responses:
+          200:
+            description: The result for each ID, in request order
+            content:
+              application/json:
+                schema:
+                  type: array
+                  items:
+                    type: object
+                    properties:
+                      id:
+                        type: integer
+                        example: 1
+                      status:
+                        type: integer
+                        example: 200
+          400:
+            description: Bad request, the body must be a list of IDs
+        """
+        try:
+            ids = get_batch(request.get_json(), app.config['TODOS_MAX_BATCH_SIZE'])
+        except BadRequest as e:
+            return jsonify({'error': str(e)}), 400
+        if not all(isinstance(id, int) and not isinstance(id, bool) for id in ids):
+            return jsonify({'error': 'IDs must be integers'}), 400
+        with db.session() as session:
+            found = set(session.scalars(
+                select(ToDo.id).where(ToDo.id.in_(ids), ToDo.list_id == list_id)
+            ))
+            if found:
+                session.execute(delete(ToDo).where(ToDo.id.in_(found)))
+                commit_changes(session, list_id, deleted=found)
+        return jsonify([
+            {'id': id, 'status': 200 if id in found else 404} for id in ids
+        ])
+
+    @app.route('/cache/stats', methods=['GET'])
+    def cache_stats():
+        """
+        Hit and miss counters of the GET response cache.
+        ---
+        responses:
+          200:
+            description: Cache statistics of this process
+            content:
+              application/json:
+                schema:
+                  type: object
+                  properties:
+                    enabled:
+                      type: boolean
+                    hits:
+                      type: integer
+                    misses:
+                      type: integer
+                    hit_ratio:
+                      type: number
+                    size:
+                      type: integer
+                    max_entries:
+                      type: integer
+                    evictions:
+                      type: integer
+        """
+        return jsonify(get_cache().stats())
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """
+        Request and database metrics in the Prometheus text format.
+        ---
+        responses:
+          200:
+            description: Per-route request counts and histograms of wall time, database time, query count and response size
+            content:
+              text/plain:
+                schema:
+                  type: string
+        """
+        return Response(get_metrics().render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,177 @@
+"""
+Production entry point: the app under gunicorn's pre-fork server.
+
+    python -m app.serve --bind 0.0.0.0:8000
+    python -m app.serve --workers 4 --threads 8 --keepalive 75
+    python -m app.serve --event-streams 64
+
+The app is created once in the master (`--preload`, the default) and forked
+into the workers, which each drop the database connections inherited from
+the master. `kill -HUP <master pid>` replaces the workers gracefully; with
+`--preload` they keep the master's code, so ship new code with `kill -USR2`
+(a new master) followed by `kill -TERM` of the old one.
+
+An open `/todos/events` stream holds a worker thread until the client goes
+away, so each worker runs `--threads` threads for requests plus
+`--event-streams` threads for streams, and refuses streams beyond that
+(`EVENTS_MAX_STREAMS`) rather than let them take the request threads.
+
+With more than one worker, idempotency keys are kept in the database
+(`IDEMPOTENCY_STORE = 'sqlite'`) so a retry reaching another worker is
+still replayed; the other in-process state is logged at startup.
+"""
+import argparse
+import logging
+import os
+
+from gunicorn.app.base import BaseApplication
+
+from app import create_app, db
+from app.cache import LRUCache
+from app.events import InProcessBroker
+from app.idempotency import MemoryIdempotencyStore
+from app.ratelimit import MemoryRateLimitBackend
+
+logger = logging.getLogger(__name__)
+
+
+def cpu_count():
+    """Cores this process may run on (the container's share, where known)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def default_options(cores=None, threads=4, event_streams=16):
+    """
+    Gunicorn settings for one box: a worker per core plus one, each with
+    `threads` threads for requests and `event_streams` more for SSE streams.
+    Idle keep-alive connections wait in the worker's poller, not a thread.
+    """
+    cores = cores or cpu_count()
+    return {
+        'bind': '0.0.0.0:5000',
+        'worker_class': 'gthread',
+        'workers': cores + 1,
+        'threads': threads + event_streams,
+        'keepalive': 5,  # seconds; keep above the idle timeout of a load balancer in front
+        'timeout': 30,
+        'graceful_timeout': 30,
+        'max_requests': 10000,  # recycle workers to bound memory growth...
+        'max_requests_jitter': 1000,  # ...without restarting them all at once
+        'preload_app': True,
+        # The worker heartbeat file; on disk it can stall workers when I/O is slow.
+        'worker_tmp_dir': '/dev/shm' if os.path.isdir('/dev/shm') else None,
+    }
+
+
+def after_fork(app):
+    """
+    Make a forked worker open its own database connections and restart the
+    threads of the app's extensions.
+
+    Pooled connections are dropped without being closed (`close=False`): the
+    master still owns them, and closing them from the child would break them.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    replicas = app.extensions.get('todo_replicas')
+    if replicas is not None:
+        replicas.dispose(close=False)
+    broker = app.extensions.get('todo_events')
+    if broker is not None:
+        broker.after_fork()
+
+
+def per_process_state(app):
+    """(setting, consequence) of each extension whose state a worker keeps to itself."""
+    state = []
+    if isinstance(app.extensions.get('todo_events'), InProcessBroker):
+        state.append(('EVENTS_BROKER', 'streams only see writes made by their own worker'))
+    cache = app.extensions.get('todo_cache')
+    if cache is not None and cache.enabled and isinstance(cache.backend, LRUCache):
+        state.append(('CACHE_BACKEND', 'each worker warms its own cache'))
+    controller = app.extensions.get('todo_ratelimit')
+    if controller is not None and isinstance(controller.backend, MemoryRateLimitBackend):
+        state.append(('RATELIMIT_BACKEND', 'each worker allows the full rate'))
+    if isinstance(app.extensions.get('todo_idempotency'), MemoryIdempotencyStore):
+        state.append(('IDEMPOTENCY_STORE', 'a retry reaching another worker runs again'))
+    return state
+
+
+class Server(BaseApplication):
+    """
+    Gunicorn application serving the app made by `factory` with `options`.
+
+    With `preload_app` the app is made in the master and inherited by the
+    workers, which then run `after_fork`; otherwise each worker makes its own.
+    """
+
+    def __init__(self, factory, options):
+        self.factory = factory
+        self.options = options
+        self.application = None
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if value is not None:
+                self.cfg.set(key, value)
+        self.cfg.set('post_fork', self.post_fork)
+
+    def post_fork(self, server, worker):
+        if self.application is not None:
+            after_fork(self.application)
+
+    def load(self):
+        self.application = self.factory()
+        if (self.options.get('workers') or 1) > 1:
+            for setting, consequence in per_process_state(self.application):
+                logger.warning('%s is per worker process: %s', setting, consequence)
+        return self.application
+
+
+def parse_args(argv=None):
+    defaults = default_options()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bind', default=os.environ.get('BIND', defaults['bind']))
+    parser.add_argument('--workers', type=int, default=defaults['workers'])
+    parser.add_argument('--threads', type=int, default=4, help='threads per worker for requests')
+    parser.add_argument('--event-streams', type=int, default=16,
+                        help='event streams per worker, each on a thread of its own')
+    parser.add_argument('--keepalive', type=int, default=defaults['keepalive'])
+    parser.add_argument('--timeout', type=int, default=defaults['timeout'])
+    parser.add_argument('--graceful-timeout', type=int, default=defaults['graceful_timeout'])
+    parser.add_argument('--max-requests', type=int, default=defaults['max_requests'])
+    parser.add_argument('--no-preload', dest='preload', action='store_false',
+                        help='create the app in each worker instead of once in the master')
+    parser.add_argument('--database-uri', help='SQLALCHEMY_DATABASE_URI (default: sqlite:///app.db)')
+    parser.add_argument('--database-profile', default='production', help="DATABASE_PROFILE, see app/database.py")
+    parser.add_argument('--lean', action='store_true', help='LEAN_STARTUP: no migrations, lazy API docs')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = {
+        'DATABASE_PROFILE': args.database_profile,
+        'LEAN_STARTUP': args.lean,
+        'EVENTS_MAX_STREAMS': args.event_streams,
+    }
+    if args.workers > 1:
+        config['IDEMPOTENCY_STORE'] = 'sqlite'
+    if args.database_uri:
+        config['SQLALCHEMY_DATABASE_URI'] = args.database_uri
+    options = default_options(threads=args.threads, event_streams=args.event_streams)
+    options.update(
+        bind=args.bind, workers=args.workers, keepalive=args.keepalive,
+        timeout=args.timeout, graceful_timeout=args.graceful_timeout, max_requests=args.max_requests,
+        max_requests_jitter=args.max_requests // 10, preload_app=args.preload,
+    )
+    Server(lambda: create_app(config), options).run()
+
+
+if __name__ == '__main__':
+    main()
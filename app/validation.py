@@ -0,0 +1,33 @@
+PRIORITIES = [1, 2, 3]
+# Text fields with the longest values their to_do columns hold.
+TEXT_FIELDS = {'title': 128, 'description': 1024}
+
+# Fields a client may set on a TODO item, with the defaults used on create.
+CREATE_FIELDS = {'title': None, 'description': '', 'priority': 1}
+UPDATE_FIELDS = ('title', 'completed', 'description', 'priority')
+
+
+def validate_todo(data, partial=False):
+    """
+    Check a create (or, with `partial`, update) payload.
+
+    Returns the error message to send back to the client, or None when the
+    payload is valid. Shared by the single item and batch endpoints.
+    """
+    if not isinstance(data, dict):
+        return 'Item must be a JSON object'
+    if not partial and 'title' not in data:
+        return 'Title is required'
+    for field, max_length in TEXT_FIELDS.items():
+        if field in data and not (isinstance(data[field], str) and len(data[field]) <= max_length):
+            return f'{field.capitalize()} must be a string of at most {max_length} characters'
+    if 'priority' in data and data['priority'] not in PRIORITIES:
+        return 'Priority must be 1, 2, or 3'
+    if 'completed' in data and not isinstance(data['completed'], bool):
+        return 'Completed must be true or false'
+    return None
+
+
+def new_todo_values(data):
+    """Column values for a new item built from a validated create payload."""
+    return {field: data.get(field, default) for field, default in CREATE_FIELDS.items()}
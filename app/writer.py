@@ -0,0 +1,153 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from flask import current_app
+
+from app import db
+from app.models import record_changes
+from app.routes import changes_committed
+
+logger = logging.getLogger(__name__)
+
+# Put on the queue to stop the writer thread.
+STOP = object()
+
+
+class GroupCommitWriter:
+    """
+    Commit queued writes from a single thread, several per transaction.
+
+    A write is a `write(session)` callable as taken by `run_write`. The
+    writer thread waits for the first queued write, then collects more for
+    up to `max_delay` seconds or `max_batch` writes, and runs them all in one
+    transaction: each in its own savepoint, so a failing write is rolled back
+    (and its error raised to its caller) without affecting the others. One
+    commit, and one fsync, then covers the whole batch, instead of every
+    request queueing for the SQLite write lock to commit on its own.
+    """
+
+    def __init__(self, app, max_batch=64, max_delay=0.002):
+        self.app = app
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.writes = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, write):
+        """Queue `write` and return a Future of its result."""
+        future = Future()
+        with self._lock:
+            # Started on first use, so a process that forks after creating
+            # the app gets its own thread in each child.
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='todo-writer', daemon=True)
+                self._thread.start()
+        self._queue.put((write, future))
+        return future
+
+    def stop(self, timeout=None):
+        """Commit what is queued, then stop the writer thread."""
+        with self._lock:
+            if self._thread is None:
+                return
+            self._queue.put(STOP)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                batch, stop = self._next_batch()
+                if batch:
+                    self._commit(batch)
+                if stop:
+                    return
+
+    def _next_batch(self):
+        """Wait for a write, then gather more within the batching window."""
+        job = self._queue.get()
+        if job is STOP:
+            return [], True
+        batch = [job]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                job = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if job is STOP:
+                return batch, True
+            batch.append(job)
+        return batch, False
+
+    def _commit(self, batch):
+        staged = []
+        with db.session() as session:
+            try:
+                connection = session.connection()
+                if connection.dialect.name == 'sqlite':
+                    # pysqlite only opens a transaction before DML, which would
+                    # make the first savepoint the outermost transaction.
+                    connection.exec_driver_sql('BEGIN IMMEDIATE')
+                for write, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue  # its request timed out while it was queued
+                    try:
+                        with session.begin_nested():
+                            result, changes = write(session)
+                            seq = None
+                            if changes is not None:
+                                seq = record_changes(
+                                    session,
+                                    [*changes.created, *changes.updated],
+                                    changes.deleted,
+                                    changes.list_id,
+                                )
+                    except Exception as e:
+                        future.set_exception(e)
+                        continue
+                    staged.append((future, result, changes, seq))
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            self.batches += 1
+            self.writes += len(batch)
+            for future, result, changes, seq in staged:
+                if changes is not None:
+                    try:
+                        changes_committed(session, changes.list_id, seq, *changes[1:])
+                    except Exception:
+                        # The write is committed; don't fail it (or the writer).
+                        logger.exception('Post-commit hooks failed for sequence %s', seq)
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'writes': self.writes,
+            'mean_batch_size': self.writes / self.batches if self.batches else 0.0,
+            'queued': self._queue.qsize(),
+        }
+
+
+def init_writer(app):
+    """Create the group-commit writer when `WRITE_GROUP_COMMIT` is set."""
+    if not app.config['WRITE_GROUP_COMMIT']:
+        return
+    app.extensions['todo_writer'] = GroupCommitWriter(
+        app, app.config['WRITE_BATCH_SIZE'], app.config['WRITE_BATCH_DELAY']
+    )
+
+
+def get_writer():
+    return current_app.extensions.get('todo_writer')
@@ -0,0 +1,43 @@
+"""
+Micro-benchmarks, run with pytest-benchmark (not part of the default test run):
+
+    pytest benchmarks --benchmark-autosave --benchmark-storage=benchmarks/baselines
+    pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:20% \
+        --benchmark-storage=benchmarks/baselines
+
+BENCH_ROWS sets the number of seeded rows (default 10000).
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(__file__))
+
+pytest.importorskip('pytest_benchmark')
+
+from app import create_app, db  # noqa: E402
+from seed import seed  # noqa: E402
+
+BENCH_ROWS = int(os.environ.get('BENCH_ROWS', 10000))
+
+
+@pytest.fixture(scope='session')
+def bench_app(tmp_path_factory):
+    path = tmp_path_factory.mktemp('bench') / 'bench.db'
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'DATABASE_PROFILE': 'production',
+        # Measure the work behind each route, not the response cache.
+        'CACHE_ENABLED': False,
+    })
+    seed(app, BENCH_ROWS)
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def bench_client(bench_app):
+    return bench_app.test_client()
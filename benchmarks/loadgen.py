@@ -0,0 +1,214 @@
+"""
+Load generator for the /todos API.
+
+Starts the app in a separate server process on a seeded SQLite database,
+then drives each endpoint with concurrent keep-alive HTTP clients for a fixed
+duration and reports requests/sec and p50/p95/p99 latency per endpoint.
+
+    python benchmarks/loadgen.py --rows 100000 --concurrency 16 --seconds 10
+    python benchmarks/loadgen.py --server gunicorn --workers 4
+    python benchmarks/loadgen.py --save benchmarks/baselines/loadgen.json
+    python benchmarks/loadgen.py --compare benchmarks/baselines/loadgen.json
+
+With `--compare`, the exit status is 1 when an endpoint's p95 latency or
+throughput is worse than the baseline by more than `--tolerance`.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(__file__))
+
+
+def endpoints(rows):
+    """(name, method, path factory, body, expected status) for each scenario."""
+    def random_id():
+        return random.randint(1, rows)
+
+    return [
+        ('list', 'GET', lambda: '/todos?limit=100', None, 200),
+        ('list_filtered', 'GET', lambda: '/todos?completed=false&sort=priority&limit=100', None, 200),
+        ('get_by_id', 'GET', lambda: f'/todos/{random_id()}', None, 200),
+        ('changes', 'GET', lambda: f'/todos/changes?since={max(rows - 500, 0)}&limit=100', None, 200),
+        ('create', 'POST', lambda: '/todos', {'title': 'Load'}, 201),
+        ('update', 'PUT', lambda: f'/todos/{random_id()}', {'completed': True}, 200),
+    ]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve(database, port, server='werkzeug', workers=None):
+    """
+    Run the app (the load test's target) on a threaded Werkzeug server, or
+    on gunicorn as `python -m app.serve` does.
+    """
+    if server == 'gunicorn':
+        from app.serve import main
+        argv = ['--bind', f'127.0.0.1:{port}', '--database-uri', f'sqlite:///{database}']
+        if workers:
+            argv += ['--workers', str(workers)]
+        main(argv)
+        return
+    from werkzeug.serving import run_simple
+    from app import create_app
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database}',
+        'DATABASE_PROFILE': 'production',
+    })
+    run_simple('127.0.0.1', port, app, threaded=True)
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Server did not start on port {port}')
+
+
+def drive(port, method, path, body, status, concurrency, seconds):
+    """Issue requests from `concurrency` threads for `seconds`; return stats."""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+    payload = json.dumps(body) if body is not None else None
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+
+    def worker():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        mine = []
+        failed = 0
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                connection.request(method, path(), body=payload, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status != status:
+                    failed += 1
+                    continue
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            mine.append(time.perf_counter() - start)
+        connection.close()
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if not latencies:
+        return {'rps': 0.0, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'errors': errors[0]}
+    return {
+        'rps': len(latencies) / seconds,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'errors': errors[0],
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return a description of each regression against `baseline`."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or result['p95_ms'] is None:
+            continue
+        if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']:.1f}ms vs {base['p95_ms']:.1f}ms")
+        if result['rps'] < base['rps'] * (1 - tolerance):
+            regressions.append(f"{name}: {result['rps']:.0f} req/s vs {base['rps']:.0f} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--only', nargs='*', help='endpoint names to run')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--server', choices=('werkzeug', 'gunicorn'), default='werkzeug')
+    parser.add_argument('--workers', type=int, help='gunicorn workers (default: one per core plus one)')
+    parser.add_argument('--serve', nargs=2, metavar=('DATABASE', 'PORT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve[0], int(args.serve[1]), args.server, args.workers)
+        return
+
+    from app import create_app
+    from seed import seed
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'load.db')
+        seed(create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database}'}), args.rows)
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, __file__, '--serve', database, str(port), '--server', args.server]
+            + (['--workers', str(args.workers)] if args.workers else []),
+            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_for(port)
+            results = {}
+            print(f'{"endpoint":<16}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"errors":>8}')
+            for name, method, path, body, status in endpoints(args.rows):
+                if args.only and name not in args.only:
+                    continue
+                result = drive(port, method, path, body, status, args.concurrency, args.seconds)
+                results[name] = result
+                print(
+                    f"{name:<16}{result['rps']:>9.1f}{result['p50_ms'] or 0:>9.2f}"
+                    f"{result['p95_ms'] or 0:>9.2f}{result['p99_ms'] or 0:>9.2f}{result['errors']:>8}"
+                )
+        finally:
+            server.terminate()
+            server.wait()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
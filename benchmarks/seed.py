@@ -0,0 +1,61 @@
+"""
+Create a SQLite database with the app's schema and N generated TODO items.
+
+    python benchmarks/seed.py bench.db --rows 1000000
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import insert, update  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from app.models import DEFAULT_LIST_ID, CollectionVersion, ToDo  # noqa: E402
+
+CHUNK_SIZE = 10000
+
+
+def seed(app, rows, seed=0, list_id=DEFAULT_LIST_ID):
+    """Insert `rows` items into a list with a realistic mix of fields, CHUNK_SIZE at a time."""
+    generator = random.Random(seed)
+    with app.app_context():
+        db.create_all()
+        with db.session() as session:
+            # Stamp rows with distinct change sequences, as individual writes would.
+            collection = CollectionVersion.list_collection(list_id)
+            base = CollectionVersion.bump(session, collection)
+            for start in range(0, rows, CHUNK_SIZE):
+                session.execute(insert(ToDo), [
+                    {
+                        'list_id': list_id,
+                        'title': f'Task {i}',
+                        'completed': generator.random() < 0.3,
+                        'description': 'x' * generator.choice((0, 32, 256, 1024)),
+                        'priority': generator.choice((1, 2, 3)),
+                        'change_seq': base + i,
+                    }
+                    for i in range(start, min(start + CHUNK_SIZE, rows))
+                ])
+            session.execute(
+                update(CollectionVersion)
+                .where(CollectionVersion.name == collection)
+                .values(version=base + rows)
+            )
+            session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path', help='SQLite file to create')
+    parser.add_argument('--rows', type=int, default=10000)
+    args = parser.parse_args()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.abspath(args.path)}'})
+    seed(app, args.rows)
+    print(f'Seeded {args.rows} rows into {args.path}')
+
+
+if __name__ == '__main__':
+    main()
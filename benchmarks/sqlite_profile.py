@@ -0,0 +1,86 @@
+"""
+Compare concurrent read/write throughput of the database profiles.
+
+For each profile a fresh SQLite file is seeded, then reader threads
+(`GET /todos`) and writer threads (`POST /todos`) hammer the app through the
+Flask test client for a fixed duration. Caching is disabled so every read
+reaches the database.
+
+    python benchmarks/sqlite_profile.py --readers 8 --writers 2 --seconds 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db  # noqa: E402
+
+
+def run_profile(profile, readers, writers, seconds, rows):
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{directory}/bench.db',
+            'DATABASE_PROFILE': profile,
+            'CACHE_ENABLED': False,
+        })
+        with app.app_context():
+            db.create_all()
+        client = app.test_client()
+        for start in range(0, rows, 1000):
+            batch = [{'title': f'Seed {i}'} for i in range(start, min(start + 1000, rows))]
+            client.post('/todos/batch', json=batch)
+
+        counts = {'read': 0, 'write': 0, 'error': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + seconds
+
+        def work(kind):
+            client = app.test_client()
+            done = errors = 0
+            while time.monotonic() < deadline:
+                try:
+                    if kind == 'read':
+                        response = client.get('/todos?limit=50&completed=false')
+                    else:
+                        response = client.post('/todos', json={'title': 'Bench'})
+                    if response.status_code < 300:
+                        done += 1
+                    else:
+                        errors += 1
+                except Exception:
+                    errors += 1
+            with lock:
+                counts[kind] += done
+                counts['error'] += errors
+
+        threads = [threading.Thread(target=work, args=('read',)) for _ in range(readers)]
+        threads += [threading.Thread(target=work, args=('write',)) for _ in range(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with app.app_context():
+            db.engine.dispose()
+        return {kind: count / seconds for kind, count in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--rows', type=int, default=10000)
+    args = parser.parse_args()
+
+    print(f'{"profile":<12}{"reads/s":>10}{"writes/s":>10}{"errors/s":>10}')
+    for profile in ('default', 'production'):
+        result = run_profile(profile, args.readers, args.writers, args.seconds, args.rows)
+        print(f'{profile:<12}{result["read"]:>10.1f}{result["write"]:>10.1f}{result["error"]:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Compare cold start times of the default and lean (`LEAN_STARTUP`) app.
+
+Each run is a fresh interpreter that imports the app, calls `create_app`
+and serves a first `GET /todos` and a first `GET /apispec_1.json` through
+the test client, timing each step. Medians over the runs are reported.
+
+    python benchmarks/startup.py --runs 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+from app import create_app, db
+imported = time.perf_counter()
+app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'LEAN_STARTUP': %r})
+with app.app_context():
+    db.create_all()
+created = time.perf_counter()
+client = app.test_client()
+client.get('/todos')
+first_request = time.perf_counter()
+client.get('/apispec_1.json')
+spec = time.perf_counter()
+print(json.dumps({
+    'import': imported - started,
+    'create_app': created - imported,
+    'first_request': first_request - created,
+    'first_spec': spec - first_request,
+}))
+'''
+
+STEPS = ('import', 'create_app', 'first_request', 'first_spec')
+
+
+def run_once(lean):
+    output = subprocess.check_output([sys.executable, '-c', PROBE % lean], cwd=ROOT, text=True)
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=15)
+    args = parser.parse_args()
+
+    print(f'{"mode":<10}' + ''.join(f'{step + " ms":>18}' for step in STEPS) + f'{"ready ms":>12}')
+    for mode, lean in (('default', False), ('lean', True)):
+        runs = [run_once(lean) for _ in range(args.runs)]
+        medians = {step: statistics.median(run[step] for run in runs) * 1000 for step in STEPS}
+        ready = statistics.median(
+            (run['import'] + run['create_app'] + run['first_request']) * 1000 for run in runs
+        )
+        print(f'{mode:<10}' + ''.join(f'{medians[step]:>18.1f}' for step in STEPS) + f'{ready:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
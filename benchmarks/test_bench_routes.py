@@ -0,0 +1,70 @@
+import itertools
+
+from app.queries import encode_cursor
+
+
+def ok(response, status=200):
+    assert response.status_code == status, response.data
+    return response
+
+
+def test_get_todos_page(benchmark, bench_client):
+    benchmark(lambda: ok(bench_client.get('/todos?limit=100')))
+
+
+def test_get_todos_max_page(benchmark, bench_client):
+    benchmark(lambda: ok(bench_client.get('/todos?limit=1000')))
+
+
+def test_get_todos_max_page_sparse(benchmark, bench_client):
+    benchmark(lambda: ok(bench_client.get('/todos?limit=1000&fields=id,title,completed')))
+
+
+def test_get_todos_filtered_sorted(benchmark, bench_client):
+    url = '/todos?completed=false&sort=priority&limit=100'
+    benchmark(lambda: ok(bench_client.get(url)))
+
+
+def test_get_todos_deep_page(benchmark, bench_client):
+    # Keyset pagination: a page near the end costs the same as the first one
+    last = bench_client.get('/todos?sort=-id&limit=1').json[0]['id']
+    url = f'/todos?limit=100&after={encode_cursor([last - 200])}'
+    benchmark(lambda: ok(bench_client.get(url)))
+
+
+def test_get_todos_not_modified(benchmark, bench_client):
+    etag = bench_client.get('/todos').headers['ETag']
+    headers = {'If-None-Match': etag}
+    benchmark(lambda: ok(bench_client.get('/todos', headers=headers), 304))
+
+
+def test_get_todo_by_id(benchmark, bench_client):
+    ids = itertools.cycle(range(1, 1001))
+    benchmark(lambda: ok(bench_client.get(f'/todos/{next(ids)}')))
+
+
+def test_export(benchmark, bench_client):
+    benchmark.pedantic(lambda: ok(bench_client.get('/todos/export')), rounds=5)
+
+
+def test_changes(benchmark, bench_client):
+    benchmark(lambda: ok(bench_client.get('/todos/changes?limit=100')))
+
+
+def test_create_todo(benchmark, bench_client):
+    benchmark(lambda: ok(bench_client.post('/todos', json={'title': 'Bench'}), 201))
+
+
+def test_update_todo(benchmark, bench_client):
+    ids = itertools.cycle(range(1, 1001))
+    benchmark(lambda: ok(bench_client.put(f'/todos/{next(ids)}', json={'completed': True})))
+
+
+def test_patch_todo(benchmark, bench_client):
+    ids = itertools.cycle(range(1, 1001))
+    benchmark(lambda: ok(bench_client.patch(f'/todos/{next(ids)}', json={'completed': True})))
+
+
+def test_create_batch(benchmark, bench_client):
+    batch = [{'title': f'Batch {i}'} for i in range(100)]
+    benchmark(lambda: ok(bench_client.post('/todos/batch', json=batch), 201))
@@ -0,0 +1,55 @@
+import json
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import select
+
+from app import db
+from app.models import ToDo
+
+PAGE = 1000
+
+
+def load_page(app):
+    with app.app_context():
+        todos = db.session.scalars(select(ToDo).limit(PAGE)).all()
+        db.session.expunge_all()
+        return todos
+
+
+def test_to_dict(benchmark, bench_app):
+    todos = load_page(bench_app)
+    benchmark(lambda: [todo.to_dict() for todo in todos])
+
+
+def test_json_dumps_stdlib(benchmark, bench_app):
+    dicts = [todo.to_dict() for todo in load_page(bench_app)]
+    benchmark(json.dumps, dicts)
+
+
+def test_json_dumps_flask_provider(benchmark, bench_app):
+    dicts = [todo.to_dict() for todo in load_page(bench_app)]
+    benchmark(DefaultJSONProvider(bench_app).dumps, dicts)
+
+
+def test_load_orm_page(benchmark, bench_app):
+    with bench_app.app_context():
+        stmt = select(ToDo).limit(PAGE)
+        benchmark(lambda: db.session.scalars(stmt).all())
+
+
+def test_json_dumps_orjson_provider(benchmark, bench_app):
+    from app.json_provider import OrjsonProvider
+    dicts = [todo.to_dict() for todo in load_page(bench_app)]
+    benchmark(OrjsonProvider(bench_app).dumpb, dicts)
+
+
+def test_load_orm_page_dicts(benchmark, bench_app):
+    with bench_app.app_context():
+        stmt = select(ToDo).limit(PAGE)
+        benchmark(lambda: [todo.to_dict() for todo in db.session.scalars(stmt).all()])
+
+
+def test_load_projected_page_dicts(benchmark, bench_app):
+    with bench_app.app_context():
+        stmt = select(*ToDo.serialized_columns()).limit(PAGE)
+        benchmark(lambda: [row._asdict() for row in db.session.execute(stmt).all()])
@@ -0,0 +1,34 @@
+"""Add list view indexes
+
+Revision ID: 5b7e2f9c1a3d
+Revises: 2c08456e377a
+Create Date: 2026-10-18 09:12:41.208315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e2f9c1a3d'
+down_revision = '2c08456e377a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rows created before description/priority existed hold NULLs, which
+    # cannot be compared by keyset pagination; give them the model defaults.
+    op.execute("UPDATE to_do SET completed = 0 WHERE completed IS NULL")
+    op.execute("UPDATE to_do SET priority = 1 WHERE priority IS NULL")
+    op.execute("UPDATE to_do SET description = '' WHERE description IS NULL")
+
+    with op.batch_alter_table('to_do', schema=None) as batch_op:
+        batch_op.create_index('ix_to_do_completed_priority_id', ['completed', 'priority', 'id'], unique=False)
+        batch_op.create_index('ix_to_do_priority_id', ['priority', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('to_do', schema=None) as batch_op:
+        batch_op.drop_index('ix_to_do_priority_id')
+        batch_op.drop_index('ix_to_do_completed_priority_id')
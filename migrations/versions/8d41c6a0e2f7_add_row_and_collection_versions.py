@@ -0,0 +1,35 @@
+"""Add row and collection versions
+
+Revision ID: 8d41c6a0e2f7
+Revises: 5b7e2f9c1a3d
+Create Date: 2026-10-18 11:47:03.551902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d41c6a0e2f7'
+down_revision = '5b7e2f9c1a3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    collection_version = op.create_table('collection_version',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(collection_version, [{'name': 'to_do', 'version': 0}])
+
+    with op.batch_alter_table('to_do', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('to_do', schema=None) as batch_op:
+        batch_op.drop_column('version')
+
+    op.drop_table('collection_version')
@@ -0,0 +1,58 @@
+"""Never reuse todo ids
+
+Revision ID: 9a4e1d7c2b60
+Revises: 0c3b72cafb95
+Create Date: 2026-10-19 09:12:40.183522
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4e1d7c2b60'
+down_revision = '0c3b72cafb95'
+branch_labels = None
+depends_on = None
+
+# SQLite cannot add AUTOINCREMENT to an existing table, so to_do is
+# recreated, which drops its triggers: the full-text search ones are created
+# again. Keep in step with TODO_FTS_DDL in app/models.py.
+FTS_TRIGGERS = (
+    "CREATE TRIGGER to_do_fts_insert AFTER INSERT ON to_do BEGIN "
+    "INSERT INTO to_do_fts(rowid, title, description) VALUES (new.id, new.title, new.description); "
+    "END",
+    "CREATE TRIGGER to_do_fts_delete AFTER DELETE ON to_do BEGIN "
+    "INSERT INTO to_do_fts(to_do_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "END",
+    "CREATE TRIGGER to_do_fts_update AFTER UPDATE OF title, description ON to_do BEGIN "
+    "INSERT INTO to_do_fts(to_do_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO to_do_fts(rowid, title, description) VALUES (new.id, new.title, new.description); "
+    "END",
+)
+
+
+def recreate_to_do(autoincrement):
+    with op.batch_alter_table(
+        'to_do', recreate='always', table_kwargs={'sqlite_autoincrement': autoincrement}
+    ) as batch_op:
+        batch_op.create_check_constraint('chk_priority', 'priority IN (1, 2, 3)')
+    for statement in FTS_TRIGGERS:
+        op.execute(statement)
+
+
+def upgrade():
+    recreate_to_do(autoincrement=True)
+    # Start after the highest ID still known, including deleted items with a
+    # tombstone, so none of them is handed out again.
+    op.execute("DELETE FROM sqlite_sequence WHERE name = 'to_do'")
+    op.execute(
+        "INSERT INTO sqlite_sequence (name, seq) SELECT 'to_do', MAX("
+        "COALESCE((SELECT MAX(id) FROM to_do), 0), COALESCE((SELECT MAX(id) FROM to_do_tombstone), 0))"
+    )
+
+
+def downgrade():
+    recreate_to_do(autoincrement=False)
@@ -0,0 +1,49 @@
+"""Add change feed
+
+Revision ID: c3a9d8e1f504
+Revises: 8d41c6a0e2f7
+Create Date: 2026-10-18 13:25:17.093644
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a9d8e1f504'
+down_revision = '8d41c6a0e2f7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('to_do_tombstone',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('change_seq', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('to_do_tombstone', schema=None) as batch_op:
+        batch_op.create_index('ix_to_do_tombstone_change_seq_id', ['change_seq', 'id'], unique=False)
+
+    with op.batch_alter_table('to_do', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('change_seq', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index('ix_to_do_change_seq_id', ['change_seq', 'id'], unique=False)
+
+    # Give existing rows distinct sequences (their IDs) so a sync from 0
+    # includes them and can be paged, and move the collection version past them.
+    op.execute("UPDATE to_do SET change_seq = id")
+    op.execute(
+        "UPDATE collection_version SET version = "
+        "MAX(version, (SELECT COALESCE(MAX(id), 0) FROM to_do)) WHERE name = 'to_do'"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('to_do', schema=None) as batch_op:
+        batch_op.drop_index('ix_to_do_change_seq_id')
+        batch_op.drop_column('change_seq')
+
+    with op.batch_alter_table('to_do_tombstone', schema=None) as batch_op:
+        batch_op.drop_index('ix_to_do_tombstone_change_seq_id')
+
+    op.drop_table('to_do_tombstone')
@@ -0,0 +1,49 @@
+"""Add full-text search
+
+Revision ID: e7f1b2c4d8a9
+Revises: c3a9d8e1f504
+Create Date: 2026-10-18 16:02:41.518230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7f1b2c4d8a9'
+down_revision = 'c3a9d8e1f504'
+branch_labels = None
+depends_on = None
+
+# The FTS5 index does not store the text (content='to_do'); the triggers keep
+# it in sync with to_do. Keep in step with TODO_FTS_DDL in app/models.py.
+FTS_DDL = (
+    "CREATE VIRTUAL TABLE to_do_fts USING fts5(title, description, content='to_do', "
+    "content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER to_do_fts_insert AFTER INSERT ON to_do BEGIN "
+    "INSERT INTO to_do_fts(rowid, title, description) VALUES (new.id, new.title, new.description); "
+    "END",
+    "CREATE TRIGGER to_do_fts_delete AFTER DELETE ON to_do BEGIN "
+    "INSERT INTO to_do_fts(to_do_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "END",
+    "CREATE TRIGGER to_do_fts_update AFTER UPDATE OF title, description ON to_do BEGIN "
+    "INSERT INTO to_do_fts(to_do_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO to_do_fts(rowid, title, description) VALUES (new.id, new.title, new.description); "
+    "END",
+)
+
+
+def upgrade():
+    for statement in FTS_DDL:
+        op.execute(statement)
+    # Index the existing rows
+    op.execute("INSERT INTO to_do_fts(to_do_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS to_do_fts_update")
+    op.execute("DROP TRIGGER IF EXISTS to_do_fts_delete")
+    op.execute("DROP TRIGGER IF EXISTS to_do_fts_insert")
+    op.execute("DROP TABLE IF EXISTS to_do_fts")
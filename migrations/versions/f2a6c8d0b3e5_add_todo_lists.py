@@ -0,0 +1,61 @@
+"""Add todo lists
+
+Revision ID: f2a6c8d0b3e5
+Revises: e7f1b2c4d8a9
+Create Date: 2026-10-18 17:11:05.842117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a6c8d0b3e5'
+down_revision = 'e7f1b2c4d8a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing items and tombstones belong to the default list (1). Columns
+    # and indexes are added in place: recreating to_do would drop the
+    # full-text search triggers.
+    op.add_column('to_do', sa.Column('list_id', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('to_do_tombstone', sa.Column('list_id', sa.Integer(), server_default='1', nullable=False))
+
+    op.drop_index('ix_to_do_completed_priority_id', table_name='to_do')
+    op.drop_index('ix_to_do_priority_id', table_name='to_do')
+    op.drop_index('ix_to_do_change_seq_id', table_name='to_do')
+    op.create_index('ix_to_do_list_id_id', 'to_do', ['list_id', 'id'], unique=False)
+    op.create_index('ix_to_do_list_id_completed_priority_id', 'to_do', ['list_id', 'completed', 'priority', 'id'], unique=False)
+    op.create_index('ix_to_do_list_id_priority_id', 'to_do', ['list_id', 'priority', 'id'], unique=False)
+    op.create_index('ix_to_do_list_id_change_seq_id', 'to_do', ['list_id', 'change_seq', 'id'], unique=False)
+
+    op.drop_index('ix_to_do_tombstone_change_seq_id', table_name='to_do_tombstone')
+    op.create_index('ix_to_do_tombstone_list_id_change_seq_id', 'to_do_tombstone', ['list_id', 'change_seq', 'id'], unique=False)
+
+    # Each list has its own version; the old collection-wide one becomes list 1's.
+    op.execute("UPDATE collection_version SET name = 'to_do:1' WHERE name = 'to_do'")
+
+
+def downgrade():
+    op.execute(
+        "UPDATE collection_version SET version = "
+        "(SELECT MAX(version) FROM collection_version WHERE name LIKE 'to_do:%') WHERE name = 'to_do:1'"
+    )
+    op.execute("DELETE FROM collection_version WHERE name LIKE 'to_do:%' AND name != 'to_do:1'")
+    op.execute("UPDATE collection_version SET name = 'to_do' WHERE name = 'to_do:1'")
+
+    op.drop_index('ix_to_do_tombstone_list_id_change_seq_id', table_name='to_do_tombstone')
+    op.create_index('ix_to_do_tombstone_change_seq_id', 'to_do_tombstone', ['change_seq', 'id'], unique=False)
+
+    op.drop_index('ix_to_do_list_id_change_seq_id', table_name='to_do')
+    op.drop_index('ix_to_do_list_id_priority_id', table_name='to_do')
+    op.drop_index('ix_to_do_list_id_completed_priority_id', table_name='to_do')
+    op.drop_index('ix_to_do_list_id_id', table_name='to_do')
+    op.create_index('ix_to_do_change_seq_id', 'to_do', ['change_seq', 'id'], unique=False)
+    op.create_index('ix_to_do_priority_id', 'to_do', ['priority', 'id'], unique=False)
+    op.create_index('ix_to_do_completed_priority_id', 'to_do', ['completed', 'priority', 'id'], unique=False)
+
+    op.drop_column('to_do_tombstone', 'list_id')
+    op.drop_column('to_do', 'list_id')
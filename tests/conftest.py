@@ -1,5 +1,22 @@
 import sys
 import os
 
+import pytest
+
 # Add the project root to the PYTHONPATH
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+class FakeClock:
+    """A stand-in for `time.monotonic` and friends, moved by setting `now`."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
@@ -0,0 +1,74 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from app import create_app, db
+
+
+def make_app(**config):
+    return create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', **config})
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(LEAN_STARTUP=True)
+    app.instance_path = str(tmp_path)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def test_lean_startup_defaults(app):
+    assert app.config['APIDOCS'] == 'lazy'
+    assert 'migrate' not in app.extensions
+    # Explicit settings win over the lean defaults
+    app = make_app(LEAN_STARTUP=True, MIGRATIONS_ENABLED=True, APIDOCS=None)
+    assert 'migrate' in app.extensions
+    assert 'todo_apidocs' not in app.extensions
+
+def test_lazy_spec_matches_flasgger(app):
+    docs = app.extensions['todo_apidocs']
+    assert docs.spec is None
+    spec = app.test_client().get('/apispec_1.json').json
+    assert docs.spec is not None
+    eager = make_app().test_client().get('/apispec_1.json').json
+    assert spec['paths'] == eager['paths']
+
+def test_event_stream_schema_belongs_to_its_200(app):
+    responses = app.test_client().get('/apispec_1.json').json['paths']['/todos/events']['get']['responses']
+    assert sorted(responses['200']) == ['content', 'description']
+    assert sorted(responses['503']) == ['description']
+
+def test_docs_page(app):
+    client = app.test_client()
+    response = client.get('/apidocs/')
+    assert response.status_code == 200
+    assert b'/apispec_1.json' in response.data
+    assert client.get('/flasgger_static/swagger-ui-bundle.js').status_code == 200
+
+def test_spec_file_is_served(app, tmp_path):
+    app.config['APIDOCS_SPEC_FILE'] = 'apispec.json'
+    result = app.test_cli_runner().invoke(args=['apispec'])
+    assert result.exit_code == 0, result.output
+    with open(tmp_path / 'apispec.json') as f:
+        spec = json.load(f)
+    assert '/todos' in spec['paths']
+    app = make_app(LEAN_STARTUP=True, APIDOCS_SPEC_FILE=str(tmp_path / 'apispec.json'))
+    assert app.test_client().get('/apispec_1.json').json == spec
+    assert app.extensions['todo_apidocs'].spec is None
+
+def test_unknown_apidocs_mode():
+    with pytest.raises(ValueError):
+        make_app(APIDOCS='redoc')
+
+def test_lean_startup_skips_heavy_imports():
+    code = (
+        'import sys; from app import create_app; '
+        "app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'LEAN_STARTUP': True}); "
+        "print(sorted(name for name in ('flasgger', 'flask_migrate', 'alembic') if name in sys.modules))"
+    )
+    output = subprocess.check_output([sys.executable, '-c', code], text=True)
+    assert output.strip() == '[]'
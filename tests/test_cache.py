@@ -0,0 +1,56 @@
+from app.cache import LRUCache, RedisCacheBackend
+
+
+class FakeRedis:
+    """Just enough of the redis-py client API for RedisCacheBackend."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode()
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def scan_iter(self, match):
+        prefix = match.rstrip('*')
+        return [key for key in list(self.data) if key.startswith(prefix)]
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2, ttl=0)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # 'b' is now the least recently used
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.evictions == 1
+
+def test_lru_cache_expires_entries(clock):
+    cache = LRUCache(max_entries=10, ttl=5, clock=clock)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=0)  # never expires
+    clock.now = 4.9
+    assert cache.get('a') == 1
+    clock.now = 5.0
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+    assert len(cache) == 1
+
+def test_redis_backend_round_trip():
+    client = FakeRedis()
+    backend = RedisCacheBackend(client, prefix='test:')
+    backend.set('todo:1', {'body': '{}', 'status': 200, 'headers': {}})
+    assert backend.get('todo:1')['status'] == 200
+    assert 'test:todo:1' in client.data
+    backend.delete('todo:1')
+    assert backend.get('todo:1') is None
+    backend.set('todo:2', {'body': '{}'})
+    backend.clear()
+    assert client.data == {}
@@ -0,0 +1,108 @@
+import gzip
+import json
+import zlib
+
+import pytest
+from werkzeug.datastructures import Accept, MIMEAccept
+
+from app import create_app, db
+from app.compression import Compressor, iter_gzip
+from app.models import ToDo
+
+GZIP = {'Accept-Encoding': 'gzip'}
+
+
+@pytest.fixture
+def app():
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'COMPRESSION_MIN_SIZE': 200})
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([ToDo(title=f'Compressible todo {i}') for i in range(20)])
+        db.session.commit()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def test_large_json_is_gzipped(client):
+    plain = client.get('/todos')
+    response = client.get('/todos', headers=GZIP)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert len(response.data) < len(plain.data)
+    assert json.loads(gzip.decompress(response.data)) == plain.json
+
+def test_uncompressed_without_accept_encoding(client):
+    response = client.get('/todos')
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.headers['Vary']
+    response = client.get('/todos', headers={'Accept-Encoding': 'gzip;q=0, identity'})
+    assert 'Content-Encoding' not in response.headers
+
+def test_small_bodies_are_not_compressed(client):
+    response = client.get('/todos/1', headers=GZIP)
+    assert 'Content-Encoding' not in response.headers
+    assert response.json['id'] == 1
+
+def test_compressed_body_is_cached_by_etag(app, client):
+    compressor = app.extensions['todo_compression']
+    first = client.get('/todos', headers=GZIP)
+    second = client.get('/todos', headers=GZIP)
+    assert compressor.cache_hits == 1
+    assert second.data == first.data
+    client.put('/todos/1', json={'title': 'Changed'})
+    changed = client.get('/todos', headers=GZIP)
+    assert compressor.cache_hits == 1
+    assert json.loads(gzip.decompress(changed.data))[0]['title'] == 'Changed'
+
+def test_compressed_body_cache_is_per_path(app):
+    compressor = Compressor(min_size=0)
+    bodies = {}
+    for path in ('/todos', '/todos/search'):
+        with app.test_request_context(path):
+            response = app.response_class(json.dumps({'path': path}), mimetype='application/json')
+        response.set_etag('same')
+        compressor.compress(response, Accept([('gzip', 1)]), path)
+        bodies[path] = json.loads(gzip.decompress(response.get_data()))
+    assert bodies == {'/todos': {'path': '/todos'}, '/todos/search': {'path': '/todos/search'}}
+    assert compressor.cache_hits == 0
+
+def test_not_modified_is_not_compressed(client):
+    etag = client.get('/todos').headers['ETag']
+    response = client.get('/todos', headers={'If-None-Match': etag, **GZIP})
+    assert response.status_code == 304
+    assert 'Content-Encoding' not in response.headers
+
+def test_export_is_gzip_streamed(client):
+    response = client.get('/todos/export', headers=GZIP)
+    assert response.is_streamed
+    assert response.headers['Content-Encoding'] == 'gzip'
+    lines = gzip.decompress(response.data).decode().splitlines()
+    assert len(lines) == 20
+    assert json.loads(lines[0])['title'] == 'Compressible todo 0'
+
+def test_compression_can_be_disabled():
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'COMPRESSION_MIN_SIZE': 0,
+                      'COMPRESSION_ENABLED': False})
+    with app.app_context():
+        db.create_all()
+        response = app.test_client().get('/todos', headers=GZIP)
+    assert 'Content-Encoding' not in response.headers
+
+def test_other_content_types_are_left_alone(app):
+    compressor = Compressor(min_size=0)
+    with app.test_request_context():
+        response = app.response_class('data: {}\n\n' * 100, mimetype='text/event-stream')
+    compressor.compress(response, MIMEAccept([('gzip', 1)]))
+    assert 'Content-Encoding' not in response.headers
+
+def test_iter_gzip_flushes_each_chunk():
+    chunks = list(iter_gzip(iter([b'{"a": 1}\n', '{"b": 2}\n']), 6))
+    assert len(chunks) == 3
+    assert gzip.decompress(b''.join(chunks)) == b'{"a": 1}\n{"b": 2}\n'
+    # Each flushed prefix decodes on its own
+    assert zlib.decompressobj(31).decompress(chunks[0]) == b'{"a": 1}\n'
@@ -0,0 +1,262 @@
+"""The /todos contract, checked against both the WSGI and the ASGI app."""
+import gzip
+import json
+
+import pytest
+from app import create_app, db
+
+CONTRACT_MODES = ['wsgi', 'asgi']
+
+
+class ApiResponse:
+    def __init__(self, status_code, json, headers):
+        self.status_code = status_code
+        self.json = json
+        self.headers = headers
+
+
+class Api:
+    """Issue requests through the Flask or the Starlette test client alike."""
+
+    def __init__(self, client, mode):
+        self.client = client
+        self.mode = mode
+
+    def request(self, method, url, **kwargs):
+        if self.mode == 'wsgi':
+            response = self.client.open(url, method=method, **kwargs)
+            if response.headers.get('Content-Encoding') == 'gzip':
+                # Unlike httpx, the Flask test client does not decode the body
+                body = json.loads(gzip.decompress(response.data))
+                return ApiResponse(response.status_code, body, response.headers)
+            return ApiResponse(response.status_code, response.json, response.headers)
+        response = self.client.request(method, url, **kwargs)
+        is_json = response.headers.get('content-type', '').startswith('application/json')
+        return ApiResponse(response.status_code, response.json() if is_json else None, response.headers)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+
+@pytest.fixture(params=CONTRACT_MODES)
+def api(request, tmp_path):
+    config = {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/todo.db'}
+    if request.param == 'wsgi':
+        app = create_app(config)
+        with app.app_context():
+            db.create_all()
+            yield Api(app.test_client(), 'wsgi')
+            db.session.remove()
+        return
+    pytest.importorskip('aiosqlite')
+    testclient = pytest.importorskip('starlette.testclient')
+    from app.asgi import create_asgi_app
+    app = create_asgi_app(config)
+    with app.state.flask_app.app_context():
+        db.create_all()
+    with testclient.TestClient(app) as client:
+        yield Api(client, 'asgi')
+    with app.state.flask_app.app_context():
+        db.engine.dispose()
+
+
+def test_create_and_get(api):
+    response = api.post('/todos', json={'title': 'Contract', 'priority': 2})
+    assert response.status_code == 201
+    created = response.json
+    assert created['title'] == 'Contract'
+    assert created['completed'] == False
+    assert created['description'] == ''
+    assert created['priority'] == 2
+
+    response = api.get(f"/todos/{created['id']}")
+    assert response.status_code == 200
+    assert response.json == created
+    assert response.headers['Access-Control-Allow-Origin'] == '*'
+
+def test_create_validation(api):
+    response = api.post('/todos', json={})
+    assert response.status_code == 400
+    assert response.json == {'error': 'Title is required'}
+    response = api.post('/todos', json={'title': 'Bad', 'priority': 4})
+    assert response.status_code == 400
+    assert response.json == {'error': 'Priority must be 1, 2, or 3'}
+
+def test_list_filter_sort_and_paginate(api):
+    for title, priority in [('A', 3), ('B', 1), ('C', 2), ('D', 1)]:
+        api.post('/todos', json={'title': title, 'priority': priority})
+    response = api.get('/todos?sort=priority,-id&limit=2')
+    assert response.status_code == 200
+    assert [todo['title'] for todo in response.json] == ['D', 'B']
+    cursor = response.headers['X-Next-Cursor']
+    response = api.get(f'/todos?sort=priority,-id&limit=2&after={cursor}')
+    assert [todo['title'] for todo in response.json] == ['C', 'A']
+    assert 'X-Next-Cursor' not in response.headers
+
+    response = api.get('/todos?priority=1')
+    assert [todo['title'] for todo in response.json] == ['B', 'D']
+    assert api.get('/todos?sort=nope').status_code == 400
+
+def test_update_and_delete(api):
+    todo_id = api.post('/todos', json={'title': 'Change me'}).json['id']
+    response = api.put(f'/todos/{todo_id}', json={'completed': True, 'description': 'Done'})
+    assert response.status_code == 200
+    assert response.json['completed'] == True
+    assert response.json['description'] == 'Done'
+    assert response.json['title'] == 'Change me'
+    assert api.put(f'/todos/{todo_id}', json={'priority': 7}).status_code == 400
+    assert api.put(f'/todos/{todo_id}', json={'completed': None}).status_code == 400
+
+    response = api.delete(f'/todos/{todo_id}')
+    assert response.status_code == 200
+    assert response.json == {'message': 'ToDo item deleted'}
+    assert api.get(f'/todos/{todo_id}').status_code == 404
+    assert api.delete(f'/todos/{todo_id}').status_code == 404
+    assert api.put(f'/todos/{todo_id}', json={'title': 'Gone'}).status_code == 404
+
+def test_patch(api):
+    todo_id = api.post('/todos', json={'title': 'Patch me', 'description': 'Kept'}).json['id']
+    response = api.patch(f'/todos/{todo_id}', json={'completed': True})
+    assert response.status_code == 200
+    assert response.json == {
+        'id': todo_id, 'title': 'Patch me', 'completed': True, 'description': 'Kept', 'priority': 1,
+    }
+    assert response.headers['ETag'] == f'"todo-{todo_id}-v2"'
+    response = api.patch(f'/todos/{todo_id}?fields=id,priority', json={'priority': 3})
+    assert response.json == {'id': todo_id, 'priority': 3}
+    assert api.get(f'/todos/{todo_id}').json['priority'] == 3
+    assert api.patch(f'/todos/{todo_id}', json={'priority': 7}).status_code == 400
+    assert api.patch('/todos/999', json={'title': 'Nobody'}).status_code == 404
+    assert api.patch(f'/lists/2/todos/{todo_id}', json={'title': 'Elsewhere'}).status_code == 404
+
+def test_sparse_fieldsets(api):
+    for title in ('A', 'B', 'C'):
+        api.post('/todos', json={'title': title, 'description': 'Long text'})
+    response = api.get('/todos?fields=title,completed&sort=-title&limit=2')
+    assert response.json == [{'title': 'C', 'completed': False}, {'title': 'B', 'completed': False}]
+    cursor = response.headers['X-Next-Cursor']
+    response = api.get(f'/todos?fields=title,completed&sort=-title&limit=2&after={cursor}')
+    assert response.json == [{'title': 'A', 'completed': False}]
+
+    full = api.get('/todos/1')
+    response = api.get('/todos/1?fields=id,title')
+    assert response.json == {'id': 1, 'title': 'A'}
+    assert response.headers['ETag'] != full.headers['ETag']
+    assert api.get('/todos/1?fields=id,title', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    assert api.get('/todos?fields=nope').status_code == 400
+    assert api.get('/todos/1?fields=').status_code == 400
+
+def test_if_match(api):
+    todo_id = api.post('/todos', json={'title': 'Shared'}).json['id']
+    etag = api.get(f'/todos/{todo_id}').headers['ETag']
+    # The first writer wins; the second, holding the same ETag, gets 412
+    response = api.put(f'/todos/{todo_id}', json={'title': 'Mine'}, headers={'If-Match': etag})
+    assert response.status_code == 200
+    new_etag = response.headers['ETag']
+    response = api.patch(f'/todos/{todo_id}', json={'title': 'Theirs'}, headers={'If-Match': etag})
+    assert response.status_code == 412
+    assert response.headers['ETag'] == new_etag
+    assert api.delete(f'/todos/{todo_id}', headers={'If-Match': etag}).status_code == 412
+    assert api.get(f'/todos/{todo_id}').json['title'] == 'Mine'
+    # Any of several ETags, or *, matches
+    response = api.put(f'/todos/{todo_id}', json={'completed': True}, headers={'If-Match': f'{etag}, {new_etag}'})
+    assert response.status_code == 200
+    assert api.put(f'/todos/{todo_id}', json={'priority': 2}, headers={'If-Match': '*'}).status_code == 200
+    assert api.put(f'/todos/{todo_id}', json={'priority': 2}, headers={'If-Match': '"other"'}).status_code == 412
+    etag = api.get(f'/todos/{todo_id}').headers['ETag']
+    assert api.delete(f'/todos/{todo_id}', headers={'If-Match': etag}).status_code == 200
+    assert api.put(f'/todos/{todo_id}', json={'title': 'Gone'}, headers={'If-Match': etag}).status_code == 404
+
+def test_conditional_get(api):
+    todo_id = api.post('/todos', json={'title': 'Tagged'}).json['id']
+    etag = api.get(f'/todos/{todo_id}').headers['ETag']
+    assert etag == f'"todo-{todo_id}-v1"'
+    response = api.get(f'/todos/{todo_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    list_etag = api.get('/todos').headers['ETag']
+    assert api.get('/todos', headers={'If-None-Match': list_etag}).status_code == 304
+    api.put(f'/todos/{todo_id}', json={'title': 'Retagged'})
+    assert api.get(f'/todos/{todo_id}', headers={'If-None-Match': etag}).status_code == 200
+    assert api.get('/todos', headers={'If-None-Match': list_etag}).status_code == 200
+
+def test_writes_reach_change_feed(api):
+    todo_id = api.post('/todos', json={'title': 'Fed'}).json['id']
+    api.delete(f'/todos/{todo_id}')
+    # Served by the Flask app in both modes
+    changes = api.get('/todos/changes').json['changes']
+    assert [(change['op'], change['id']) for change in changes] == [('delete', todo_id)]
+
+def test_large_responses_are_gzipped(api):
+    for i in range(40):
+        api.post('/todos', json={'title': f'Compressed {i}'})
+    response = api.get('/todos', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert len(response.json) == 40
+
+def test_lists_are_isolated(api):
+    todo_id = api.post('/lists/2/todos', json={'title': 'Second list'}).json['id']
+    api.post('/todos', json={'title': 'Default list'})
+    assert [todo['title'] for todo in api.get('/lists/2/todos').json] == ['Second list']
+    assert [todo['title'] for todo in api.get('/todos').json] == ['Default list']
+    assert api.get(f'/lists/2/todos/{todo_id}').status_code == 200
+    assert api.get(f'/todos/{todo_id}').status_code == 404
+    assert api.put(f'/todos/{todo_id}', json={'title': 'Moved'}).status_code == 404
+    assert api.delete(f'/lists/2/todos/{todo_id}').status_code == 200
+    changes = api.get('/lists/2/todos/changes').json['changes']
+    assert [(change['op'], change['id']) for change in changes] == [('delete', todo_id)]
+
+def test_idempotency_keys(api):
+    headers = {'Idempotency-Key': 'abc'}
+    first = api.post('/lists/2/todos', json={'title': 'Once'}, headers=headers)
+    assert first.status_code == 201
+    retry = api.post('/lists/2/todos', json={'title': 'Once'}, headers=headers)
+    assert retry.status_code == 201
+    assert retry.json == first.json
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert api.post('/lists/2/todos', json={'title': 'Other'}, headers=headers).status_code == 422
+    assert len(api.get('/lists/2/todos').json) == 1
+
+def test_put_fields_and_empty_put(api):
+    todo_id = api.post('/todos', json={'title': 'Put me'}).json['id']
+    response = api.put(f'/todos/{todo_id}?fields=id', json={'completed': True})
+    assert response.json == {'id': todo_id}
+    assert response.headers['ETag'] == f'"todo-{todo_id}-v2-id"'
+    assert api.put(f'/todos/{todo_id}?fields=nope', json={'completed': True}).status_code == 400
+    # An update without fields writes nothing
+    response = api.put(f'/todos/{todo_id}', json={})
+    assert response.status_code == 200
+    assert response.json['completed'] is True
+    assert response.headers['ETag'] == f'"todo-{todo_id}-v2"'
+    assert api.put(f'/todos/{todo_id}', json={}, headers={'If-Match': '"todo-1-v1"'}).status_code == 412
+    assert api.put('/todos/999', json={}).status_code == 404
+    changes = api.get('/todos/changes').json['changes']
+    assert [(change['op'], change['seq']) for change in changes] == [('upsert', 2)]
+
+def test_compressed_responses_have_their_own_etag(api):
+    todo_id = api.post('/todos', json={'title': 'Big', 'description': 'x' * 1024}).json['id']
+    gzip_only = {'Accept-Encoding': 'gzip'}
+    plain = api.get(f'/todos/{todo_id}', headers={'Accept-Encoding': 'identity'})
+    assert plain.headers['ETag'] == f'"todo-{todo_id}-v1"'
+    response = api.get(f'/todos/{todo_id}', headers=gzip_only)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    etag = response.headers['ETag']
+    assert etag == f'"todo-{todo_id}-v1+gzip"'
+    # Either tag validates the item
+    response = api.get(f'/todos/{todo_id}', headers={**gzip_only, 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert api.get(f'/todos/{todo_id}', headers={'If-None-Match': plain.headers['ETag']}).status_code == 304
+    assert api.put(f'/todos/{todo_id}', json={'title': 'Bigger'}, headers={'If-Match': etag}).status_code == 200
@@ -0,0 +1,43 @@
+import pytest
+from sqlalchemy import text
+from app import create_app, db
+
+
+def test_production_profile_configures_sqlite(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/todo.db',
+        'DATABASE_PROFILE': 'production',
+        'SQLALCHEMY_ENGINE_OPTIONS': {'pool_size': 3},
+    })
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size'] == 3
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_pre_ping'] is True
+    with app.app_context():
+        with db.engine.connect() as connection:
+            assert connection.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+            assert connection.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+            assert connection.execute(text('PRAGMA busy_timeout')).scalar() == 5000
+        assert db.engine.pool.size() == 3
+        db.engine.dispose()
+
+def test_production_profile_custom_pragmas(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/todo.db',
+        'DATABASE_PROFILE': 'production',
+        'SQLITE_PRAGMAS': {'busy_timeout': 100},
+    })
+    with app.app_context():
+        with db.engine.connect() as connection:
+            assert connection.execute(text('PRAGMA busy_timeout')).scalar() == 100
+            assert connection.execute(text('PRAGMA journal_mode')).scalar() == 'delete'
+        db.engine.dispose()
+
+def test_production_profile_ignores_memory_database():
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'DATABASE_PROFILE': 'production',
+    })
+    assert 'pool_size' not in app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+
+def test_unknown_profile():
+    with pytest.raises(ValueError):
+        create_app({'DATABASE_PROFILE': 'turbo'})
@@ -0,0 +1,46 @@
+from app.events import CLOSED, InProcessBroker, event_stream
+
+
+def test_broker_fans_out_to_subscribers():
+    broker = InProcessBroker()
+    first = broker.subscribe()
+    second = broker.subscribe()
+    broker.publish({'seq': 1, 'op': 'created', 'id': 1})
+    assert first.get(timeout=0)['id'] == 1
+    assert second.get(timeout=0)['id'] == 1
+    assert first.get(timeout=0) is None
+
+def test_broker_drops_slow_subscriber():
+    broker = InProcessBroker(max_queue_size=2)
+    slow = broker.subscribe()
+    fast = broker.subscribe()
+    for seq in range(3):
+        broker.publish({'seq': seq, 'op': 'created', 'id': seq})
+        assert fast.get(timeout=0)['seq'] == seq
+    assert slow.dropped
+    assert broker.dropped == 1
+    assert len(broker) == 1
+    # The dropped subscriber is told to disconnect
+    events = [slow.get(timeout=0) for _ in range(2)]
+    assert events[-1] is CLOSED
+
+def test_event_stream_heartbeat_and_unsubscribe():
+    broker = InProcessBroker()
+    subscription = broker.subscribe()
+    stream = event_stream(broker, subscription, heartbeat=0.01)
+    assert next(stream) == 'retry: 10\n\n'
+    assert next(stream) == ': keep-alive\n\n'
+    broker.publish({'seq': 7, 'op': 'deleted', 'id': 3})
+    assert next(stream).startswith('id: 7\nevent: deleted\ndata: ')
+    stream.close()
+    assert len(broker) == 0
+
+def test_event_stream_filters_by_list():
+    broker = InProcessBroker()
+    subscription = broker.subscribe()
+    stream = event_stream(broker, subscription, heartbeat=0.01, list_id=2)
+    next(stream)
+    broker.publish({'list_id': 1, 'seq': 1, 'op': 'created', 'id': 1})
+    broker.publish({'list_id': 2, 'seq': 1, 'op': 'created', 'id': 2})
+    assert next(stream).startswith('id: 1\nevent: created\ndata: {"list_id": 2')
+    stream.close()
@@ -0,0 +1,119 @@
+import pytest
+
+from app import create_app, db
+from app.idempotency import (
+    IdempotencyRecord, MemoryIdempotencyStore, SQLiteIdempotencyStore, request_fingerprint,
+)
+from app.models import ToDo
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def app(request):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'IDEMPOTENCY_STORE': request.param})
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def count_todos():
+    return db.session.query(ToDo).count()
+
+
+def test_retry_replays_response_without_inserting(client):
+    headers = {'Idempotency-Key': 'k1'}
+    first = client.post('/todos', json={'title': 'Once'}, headers=headers)
+    second = client.post('/todos', json={'title': 'Once'}, headers=headers)
+    assert first.status_code == second.status_code == 201
+    assert second.json == first.json
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert 'Idempotent-Replayed' not in first.headers
+    assert count_todos() == 1
+    # A new key creates a new item
+    client.post('/todos', json={'title': 'Once'}, headers={'Idempotency-Key': 'k2'})
+    assert count_todos() == 2
+
+def test_requests_without_key_are_not_deduplicated(client):
+    client.post('/todos', json={'title': 'Twice'})
+    client.post('/todos', json={'title': 'Twice'})
+    assert count_todos() == 2
+
+def test_key_reused_for_different_request(client):
+    headers = {'Idempotency-Key': 'k1'}
+    client.post('/todos', json={'title': 'One'}, headers=headers)
+    response = client.post('/todos', json={'title': 'Other'}, headers=headers)
+    assert response.status_code == 422
+    response = client.post('/lists/2/todos', json={'title': 'One'}, headers=headers)
+    assert response.status_code == 422
+    assert count_todos() == 1
+
+def test_batch_create_is_idempotent(client):
+    headers = {'Idempotency-Key': 'batch-1'}
+    body = [{'title': 'A'}, {'title': 'B'}]
+    first = client.post('/todos/batch', json=body, headers=headers)
+    second = client.post('/todos/batch', json=body, headers=headers)
+    assert second.json == first.json
+    assert count_todos() == 2
+
+def test_client_errors_are_replayed(client):
+    headers = {'Idempotency-Key': 'bad'}
+    assert client.post('/todos', json={}, headers=headers).status_code == 400
+    response = client.post('/todos', json={}, headers=headers)
+    assert response.status_code == 400
+    assert response.headers['Idempotent-Replayed'] == 'true'
+
+def test_invalid_key(client):
+    response = client.post('/todos', json={'title': 'x'}, headers={'Idempotency-Key': 'x' * 256})
+    assert response.status_code == 400
+
+def test_in_progress_request_conflicts(app, client):
+    store = app.extensions['todo_idempotency']
+    with app.test_request_context('/todos', method='POST', json={'title': 'Slow'}):
+        assert store.reserve('slow', request_fingerprint()) is None
+    response = client.post('/todos', json={'title': 'Slow'}, headers={'Idempotency-Key': 'slow'})
+    assert response.status_code == 409
+    assert response.headers['Retry-After'] == '1'
+    store.release('slow')
+    response = client.post('/todos', json={'title': 'Slow'}, headers={'Idempotency-Key': 'slow'})
+    assert response.status_code == 201
+
+def test_failed_request_can_be_retried(app, client, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError('database unavailable')
+    monkeypatch.setattr('app.routes.commit_changes', fail)
+    app.testing = False
+    headers = {'Idempotency-Key': 'retry'}
+    assert client.post('/todos', json={'title': 'x'}, headers=headers).status_code == 500
+    monkeypatch.undo()
+    assert client.post('/todos', json={'title': 'x'}, headers=headers).status_code == 201
+
+
+@pytest.mark.parametrize('make_store', [
+    lambda clock: MemoryIdempotencyStore(ttl=60, lock_timeout=10, clock=clock),
+    lambda clock: SQLiteIdempotencyStore(ttl=60, lock_timeout=10, clock=clock),
+])
+def test_store_expiry_and_abandoned_claims(app, make_store, clock):
+    clock.now = 1000.0
+    store = make_store(clock)
+    assert store.reserve('k', 'f') is None
+    assert store.reserve('k', 'f') == IdempotencyRecord('f', None, None, 1000.0)
+    clock.now += 10  # the claim is abandoned
+    assert store.reserve('k', 'f') is None
+    store.complete('k', 201, '{}')
+    assert store.reserve('k', 'f').status == 201
+    clock.now += 60  # the response has expired
+    assert store.reserve('k', 'g') is None
+
+def test_store_can_be_disabled():
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'IDEMPOTENCY_STORE': None})
+    with app.app_context():
+        db.create_all()
+        client = app.test_client()
+        for _ in range(2):
+            client.post('/todos', json={'title': 'x'}, headers={'Idempotency-Key': 'k'})
+        assert count_todos() == 2
@@ -0,0 +1,53 @@
+import logging
+
+import pytest
+from sqlalchemy import text
+from app import create_app, db
+from app.instrumentation import Histogram
+
+
+@pytest.fixture
+def app():
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((1, 5))
+    for value in (0.5, 1, 3, 10):
+        histogram.observe(value)
+    assert list(histogram.samples()) == [(1, 2), (5, 3), ('+Inf', 4)]
+    assert histogram.sum == 14.5
+    assert histogram.count == 4
+
+def test_server_timing_header(app):
+    client = app.test_client()
+    response = client.get('/todos')
+    timing = response.headers['Server-Timing']
+    assert timing.startswith('app;dur=')
+    assert 'db;dur=' in timing
+    assert 'queries"' in timing
+
+def test_metrics_endpoint(app):
+    client = app.test_client()
+    client.post('/todos', json={'title': 'Measured'})
+    client.get('/todos/1')
+    client.get('/todos/9999')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    body = response.data.decode()
+    assert 'todo_http_requests_total{route="/todos",method="POST",status="201"} 1' in body
+    assert 'todo_http_requests_total{route="/todos/<int:id>",method="GET",status="404"} 1' in body
+    assert 'todo_http_request_duration_seconds_bucket{route="/todos/<int:id>",method="GET",le="+Inf"} 2' in body
+    assert 'todo_db_queries_per_request_count{route="/todos",method="POST"} 1' in body
+
+def test_slow_queries_are_logged(caplog):
+    slow = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'SLOW_QUERY_THRESHOLD': 0})
+    with slow.app_context(), caplog.at_level(logging.WARNING, logger='app.instrumentation'):
+        db.session.execute(text('SELECT 1'))
+        assert 'Slow query' in caplog.text
+        assert slow.extensions['todo_metrics'].slow_queries == 1
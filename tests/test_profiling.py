@@ -0,0 +1,52 @@
+import os
+import pstats
+
+import pytest
+from app import create_app, db
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'PROFILING_ENABLED': True,
+        'PROFILING_DIR': str(tmp_path),
+        'PROFILING_INTERVAL': 0.0005,
+    })
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def test_profile_on_request(app, tmp_path):
+    client = app.test_client()
+    response = client.get('/todos', headers={'X-Profile': '1'})
+    assert response.status_code == 200
+    profile_id = response.headers['X-Profile-Id']
+    assert profile_id.startswith('get_todos/')
+    stats = pstats.Stats(os.path.join(tmp_path, profile_id + '.pstats'))
+    assert stats.total_calls > 0
+    assert os.path.exists(os.path.join(tmp_path, profile_id + '.collapsed'))
+
+def test_no_profile_without_opt_in(app, tmp_path):
+    response = app.test_client().get('/todos')
+    assert 'X-Profile-Id' not in response.headers
+    assert os.listdir(tmp_path) == []
+
+def test_profile_secret(app, tmp_path):
+    app.config['PROFILING_SECRET'] = 's3cret'
+    client = app.test_client()
+    assert 'X-Profile-Id' not in client.get('/todos?profile=1').headers
+    assert 'X-Profile-Id' in client.get('/todos?profile=s3cret').headers
+
+def test_profile_sampling(app):
+    app.config['PROFILING_SAMPLE_RATE'] = 1.0
+    assert 'X-Profile-Id' in app.test_client().get('/todos').headers
+
+def test_profiling_disabled_by_default():
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        response = app.test_client().get('/todos', headers={'X-Profile': '1'})
+    assert 'X-Profile-Id' not in response.headers
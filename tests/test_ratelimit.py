@@ -0,0 +1,130 @@
+import pytest
+
+from app import create_app, db
+from app.ratelimit import MemoryRateLimitBackend
+
+
+def make_app(**config):
+    app = create_app(dict({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'RATELIMIT_ENABLED': True,
+    }, **config))
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def test_token_bucket_refills_over_time(clock):
+    backend = MemoryRateLimitBackend(clock=clock)
+    assert [backend.consume('k', rate=2, burst=3) for _ in range(3)] == [0, 0, 0]
+    assert backend.consume('k', rate=2, burst=3) == 0.5
+    clock.now = 0.5
+    assert backend.consume('k', rate=2, burst=3) == 0
+    assert backend.consume('other', rate=2, burst=3) == 0
+
+def test_memory_backend_is_bounded(clock):
+    backend = MemoryRateLimitBackend(max_keys=2, clock=clock)
+    for key in 'abc':
+        backend.consume(key, rate=1, burst=1)
+    assert len(backend) == 2
+
+def test_route_limit_returns_429_with_retry_after(clock):
+    app = make_app(
+        RATELIMIT_BACKEND=MemoryRateLimitBackend(clock=clock),
+        RATELIMIT_ROUTES={'create_todo': (0.5, 2)},
+    )
+    client = app.test_client()
+    assert [client.post('/todos', json={'title': 'x'}).status_code for _ in range(2)] == [201, 201]
+    response = client.post('/todos', json={'title': 'x'})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '2'
+    assert response.json == {'error': 'Too many requests'}
+    # Other routes, and other clients, are not affected
+    assert client.get('/todos').status_code == 200
+    other = client.post('/todos', json={'title': 'x'}, environ_base={'REMOTE_ADDR': '10.0.0.2'})
+    assert other.status_code == 201
+    clock.now = 2
+    assert client.post('/todos', json={'title': 'x'}).status_code == 201
+    assert app.extensions['todo_ratelimit'].stats()['rate_limited'] == 1
+
+def test_default_limit_and_key_func(clock):
+    app = make_app(
+        RATELIMIT_BACKEND=MemoryRateLimitBackend(clock=clock),
+        RATELIMIT_DEFAULT=(1, 1),
+        RATELIMIT_ROUTES={'get_todo_by_id': None},
+        RATELIMIT_KEY_FUNC=lambda request: request.headers.get('X-Api-Key', 'anonymous'),
+    )
+    client = app.test_client()
+    assert client.get('/todos').status_code == 200
+    assert client.get('/todos').status_code == 429
+    assert client.get('/todos', headers={'X-Api-Key': 'other'}).status_code == 200
+    assert client.get('/todos/1').status_code == 404  # unlimited route
+    assert client.get('/todos/1').status_code == 404
+    assert client.get('/metrics').status_code == 200  # exempt
+
+def test_load_is_shed_beyond_max_in_flight():
+    app = make_app(RATELIMIT_MAX_IN_FLIGHT=1, RATELIMIT_SHED_RETRY_AFTER=3)
+    controller = app.extensions['todo_ratelimit']
+    client = app.test_client()
+    assert client.get('/todos').status_code == 200
+    assert controller.stats()['in_flight'] == 0
+    controller.process.acquire()  # another request in flight
+    response = client.get('/todos')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
+    controller.process.release()
+    assert client.get('/todos').status_code == 200
+    assert controller.stats()['shed'] == 1
+
+def test_client_concurrency_limit():
+    app = make_app(RATELIMIT_CLIENT_CONCURRENCY=1)
+    controller = app.extensions['todo_ratelimit']
+    client = app.test_client()
+    controller.clients.acquire('127.0.0.1')
+    assert client.get('/todos').status_code == 429
+    assert client.get('/todos', environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code == 200
+    controller.clients.release('127.0.0.1')
+    assert client.get('/todos').status_code == 200
+    assert controller.clients.in_flight('127.0.0.1') == 0
+
+def test_client_named_none_is_released():
+    app = make_app(RATELIMIT_CLIENT_CONCURRENCY=1, RATELIMIT_MAX_IN_FLIGHT=1,
+                   RATELIMIT_KEY_FUNC=lambda request: None)
+    controller = app.extensions['todo_ratelimit']
+    client = app.test_client()
+    assert [client.get('/todos').status_code for _ in range(2)] == [200, 200]
+    assert controller.clients.in_flight(None) == 0
+    assert controller.stats()['in_flight'] == 0
+
+def test_asgi_routes_are_admitted(tmp_path, clock):
+    pytest.importorskip('aiosqlite')
+    testclient = pytest.importorskip('starlette.testclient')
+    from app.asgi import create_asgi_app
+    app = create_asgi_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/todo.db',
+        'RATELIMIT_ENABLED': True,
+        'RATELIMIT_BACKEND': MemoryRateLimitBackend(clock=clock),
+        'RATELIMIT_ROUTES': {'create_todo': (0.5, 1)},
+        'RATELIMIT_MAX_IN_FLIGHT': 1,
+    })
+    flask_app = app.state.flask_app
+    with flask_app.app_context():
+        db.create_all()
+    controller = flask_app.extensions['todo_ratelimit']
+    with testclient.TestClient(app) as client:
+        assert client.post('/todos', json={'title': 'x'}).status_code == 201
+        response = client.post('/todos', json={'title': 'x'})
+        assert response.status_code == 429
+        assert response.headers['Retry-After'] == '2'
+        assert response.json() == {'error': 'Too many requests'}
+        assert client.get('/todos').status_code == 200
+        controller.process.acquire()  # another request in flight
+        assert client.get('/todos/1').status_code == 503
+        controller.process.release()
+    assert controller.stats() == {'in_flight': 0, 'shed': 1, 'rate_limited': 1, 'concurrency_limited': 0}
+    with flask_app.app_context():
+        db.engine.dispose()
+
+def test_disabled_by_default():
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    assert 'todo_ratelimit' not in app.extensions
@@ -0,0 +1,88 @@
+import re
+import shutil
+
+import pytest
+
+from app import create_app, db
+from app.replicas import READ_YOUR_WRITES_COOKIE, Replica, ReplicaRouter
+
+
+def make_app(tmp_path, replicas=2, **config):
+    """A primary plus `replicas` copies of it, as of before any write."""
+    primary = tmp_path / 'primary.db'
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{primary}'})
+    with app.app_context():
+        db.create_all()
+        db.engine.dispose()
+    uris = []
+    for i in range(replicas):
+        shutil.copy(primary, tmp_path / f'replica{i}.db')
+        uris.append(f'sqlite:///{tmp_path}/replica{i}.db')
+    return create_app(dict({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{primary}',
+        'SQLALCHEMY_REPLICAS': uris,
+        'CACHE_ENABLED': False,
+    }, **config))
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path)
+    yield app
+    app.extensions['todo_replicas'].dispose()
+
+
+def test_gets_read_from_replicas_and_writes_go_to_primary(app):
+    client = app.test_client()
+    todo_id = client.post('/todos', json={'title': 'Written'}).json['id']
+    # The replicas are stale copies, so reads do not see the write yet
+    assert client.get('/todos').json == []
+    assert client.get(f'/todos/{todo_id}').status_code == 404
+    # Writes (and the reads they make) use the primary
+    assert client.put(f'/todos/{todo_id}', json={'completed': True}).status_code == 200
+    router = app.extensions['todo_replicas']
+    assert router.stats()['replicas'] == {'replica_0': True, 'replica_1': True}
+
+def test_replica_queries_are_instrumented(app):
+    response = app.test_client().get('/todos')
+    queries = re.search(r'desc="(\d+) queries"', response.headers['Server-Timing']).group(1)
+    assert int(queries) > 0
+
+def test_replicas_are_used_round_robin(app, tmp_path):
+    # Write directly to one replica to tell them apart
+    with app.extensions['todo_replicas'].replicas[1].engine.begin() as connection:
+        connection.exec_driver_sql("INSERT INTO to_do (title, list_id) VALUES ('Only on replica 1', 1)")
+    client = app.test_client()
+    counts = [len(client.get('/todos').json) for _ in range(4)]
+    assert sorted(counts) == [0, 0, 1, 1]
+
+def test_read_your_writes(tmp_path):
+    app = make_app(tmp_path, REPLICA_READ_YOUR_WRITES=5)
+    client = app.test_client()
+    response = client.post('/todos', json={'title': 'Mine'})
+    assert READ_YOUR_WRITES_COOKIE in response.headers['Set-Cookie']
+    assert [todo['title'] for todo in client.get('/todos').json] == ['Mine']
+    # Other clients read from the replicas
+    assert app.test_client().get('/todos').json == []
+
+def test_unhealthy_replicas_fall_back_to_primary(tmp_path):
+    app = make_app(tmp_path, replicas=1)
+    (tmp_path / 'replica0.db').unlink()  # now an empty database without the schema
+    client = app.test_client()
+    client.post('/todos', json={'title': 'Primary'})
+    assert [todo['title'] for todo in client.get('/todos').json] == ['Primary']
+    router = app.extensions['todo_replicas']
+    assert router.stats() == {'replicas': {'replica_0': False}, 'fallbacks': 1}
+
+def test_router_rechecks_failed_replicas(clock):
+    replica = Replica('replica_0', engine=None)
+    router = ReplicaRouter([], check_interval=5, clock=clock)
+    router.replicas = [replica]
+    checks = []
+    router.check = lambda replica: checks.append(clock.now) or setattr(replica, 'checked_at', clock.now)
+    assert router.choose() is replica
+    router.mark_unhealthy(replica)
+    assert router.choose() is None
+    clock.now = 5
+    router.choose()
+    assert checks == [0, 5]
@@ -1,4 +1,8 @@
+import gzip
+import json
+import sqlite3
 import pytest
+from sqlalchemy import event
 from app import create_app, db
 from app.models import ToDo
 
@@ -107,6 +111,12 @@ def test_create_todo_missing_title(client):
     assert response.status_code == 400
     assert b'Title is required' in response.data
     
+def test_create_todo_invalid_title(client):
+    for title in (None, 123, 'x' * 129):
+        response = client.post('/todos', json={'title': title})
+        assert response.status_code == 400
+        assert response.json == {'error': 'Title must be a string of at most 128 characters'}
+
 def test_create_todo_invalid_priority(client):
     response = client.post(
         '/todos', json={'title': 'Invalid Priority', 'priority': 4}
@@ -148,6 +158,14 @@ def test_update_todo_invalid_priority(client):
     assert response.status_code == 400
     assert b'Priority must be 1, 2, or 3' in response.data
 
+def test_update_todo_invalid_completed(client):
+    todo_id = client.post('/todos', json={'title': 'Invalid Completed'}).json['id']
+    for completed in (None, 'yes', 1):
+        response = client.put(f'/todos/{todo_id}', json={'completed': completed})
+        assert response.status_code == 400
+        assert response.json == {'error': 'Completed must be true or false'}
+    assert client.get(f'/todos/{todo_id}').json['completed'] is False
+
 def test_delete_todo_success(client):
     response = client.post('/todos', json={'title': 'Delete Test Todo'})
     assert response.status_code == 201
@@ -164,3 +182,609 @@ def test_delete_todo_success(client):
 def test_delete_todo_not_found(client):
     response = client.delete('/todos/9999')
     assert response.status_code == 404
+
+def test_if_match_can_be_required(app, client):
+    app.config['TODOS_REQUIRE_IF_MATCH'] = True
+    todo_id = client.post('/todos', json={'title': 'Guarded'}).json['id']
+    for method in ('put', 'patch', 'delete'):
+        response = getattr(client, method)(f'/todos/{todo_id}', json={'title': 'Unguarded'})
+        assert response.status_code == 428
+    etag = client.get(f'/todos/{todo_id}').headers['ETag']
+    response = client.patch(f'/todos/{todo_id}', json={'title': 'Guarded'}, headers={'If-Match': etag})
+    assert response.status_code == 200
+
+def test_if_match_accepts_sparse_etags(client):
+    todo_id = client.post('/todos', json={'title': 'Sparse'}).json['id']
+    etag = client.get(f'/todos/{todo_id}?fields=title').headers['ETag']
+    assert client.put(f'/todos/{todo_id}', json={'title': 'Dense'}, headers={'If-Match': etag}).status_code == 200
+    assert client.put(f'/todos/{todo_id}', json={'title': 'Again'}, headers={'If-Match': etag}).status_code == 412
+    # Another item's ETag never matches
+    other = client.post('/todos', json={'title': 'Other'}).json['id']
+    other_etag = client.get(f'/todos/{other}').headers['ETag']
+    assert client.delete(f'/todos/{todo_id}', headers={'If-Match': other_etag}).status_code == 412
+
+def test_if_match_of_deleted_item_never_matches(client):
+    todo_id = client.post('/todos', json={'title': 'Deleted'}).json['id']
+    etag = client.get(f'/todos/{todo_id}').headers['ETag']
+    client.delete(f'/todos/{todo_id}')
+    new_id = client.post('/todos', json={'title': 'Recreated'}).json['id']
+    for id in (todo_id, new_id):
+        response = client.put(f'/todos/{id}', json={'title': 'Stale'}, headers={'If-Match': etag})
+        assert response.status_code in (404, 412)
+        assert client.delete(f'/todos/{id}', headers={'If-Match': etag}).status_code in (404, 412)
+    assert client.get(f'/todos/{new_id}').json['title'] == 'Recreated'
+
+def test_get_todos_paginated(client, populate_todos):
+    response = client.get('/todos?limit=3')
+    assert response.status_code == 200
+    assert [todo['title'] for todo in response.json] == [
+        'First Todo', 'Second Todo', 'Third Todo'
+    ]
+    cursor = response.headers['X-Next-Cursor']
+    assert 'rel="next"' in response.headers['Link']
+
+    seen = [todo['id'] for todo in response.json]
+    while cursor:
+        response = client.get(f'/todos?limit=3&after={cursor}')
+        assert response.status_code == 200
+        seen.extend(todo['id'] for todo in response.json)
+        cursor = response.headers.get('X-Next-Cursor')
+    assert len(seen) == 8
+    assert seen == sorted(seen)
+
+def test_get_todos_limit_is_capped(app, client, populate_todos):
+    app.config['TODOS_MAX_PAGE_SIZE'] = 5
+    response = client.get('/todos?limit=100')
+    assert response.status_code == 200
+    assert len(response.json) == 5
+    assert 'X-Next-Cursor' in response.headers
+
+def test_get_todos_invalid_pagination(client):
+    response = client.get('/todos?limit=0')
+    assert response.status_code == 400
+    response = client.get('/todos?limit=abc')
+    assert response.status_code == 400
+    response = client.get('/todos?after=not-a-cursor')
+    assert response.status_code == 400
+    assert b'Invalid cursor' in response.data
+
+def test_export_todos_ndjson(app, client, populate_todos):
+    app.config['TODOS_EXPORT_BATCH_SIZE'] = 3
+    response = client.get('/todos/export')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.data.decode().splitlines()
+    todos = [json.loads(line) for line in lines]
+    assert len(todos) == 8
+    assert todos[0]['title'] == 'First Todo'
+    assert todos[3]['description'] == 'This is the fourth todo'
+    assert todos[6]['priority'] == 2
+
+def test_export_todos_json_array(app, client, populate_todos):
+    app.config['TODOS_EXPORT_BATCH_SIZE'] = 3
+    response = client.get(
+        '/todos/export', headers={'Accept': 'application/json'}
+    )
+    assert response.status_code == 200
+    assert response.mimetype == 'application/json'
+    assert len(json.loads(response.data)) == 8
+
+def test_export_todos_fields(client, populate_todos):
+    response = client.get('/todos/export?fields=id,completed')
+    todos = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert todos[1] == {'id': 2, 'completed': True}
+    assert client.get('/todos/export?fields=secret').status_code == 400
+
+def test_export_todos_empty(client):
+    response = client.get('/todos/export')
+    assert response.status_code == 200
+    assert response.data == b''
+    response = client.get(
+        '/todos/export', headers={'Accept': 'application/json'}
+    )
+    assert json.loads(response.data) == []
+
+def test_get_todos_filter_completed(client, populate_todos):
+    response = client.get('/todos?completed=true')
+    assert response.status_code == 200
+    assert {todo['title'] for todo in response.json} == {
+        'Second Todo', 'Fifth Todo', 'Eighth Todo'
+    }
+    response = client.get('/todos?completed=false')
+    assert len(response.json) == 5
+    assert all(not todo['completed'] for todo in response.json)
+
+def test_get_todos_filter_priority(client, populate_todos):
+    response = client.get('/todos?priority=2')
+    assert response.status_code == 200
+    assert [todo['title'] for todo in response.json] == ['Seventh Todo']
+    response = client.get('/todos?priority=1,2&completed=false')
+    assert len(response.json) == 5
+
+def test_get_todos_sorted(client, populate_todos):
+    response = client.get('/todos?sort=-priority,-id')
+    assert response.status_code == 200
+    titles = [todo['title'] for todo in response.json]
+    assert titles[0] == 'Seventh Todo'
+    assert titles[1:] == [
+        'Eighth Todo', 'Sixth Todo', 'Fifth Todo', 'Fourth Todo',
+        'Third Todo', 'Second Todo', 'First Todo',
+    ]
+
+def test_get_todos_sorted_paginated(client, populate_todos):
+    expected = client.get('/todos?sort=completed,-priority').json
+    seen = []
+    url = '/todos?sort=completed,-priority&limit=3'
+    response = client.get(url)
+    seen.extend(response.json)
+    while 'X-Next-Cursor' in response.headers:
+        response = client.get(f"{url}&after={response.headers['X-Next-Cursor']}")
+        seen.extend(response.json)
+    assert seen == expected
+    assert len(seen) == 8
+
+def test_get_todos_invalid_filters(client):
+    assert client.get('/todos?completed=maybe').status_code == 400
+    assert client.get('/todos?priority=4').status_code == 400
+    assert client.get('/todos?sort=description').status_code == 400
+    # A cursor must match the requested sort keys
+    response = client.get('/todos?after=WzVd&sort=priority')
+    assert response.status_code == 400
+
+def test_create_todos_batch(client):
+    response = client.post('/todos/batch', json=[
+        {'title': 'Batch One'},
+        {'title': 'Batch Two', 'description': 'Second', 'priority': 3},
+    ])
+    assert response.status_code == 201
+    results = response.json
+    assert [result['status'] for result in results] == [201, 201]
+    assert results[0]['item']['title'] == 'Batch One'
+    assert results[0]['item']['priority'] == 1
+    assert results[0]['item']['completed'] == False
+    assert results[1]['item']['description'] == 'Second'
+    assert results[1]['item']['priority'] == 3
+    assert len(client.get('/todos').json) == 2
+
+def test_create_todos_batch_invalid_item(client):
+    response = client.post('/todos/batch', json=[
+        {'title': 'Valid'},
+        {'description': 'No title'},
+        {'title': 'Bad priority', 'priority': 5},
+    ])
+    assert response.status_code == 400
+    assert response.json['errors'] == [
+        {'index': 1, 'error': 'Title is required'},
+        {'index': 2, 'error': 'Priority must be 1, 2, or 3'},
+    ]
+    # Nothing is written when any item is invalid
+    assert client.get('/todos').json == []
+
+def test_create_todos_batch_invalid_text(client):
+    response = client.post('/todos/batch', json=[
+        {'title': None},
+        {'title': ['a']},
+        {'title': 123},
+        {'title': 'x' * 129},
+        {'title': 'Valid', 'description': {'text': 'nested'}},
+    ])
+    assert response.status_code == 400
+    title_error = 'Title must be a string of at most 128 characters'
+    assert response.json['errors'] == [{'index': i, 'error': title_error} for i in range(4)] + [
+        {'index': 4, 'error': 'Description must be a string of at most 1024 characters'},
+    ]
+    assert client.get('/todos').json == []
+
+def test_create_todos_batch_not_a_list(client):
+    response = client.post('/todos/batch', json={'title': 'Not a list'})
+    assert response.status_code == 400
+
+def test_update_todos_batch(client, populate_todos):
+    todos = client.get('/todos').json
+    response = client.patch('/todos/batch', json=[
+        {'id': todos[0]['id'], 'completed': True},
+        {'id': todos[1]['id'], 'title': 'Renamed', 'priority': 3},
+        {'id': 9999, 'title': 'Missing'},
+    ])
+    assert response.status_code == 200
+    results = response.json
+    assert [result['status'] for result in results] == [200, 200, 404]
+    assert results[0]['item']['completed'] == True
+    assert results[0]['item']['title'] == 'First Todo'
+
+    updated = client.get(f"/todos/{todos[1]['id']}").json
+    assert updated['title'] == 'Renamed'
+    assert updated['priority'] == 3
+    assert updated['completed'] == True
+
+def test_update_todos_batch_keeps_concurrent_writes(tmp_path):
+    path = tmp_path / 'batch.db'
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'CACHE_ENABLED': False})
+    client = app.test_client()
+    with app.app_context():
+        db.create_all()
+        todo_id = client.post('/todos', json={'title': 'Shared'}).json['id']
+
+        written = []
+
+        def concurrent_write(conn, cursor, statement, *args):
+            # Another client commits a write just before the batch writes.
+            if written or not statement.startswith('UPDATE to_do'):
+                return
+            written.append(True)
+            with sqlite3.connect(path) as other:
+                other.execute("UPDATE to_do SET description = 'Concurrent', version = version + 1 WHERE id = ?", (todo_id,))
+
+        event.listen(db.engine, 'before_cursor_execute', concurrent_write)
+        response = client.patch('/todos/batch', json=[{'id': todo_id, 'completed': True}])
+        event.remove(db.engine, 'before_cursor_execute', concurrent_write)
+        assert response.json[0]['item']['description'] == 'Concurrent'
+        response = client.get(f'/todos/{todo_id}')
+        assert response.json['description'] == 'Concurrent'
+        assert response.json['completed'] is True
+        assert response.headers['ETag'] == f'"todo-{todo_id}-v3"'
+        db.engine.dispose()
+
+def test_update_todos_batch_invalid_item(client, populate_todos):
+    todo_id = client.get('/todos').json[0]['id']
+    response = client.patch('/todos/batch', json=[
+        {'id': todo_id, 'priority': 4},
+        {'title': 'No id'},
+    ])
+    assert response.status_code == 400
+    assert [error['index'] for error in response.json['errors']] == [0, 1]
+
+def test_delete_todos_batch(client, populate_todos):
+    ids = [todo['id'] for todo in client.get('/todos').json]
+    response = client.delete('/todos/batch', json=ids[:3] + [9999])
+    assert response.status_code == 200
+    assert [result['status'] for result in response.json] == [200, 200, 200, 404]
+    remaining = [todo['id'] for todo in client.get('/todos').json]
+    assert remaining == ids[3:]
+
+def test_get_todos_is_cached(client, populate_todos):
+    response = client.get('/todos?limit=3')
+    assert response.headers['X-Cache'] == 'MISS'
+    cached = client.get('/todos?limit=3')
+    assert cached.headers['X-Cache'] == 'HIT'
+    assert cached.json == response.json
+    assert cached.headers['X-Next-Cursor'] == response.headers['X-Next-Cursor']
+
+    stats = client.get('/cache/stats').json
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+
+def test_cache_invalidated_on_write(client):
+    todo_id = client.post('/todos', json={'title': 'Cached'}).json['id']
+    assert client.get(f'/todos/{todo_id}').headers['X-Cache'] == 'MISS'
+    assert client.get('/todos').headers['X-Cache'] == 'MISS'
+    assert client.get(f'/todos/{todo_id}').headers['X-Cache'] == 'HIT'
+
+    client.put(f'/todos/{todo_id}', json={'title': 'Changed'})
+    response = client.get(f'/todos/{todo_id}')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert response.json['title'] == 'Changed'
+    assert client.get('/todos').json[0]['title'] == 'Changed'
+
+    client.delete(f'/todos/{todo_id}')
+    assert client.get(f'/todos/{todo_id}').status_code == 404
+    assert client.get('/todos').json == []
+
+def test_cache_invalidated_on_batch_write(client):
+    client.post('/todos/batch', json=[{'title': 'One'}])
+    assert len(client.get('/todos').json) == 1
+    client.post('/todos/batch', json=[{'title': 'Two'}])
+    assert len(client.get('/todos').json) == 2
+
+def test_cache_sees_writes_of_other_processes(tmp_path):
+    config = {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/shared.db'}
+    a, b = create_app(config), create_app(config)
+    with a.app_context():
+        db.create_all()
+    client_a, client_b = a.test_client(), b.test_client()
+    todo_id = client_a.post('/todos', json={'title': 'Before'}).json['id']
+    for path in (f'/todos/{todo_id}', '/todos'):
+        client_b.get(path)
+        assert client_b.get(path).headers['X-Cache'] == 'HIT'
+    client_a.put(f'/todos/{todo_id}', json={'title': 'After'})
+    response = client_b.get(f'/todos/{todo_id}')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert response.json['title'] == 'After'
+    assert client_b.get('/todos').json[0]['title'] == 'After'
+    for app in (a, b):
+        with app.app_context():
+            db.engine.dispose()
+
+def test_cache_disabled(app, client):
+    app.extensions['todo_cache'].enabled = False
+    client.get('/todos')
+    response = client.get('/todos')
+    assert 'X-Cache' not in response.headers
+    assert client.get('/cache/stats').json['hits'] == 0
+
+def test_get_todo_by_id_etag(client):
+    todo_id = client.post('/todos', json={'title': 'Tagged'}).json['id']
+    response = client.get(f'/todos/{todo_id}')
+    etag = response.headers['ETag']
+    assert etag == f'"todo-{todo_id}-v1"'
+
+    response = client.get(f'/todos/{todo_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    update = client.put(f'/todos/{todo_id}', json={'completed': True})
+    assert update.headers['ETag'] == f'"todo-{todo_id}-v2"'
+    response = client.get(f'/todos/{todo_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json['completed'] == True
+
+def test_deleted_ids_are_not_reused(client):
+    client.post('/todos', json={'title': 'Kept'})
+    todo_id = client.post('/todos', json={'title': 'Deleted'}).json['id']
+    etag = client.get(f'/todos/{todo_id}').headers['ETag']
+    client.delete(f'/todos/{todo_id}')
+    new_id = client.post('/todos', json={'title': 'New'}).json['id']
+    assert new_id != todo_id
+    assert client.get(f'/todos/{new_id}').headers['ETag'] != etag
+
+def test_get_todo_by_id_etag_not_found(client):
+    response = client.get('/todos/9999', headers={'If-None-Match': '*'})
+    assert response.status_code == 404
+
+def test_get_todos_etag(client):
+    client.post('/todos', json={'title': 'Listed'})
+    response = client.get('/todos')
+    etag = response.headers['ETag']
+    response = client.get('/todos', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    # The ETag depends on the query as well as on the data
+    response = client.get('/todos?completed=true', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+
+    client.post('/todos/batch', json=[{'title': 'Another'}])
+    response = client.get('/todos', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert len(response.json) == 2
+    assert response.headers['ETag'] != etag
+
+def test_get_todo_changes(client):
+    response = client.get('/todos/changes')
+    assert response.status_code == 200
+    assert response.json == {'changes': [], 'since': 0, 'has_more': False}
+
+    first = client.post('/todos', json={'title': 'First'}).json['id']
+    second = client.post('/todos', json={'title': 'Second'}).json['id']
+    response = client.get('/todos/changes?since=0')
+    feed = response.json
+    assert [change['id'] for change in feed['changes']] == [first, second]
+    assert all(change['op'] == 'upsert' for change in feed['changes'])
+    assert feed['changes'][0]['item']['title'] == 'First'
+    since = feed['since']
+
+    client.put(f'/todos/{first}', json={'completed': True})
+    client.delete(f'/todos/{second}')
+    feed = client.get(f'/todos/changes?since={since}').json
+    assert [(change['op'], change['id']) for change in feed['changes']] == [
+        ('upsert', first), ('delete', second)
+    ]
+    assert feed['changes'][0]['item']['completed'] == True
+
+    feed = client.get(f"/todos/changes?since={feed['since']}").json
+    assert feed['changes'] == []
+
+def test_get_todo_changes_paged(client):
+    client.post('/todos/batch', json=[{'title': f'Batch {i}'} for i in range(3)])
+    client.post('/todos', json={'title': 'Single'})
+    client.post('/todos', json={'title': 'Last'})
+
+    # A page never splits the rows written by one transaction
+    feed = client.get('/todos/changes?limit=2').json
+    assert len(feed['changes']) == 3
+    assert feed['has_more'] == True
+
+    feed = client.get(f"/todos/changes?limit=1&since={feed['since']}").json
+    assert [change['item']['title'] for change in feed['changes']] == ['Single']
+    assert feed['has_more'] == True
+    feed = client.get(f"/todos/changes?limit=1&since={feed['since']}").json
+    assert [change['item']['title'] for change in feed['changes']] == ['Last']
+    assert feed['has_more'] == False
+
+def test_get_todo_changes_batch_delete(client):
+    ids = [
+        result['item']['id']
+        for result in client.post('/todos/batch', json=[{'title': 'A'}, {'title': 'B'}]).json
+    ]
+    since = client.get('/todos/changes').json['since']
+    client.delete('/todos/batch', json=ids)
+    feed = client.get(f'/todos/changes?since={since}').json
+    assert sorted(change['id'] for change in feed['changes']) == sorted(ids)
+    assert all(change['op'] == 'delete' for change in feed['changes'])
+
+def test_get_todo_changes_invalid_since(client):
+    assert client.get('/todos/changes?since=abc').status_code == 400
+    assert client.get('/todos/changes?since=-1').status_code == 400
+
+def test_todo_events_stream(app, client):
+    app.config['EVENTS_HEARTBEAT'] = 0.01
+    response = client.get('/todos/events', buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    stream = iter(response.response)
+
+    todo_id = client.post('/todos', json={'title': 'Pushed'}).json['id']
+    client.delete(f'/todos/{todo_id}')
+
+    messages = []
+    while len(messages) < 2:
+        message = next(stream)
+        message = message.decode() if isinstance(message, bytes) else message
+        if message.startswith('id:'):
+            messages.append(message)
+    created = json.loads(messages[0].split('data: ', 1)[1])
+    assert created['op'] == 'created'
+    assert created['item']['title'] == 'Pushed'
+    assert 'event: deleted' in messages[1]
+    response.close()
+    assert len(app.extensions['todo_events']) == 0
+
+def test_todo_events_streams_are_capped():
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'EVENTS_MAX_STREAMS': 1})
+    client = app.test_client()
+    first = client.get('/todos/events', buffered=False)
+    assert first.status_code == 200
+    refused = client.get('/todos/events', buffered=False)
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After'] == '15'
+    first.close()
+    # Closing a stream frees its slot
+    second = client.get('/todos/events', buffered=False)
+    assert second.status_code == 200
+    second.close()
+
+def test_json_provider_is_configurable():
+    from flask.json.provider import DefaultJSONProvider
+    from app.json_provider import OrjsonProvider
+    pytest.importorskip('orjson')
+    assert isinstance(create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'}).json, OrjsonProvider)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'JSON_PROVIDER': 'stdlib'})
+    assert type(app.json) is DefaultJSONProvider
+
+def test_orjson_provider_matches_stdlib(app):
+    pytest.importorskip('orjson')
+    from flask.json.provider import DefaultJSONProvider
+    data = {'b': [1, 2.5, None, True], 'a': 'x', 'c': 'é'}
+    assert json.loads(app.json.dumps(data)) == json.loads(DefaultJSONProvider(app).dumps(data))
+    assert app.json.loads(b'{"a": [1]}') == {'a': [1]}
+    with app.test_request_context():
+        response = app.json.response(data)
+    assert response.mimetype == 'application/json'
+    assert json.loads(response.data) == data
+
+def test_get_todos_serializes_projected_columns(client, populate_todos):
+    todos = client.get('/todos').json
+    assert set(todos[0]) == {'id', 'title', 'completed', 'description', 'priority'}
+    assert todos[1]['completed'] is True
+
+def test_search_todos(client, populate_todos):
+    client.put('/todos/3', json={'title': 'Buy milk'})
+    response = client.get('/todos/search?q=todo')
+    assert response.status_code == 200
+    assert sorted(todo['id'] for todo in response.json) == [1, 2, 4, 5, 6, 7, 8]
+    assert set(response.json[0]) == {'id', 'title', 'completed', 'description', 'priority'}
+
+    assert [todo['id'] for todo in client.get('/todos/search?q=mil').json] == [3]
+    assert [todo['id'] for todo in client.get('/todos/search?q=fourth').json] == [4]
+    assert client.get('/todos/search?q=nothing').json == []
+
+def test_search_todos_ranks_title_matches_first(client):
+    client.post('/todos', json={'title': 'Errands', 'description': 'groceries'})
+    client.post('/todos', json={'title': 'Groceries'})
+    assert [todo['title'] for todo in client.get('/todos/search?q=groceries').json] == ['Groceries', 'Errands']
+
+def test_search_todos_follows_writes(client):
+    todo_id = client.post('/todos', json={'title': 'Paint fence'}).json['id']
+    client.put(f'/todos/{todo_id}', json={'title': 'Paint shed'})
+    assert client.get('/todos/search?q=fence').json == []
+    assert [todo['id'] for todo in client.get('/todos/search?q=shed').json] == [todo_id]
+    client.delete(f'/todos/{todo_id}')
+    assert client.get('/todos/search?q=shed').json == []
+
+def test_search_todos_paginated_and_filtered(client, populate_todos):
+    seen = []
+    url = '/todos/search?q=todo&limit=3'
+    while url:
+        response = client.get(url)
+        seen.extend(todo['id'] for todo in response.json)
+        url = response.headers.get('Link', '').partition('>')[0].lstrip('<') or None
+    assert sorted(seen) == list(range(1, 9))
+
+    response = client.get('/todos/search?q=todo&completed=true')
+    assert sorted(todo['id'] for todo in response.json) == [2, 5, 8]
+
+def test_search_todos_fields(client, populate_todos):
+    seen = []
+    url = '/todos/search?q=todo&limit=3&fields=title'
+    while url:
+        response = client.get(url)
+        assert all(set(todo) == {'title'} for todo in response.json)
+        seen.extend(todo['title'] for todo in response.json)
+        url = response.headers.get('Link', '').partition('>')[0].lstrip('<') or None
+    assert len(seen) == 8
+
+def test_search_todos_etag(client, populate_todos):
+    etag = client.get('/todos/search?q=todo').headers['ETag']
+    assert client.get('/todos/search?q=todo', headers={'If-None-Match': etag}).status_code == 304
+    client.post('/todos', json={'title': 'Another todo'})
+    assert client.get('/todos/search?q=todo', headers={'If-None-Match': etag}).status_code == 200
+
+def test_search_and_list_etags_differ(client, populate_todos):
+    listed = client.get('/todos?q=fourth')
+    response = client.get('/todos/search?q=fourth', headers={'If-None-Match': listed.headers['ETag']})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != listed.headers['ETag']
+    assert len(response.json) < len(listed.json)
+
+def test_search_todos_invalid(client):
+    response = client.get('/todos/search')
+    assert response.status_code == 400
+    assert response.json == {'error': 'Search query q is required'}
+    assert client.get('/todos/search?q=%22%29%28*').status_code == 400
+    # FTS5 syntax in the query is treated as plain words
+    assert client.get('/todos/search?q=title:x OR "').status_code == 200
+    assert client.get('/todos/search?q=x&after=bad').status_code == 400
+
+def test_lists_are_isolated(client):
+    todo_id = client.post('/lists/2/todos', json={'title': 'Second list'}).json['id']
+    client.post('/todos', json={'title': 'Default list'})
+    assert [todo['title'] for todo in client.get('/lists/2/todos').json] == ['Second list']
+    assert [todo['title'] for todo in client.get('/todos').json] == ['Default list']
+    assert [todo['title'] for todo in client.get('/lists/1/todos').json] == ['Default list']
+    assert client.get('/lists/3/todos').json == []
+
+    assert client.get(f'/lists/2/todos/{todo_id}').json['title'] == 'Second list'
+    assert client.get(f'/todos/{todo_id}').status_code == 404
+    assert client.put(f'/lists/3/todos/{todo_id}', json={'title': 'Moved'}).status_code == 404
+    assert client.delete(f'/todos/{todo_id}').status_code == 404
+    assert client.get('/lists/2/todos/search?q=list').json[0]['id'] == todo_id
+    assert client.get('/todos/search?q=second').json == []
+
+def test_lists_have_their_own_versions_and_change_feeds(client):
+    client.post('/todos', json={'title': 'Default list'})
+    etag = client.get('/lists/2/todos').headers['ETag']
+    client.post('/todos', json={'title': 'Also default'})
+    assert client.get('/lists/2/todos', headers={'If-None-Match': etag}).status_code == 304
+
+    todo_id = client.post('/lists/2/todos', json={'title': 'Second list'}).json['id']
+    client.delete(f'/lists/2/todos/{todo_id}')
+    feed = client.get('/lists/2/todos/changes').json
+    assert [(change['op'], change['id']) for change in feed['changes']] == [('delete', todo_id)]
+    assert feed['since'] == 2
+    assert [change['op'] for change in client.get('/todos/changes').json['changes']] == ['upsert', 'upsert']
+
+def test_lists_at_the_same_version_have_distinct_etags(client):
+    for list_id in (1, 2):
+        client.post(f'/lists/{list_id}/todos/batch', json=[
+            {'title': f'List {list_id} item {i}', 'description': 'x' * 300} for i in range(5)
+        ])
+    responses = [client.get(f'/lists/{list_id}/todos', headers={'Accept-Encoding': 'gzip'}) for list_id in (1, 2)]
+    assert responses[0].headers['ETag'] != responses[1].headers['ETag']
+    for list_id, response in zip((1, 2), responses):
+        assert response.headers['Content-Encoding'] == 'gzip'
+        titles = {todo['title'] for todo in json.loads(gzip.decompress(response.data))}
+        assert titles == {f'List {list_id} item {i}' for i in range(5)}
+
+def test_list_batch_endpoints_are_scoped(client):
+    other = client.post('/todos', json={'title': 'Default list'}).json['id']
+    response = client.post('/lists/2/todos/batch', json=[{'title': 'A'}, {'title': 'B'}])
+    ids = [result['item']['id'] for result in response.json]
+    assert [todo['id'] for todo in client.get('/lists/2/todos').json] == ids
+
+    response = client.patch('/lists/2/todos/batch', json=[{'id': ids[0], 'completed': True}, {'id': other, 'completed': True}])
+    assert [result['status'] for result in response.json] == [200, 404]
+    response = client.delete('/lists/2/todos/batch', json=[ids[1], other])
+    assert [result['status'] for result in response.json] == [200, 404]
+    assert client.get(f'/todos/{other}').json['completed'] is False
+
+    lines = client.get('/lists/2/todos/export').get_data(as_text=True).splitlines()
+    assert [json.loads(line)['id'] for line in lines] == [ids[0]]
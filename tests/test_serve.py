@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+pytest.importorskip('gunicorn')
+
+from app import create_app, db  # noqa: E402
+from app.events import Broker  # noqa: E402
+from app.models import ToDo  # noqa: E402
+from app.serve import Server, after_fork, default_options, main, per_process_state  # noqa: E402
+
+
+class ForkAwareBroker(Broker):
+    def __init__(self):
+        self.forked = 0
+
+    def after_fork(self):
+        self.forked += 1
+
+
+def test_default_options_scale_with_cores():
+    options = default_options(cores=4)
+    assert options['workers'] == 5
+    assert options['worker_class'] == 'gthread'
+    assert options['preload_app']
+    assert default_options(cores=1)['workers'] == 2
+    # Threads for requests plus threads reserved for event streams
+    assert default_options(cores=1, threads=4, event_streams=16)['threads'] == 20
+
+def test_server_applies_options():
+    server = Server(lambda: None, {'workers': 3, 'threads': 2, 'keepalive': 7, 'worker_tmp_dir': None})
+    assert server.cfg.workers == 3
+    assert server.cfg.threads == 2
+    assert server.cfg.keepalive == 7
+
+def test_main_passes_options(monkeypatch):
+    servers = []
+    monkeypatch.setattr(Server, 'run', lambda self: servers.append(self))
+    main(['--workers', '2', '--threads', '2', '--event-streams', '3', '--keepalive', '30',
+          '--max-requests', '500', '--lean', '--database-uri', 'sqlite:///:memory:'])
+    server, = servers
+    assert server.cfg.workers == 2
+    assert server.cfg.threads == 5
+    assert server.cfg.keepalive == 30
+    assert server.cfg.max_requests_jitter == 50
+    app = server.load()
+    assert app.config['LEAN_STARTUP']
+    assert app.config['DATABASE_PROFILE'] == 'production'
+    assert app.config['EVENTS_MAX_STREAMS'] == 3
+    # Several workers share idempotency keys through the database
+    assert app.config['IDEMPOTENCY_STORE'] == 'sqlite'
+
+def test_single_worker_keeps_memory_idempotency(monkeypatch):
+    servers = []
+    monkeypatch.setattr(Server, 'run', lambda self: servers.append(self))
+    main(['--workers', '1', '--lean', '--database-uri', 'sqlite:///:memory:'])
+    assert servers[0].load().config['IDEMPOTENCY_STORE'] == 'memory'
+
+def test_per_process_state_is_logged(caplog):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'RATELIMIT_ENABLED': True})
+    assert [setting for setting, _ in per_process_state(app)] == [
+        'EVENTS_BROKER', 'CACHE_BACKEND', 'RATELIMIT_BACKEND', 'IDEMPOTENCY_STORE',
+    ]
+    with caplog.at_level('WARNING', logger='app.serve'):
+        Server(lambda: app, {'workers': 2, 'worker_tmp_dir': None}).load()
+    assert 'EVENTS_BROKER is per worker process' in caplog.text
+    caplog.clear()
+    with caplog.at_level('WARNING', logger='app.serve'):
+        Server(lambda: app, {'workers': 1, 'worker_tmp_dir': None}).load()
+    assert caplog.text == ''
+
+def test_worker_uses_own_connections_after_fork(tmp_path):
+    broker = ForkAwareBroker()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/fork.db', 'EVENTS_BROKER': broker})
+    with app.app_context():
+        db.create_all()
+        db.session.add(ToDo(title='Before fork'))
+        db.session.commit()
+        db.session.remove()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            after_fork(app)
+            with app.app_context():
+                if db.session.query(ToDo).count() == 1 and broker.forked == 1:
+                    status = 0
+        finally:
+            os._exit(status)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    # The parent's pooled connection still works
+    with app.app_context():
+        assert db.session.query(ToDo).count() == 1
+        db.engine.dispose()
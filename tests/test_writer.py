@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import func, select
+
+from app import create_app, db
+from app.models import CollectionVersion, ToDo
+from app.routes import Changes, run_write
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/todo.db',
+        'WRITE_GROUP_COMMIT': True,
+        'WRITE_BATCH_DELAY': 0.05,
+    })
+    with app.app_context():
+        db.create_all()
+    yield app
+    app.extensions['todo_writer'].stop()
+    with app.app_context():
+        db.engine.dispose()
+
+
+def test_routes_write_through_the_writer(app):
+    client = app.test_client()
+    todo_id = client.post('/todos', json={'title': 'Queued'}).json['id']
+    response = client.put(f'/todos/{todo_id}', json={'completed': True})
+    assert response.json['completed'] is True
+    assert response.headers['ETag'] == f'"todo-{todo_id}-v2"'
+    assert client.put('/todos/999', json={'completed': True}).status_code == 404
+    assert client.delete(f'/todos/{todo_id}').status_code == 200
+    assert client.delete(f'/todos/{todo_id}').status_code == 404
+    changes = client.get('/todos/changes').json['changes']
+    assert [(change['op'], change['id']) for change in changes] == [('delete', todo_id)]
+    assert app.extensions['todo_writer'].writes == 5
+
+def test_concurrent_writes_are_grouped(app):
+    client = app.test_client()
+    barrier = threading.Barrier(8)
+    statuses = []
+
+    def create(i):
+        barrier.wait()
+        statuses.append(client.post('/todos', json={'title': f'Burst {i}'}).status_code)
+
+    threads = [threading.Thread(target=create, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert statuses == [201] * 8
+    writer = app.extensions['todo_writer']
+    assert writer.writes == 8
+    assert writer.batches < 8
+    with app.app_context():
+        assert db.session.scalar(select(func.count()).select_from(ToDo)) == 8
+        # Each write still gets its own change sequence
+        assert CollectionVersion.current(db.session) == 8
+
+def test_failed_write_does_not_affect_its_batch(app):
+    writer = app.extensions['todo_writer']
+
+    def good(session):
+        todo = ToDo(title='Kept')
+        session.add(todo)
+        session.flush()
+        return todo.id, Changes(1, created=[todo.id])
+
+    def bad(session):
+        session.add(ToDo(title='Rolled back'))
+        session.flush()
+        raise RuntimeError('boom')
+
+    futures = [writer.submit(good), writer.submit(bad), writer.submit(good)]
+    assert isinstance(futures[0].result(5), int)
+    with pytest.raises(RuntimeError):
+        futures[1].result(5)
+    assert isinstance(futures[2].result(5), int)
+    with app.app_context():
+        titles = db.session.scalars(select(ToDo.title)).all()
+    assert titles == ['Kept', 'Kept']
+    assert writer.batches == 1
+
+def test_timed_out_write_is_not_committed(app):
+    app.config['WRITE_TIMEOUT'] = 0.05
+    writer = app.extensions['todo_writer']
+    client = app.test_client()
+    blocked = threading.Event()
+    writer.submit(lambda session: blocked.wait(5) and (None, None))  # keeps the writer busy
+    headers = {'Idempotency-Key': 'k1'}
+    assert client.post('/todos', json={'title': 'Retried'}, headers=headers).status_code == 503
+    blocked.set()
+    app.config['WRITE_TIMEOUT'] = 30
+    assert client.post('/todos', json={'title': 'Retried'}, headers=headers).status_code == 201
+    with app.app_context():
+        titles = db.session.scalars(select(ToDo.title)).all()
+    assert titles == ['Retried']
+
+def test_started_write_outlives_timeout(app):
+    app.config['WRITE_TIMEOUT'] = 0.1
+    with app.test_request_context():
+        # Picked up after WRITE_BATCH_DELAY (0.05 s), still running at the timeout
+        assert run_write(lambda session: (time.sleep(0.3) or 'done', None)) == 'done'